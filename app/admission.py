@@ -0,0 +1,123 @@
+"""
+Admission control for OpenAI calls: one token bucket for the whole cluster.
+
+OpenAI limits requests and tokens per minute per organisation, so a burst of
+jobs across several workers used to run straight into 429s and spend its
+retry attempts on them. Every generation attempt now takes one request and
+an estimate of its tokens from a shared bucket in Redis (`admission` hash),
+refilled continuously at OPENAI_RPM / OPENAI_TPM and holding at most
+ADMISSION_BURST_SECONDS of either. When the bucket is short the attempt waits
+instead of calling OpenAI. Once the response is in, settle() corrects the
+estimate with the tokens OpenAI reported, so the bucket tracks real usage and
+can go into debt after an expensive response.
+
+The async worker also stops pulling jobs while the bucket is in debt, so the
+next job to start is picked from the lanes (see scheduler.py) when capacity is
+back, not when the job was popped.
+"""
+import logging
+import os
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "1") == "1"
+OPENAI_RPM = float(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = float(os.getenv("OPENAI_TPM", "200000"))
+ADMISSION_BURST_SECONDS = float(os.getenv("ADMISSION_BURST_SECONDS", "10"))
+# Token estimate for an attempt: prompt and tool schema, plus output per question asked for
+ADMISSION_PROMPT_TOKENS = int(os.getenv("ADMISSION_PROMPT_TOKENS", "1500"))
+ADMISSION_TOKENS_PER_QUESTION = int(os.getenv("ADMISSION_TOKENS_PER_QUESTION", "300"))
+ADMISSION_KEY = "admission"
+# Longest single wait handed back, so callers re-check a bucket other processes refund
+MAX_ADMISSION_WAIT = 5.0
+
+
+class AdmissionController:
+    def __init__(self, redis_conn, rpm: float = OPENAI_RPM, tpm: float = OPENAI_TPM,
+                 burst_seconds: float = ADMISSION_BURST_SECONDS, enabled: bool = ADMISSION_CONTROL):
+        self.redis_conn = redis_conn
+        self.request_rate = rpm / 60
+        self.token_rate = tpm / 60
+        self.request_capacity = max(1.0, self.request_rate * burst_seconds)
+        self.token_capacity = self.token_rate * burst_seconds
+        self.enabled = enabled
+
+    def estimate(self, questions: int) -> int:
+        return ADMISSION_PROMPT_TOKENS + ADMISSION_TOKENS_PER_QUESTION * questions
+
+    def _available(self, state: list, now: float) -> tuple:
+        """Requests and tokens in the bucket at `now`, from its stored (requests, tokens, at)."""
+        elapsed = max(0.0, now - float(state[2])) if state[2] is not None else 0.0
+        available_requests = min(
+            self.request_capacity,
+            (float(state[0]) if state[0] is not None else self.request_capacity) + elapsed * self.request_rate,
+        )
+        available_tokens = min(
+            self.token_capacity,
+            (float(state[1]) if state[1] is not None else self.token_capacity) + elapsed * self.token_rate,
+        )
+        return available_requests, available_tokens
+
+    def _wait(self, available_requests: float, available_tokens: float, requests: float, tokens: float) -> float:
+        # An estimate above the bucket size still gets through once the bucket is full
+        needed_tokens = min(tokens, self.token_capacity)
+        wait = 0.0
+        if available_requests < requests:
+            wait = (requests - available_requests) / self.request_rate
+        if available_tokens < needed_tokens:
+            wait = max(wait, (needed_tokens - available_tokens) / self.token_rate)
+        return wait
+
+    def _take(self, requests: float, tokens: float, force: bool) -> float:
+        """Refill, then take from the bucket; returns 0, or the seconds to wait before trying again."""
+        with self.redis_conn.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(ADMISSION_KEY)
+                    seconds, microseconds = pipe.time()
+                    now = seconds + microseconds / 1e6
+                    available_requests, available_tokens = self._available(
+                        pipe.hmget(ADMISSION_KEY, "requests", "tokens", "at"), now
+                    )
+                    wait = 0.0 if force else self._wait(available_requests, available_tokens, requests, tokens)
+                    if wait == 0.0:
+                        available_requests -= requests
+                        available_tokens -= tokens
+                    pipe.multi()
+                    pipe.hset(ADMISSION_KEY, mapping={
+                        "requests": available_requests, "tokens": available_tokens, "at": now,
+                    })
+                    pipe.expire(ADMISSION_KEY, 3600)
+                    pipe.execute()
+                    return min(wait, MAX_ADMISSION_WAIT)
+                except redis.WatchError:
+                    continue
+
+    def try_acquire(self, tokens: int, requests: int = 1) -> float:
+        """Take one request and `tokens` if the bucket has them; otherwise the seconds to wait."""
+        if not self.enabled:
+            return 0.0
+        return self._take(requests, tokens, False)
+
+    def settle(self, estimated: int, actual: int):
+        """Replace an attempt's token estimate with what it really used."""
+        if self.enabled and actual != estimated:
+            self._take(0, actual - estimated, True)
+
+    def backlog(self) -> float:
+        """Seconds until the bucket is out of debt; 0 when a job could start now."""
+        if not self.enabled:
+            return 0.0
+        # Read only; every worker polls this between jobs
+        pipe = self.redis_conn.pipeline(transaction=False)
+        pipe.time()
+        pipe.hmget(ADMISSION_KEY, "requests", "tokens", "at")
+        (seconds, microseconds), state = pipe.execute()
+        available_requests, available_tokens = self._available(state, seconds + microseconds / 1e6)
+        return min(self._wait(available_requests, available_tokens, 0, 0), MAX_ADMISSION_WAIT)
+
+    def stats(self) -> dict:
+        state = self.redis_conn.hgetall(ADMISSION_KEY)
+        return {key.decode("utf-8"): float(value) for key, value in state.items()}
@@ -0,0 +1,122 @@
+"""
+In-process registry of `ai_assistants` (technology -> assistant document).
+
+The collection is loaded once and served from memory. A background thread
+reloads it every ASSISTANT_REGISTRY_TTL seconds, and immediately when an
+invalidation message arrives on the Redis channel, so request handlers never
+scan the collection themselves. After an admin edits `ai_assistants`:
+
+    python assistant_registry.py --invalidate
+
+Set ASSISTANT_REGISTRY_CHANGE_STREAM=1 to also follow a Mongo change stream
+(requires a replica set) instead of relying on the pub/sub message.
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+ASSISTANT_REGISTRY_TTL = int(os.getenv("ASSISTANT_REGISTRY_TTL", "300"))
+ASSISTANT_REGISTRY_CHANGE_STREAM = os.getenv("ASSISTANT_REGISTRY_CHANGE_STREAM", "0") == "1"
+INVALIDATION_CHANNEL = "ai_assistants:invalidate"
+
+
+class AssistantRegistry:
+    def __init__(self, db, redis_conn=None, ttl: int = ASSISTANT_REGISTRY_TTL):
+        self.db = db
+        self.redis_conn = redis_conn
+        self.ttl = ttl
+        self._assistants = None
+        self._lock = threading.Lock()
+        self._reload = threading.Event()
+        self._refresher = None
+
+    def start(self):
+        """Start the background refresher and invalidation listeners."""
+        if self._refresher is not None and self._refresher.is_alive():
+            return self
+        self._refresher = threading.Thread(target=self._refresh_loop, name="assistant-registry", daemon=True)
+        self._refresher.start()
+        if self.redis_conn is not None:
+            threading.Thread(target=self._listen_pubsub, name="assistant-registry-pubsub", daemon=True).start()
+        if ASSISTANT_REGISTRY_CHANGE_STREAM:
+            threading.Thread(target=self._listen_change_stream, name="assistant-registry-watch", daemon=True).start()
+        return self
+
+    def _load(self):
+        assistants = {doc["technology"]: doc for doc in self.db["ai_assistants"].find({}, {"_id": 0})}
+        with self._lock:
+            self._assistants = assistants
+        logger.info(f"Loaded {len(assistants)} assistants")
+
+    def _current(self) -> dict:
+        # Loaded on first use; the refresher keeps it current after that
+        if self._assistants is None:
+            self._load()
+        return self._assistants
+
+    def _refresh_loop(self):
+        while True:
+            self._reload.wait(self.ttl)
+            self._reload.clear()
+            try:
+                self._load()
+            except Exception as e:
+                logger.error(f"Error reloading assistants: {e}")
+
+    def _listen_pubsub(self):
+        while True:
+            try:
+                pubsub = self.redis_conn.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                for _ in pubsub.listen():
+                    self.invalidate()
+            except Exception as e:
+                logger.error(f"Assistant invalidation listener failed, retrying: {e}")
+                time.sleep(5)
+
+    def _listen_change_stream(self):
+        while True:
+            try:
+                with self.db["ai_assistants"].watch() as stream:
+                    for _ in stream:
+                        self.invalidate()
+            except Exception as e:
+                logger.error(f"Assistant change stream failed, retrying: {e}")
+                time.sleep(5)
+
+    def invalidate(self):
+        self._reload.set()
+        if self._refresher is None or not self._refresher.is_alive():
+            self._assistants = None
+
+    def technologies(self) -> set:
+        return set(self._current())
+
+    def get(self, technology: str):
+        return self._current().get(technology)
+
+    def assistant_id(self, technology: str) -> str:
+        doc = self.get(technology)
+        if not doc or "assistant_id" not in doc:
+            logger.error(f"No assistant ID found for technology: {technology}")
+            raise ValueError("Assistant ID not found in database.")
+        return doc["assistant_id"]
+
+
+def publish_invalidation(redis_conn):
+    redis_conn.publish(INVALIDATION_CHANNEL, "reload")
+
+
+if __name__ == "__main__":
+    from db_manager import get_redis_connection
+
+    parser = argparse.ArgumentParser(description="Assistant registry maintenance.")
+    parser.add_argument("--invalidate", action="store_true", help="tell every process to reload ai_assistants")
+    args = parser.parse_args()
+    if args.invalidate:
+        publish_invalidation(get_redis_connection())
+        print("Invalidation published.")
@@ -0,0 +1,243 @@
+"""
+Asyncio worker that runs many generation jobs concurrently in one process.
+
+Pulls jobs from the scheduler's lanes (see scheduler.py), highest priority
+first, but instead of forking per job it awaits each job's coroutine on a
+single event loop, with at most WORKER_CONCURRENCY jobs in flight. Generation
+jobs spend nearly all their time waiting on OpenAI, so one process can keep
+dozens of them moving. While the shared OpenAI budget (admission.py) is in
+debt it pulls nothing, so the job that starts when capacity returns is the
+highest priority one waiting at that point. WORKER_INTERACTIVE_RESERVE of
+the slots only ever take interactive jobs, which bounds how long one waits
+for a slot when bulk and refill work would otherwise fill them all.
+
+The process outlives its jobs, so worker.warm_up() runs once at startup and
+the question banks, TF-IDF models and OpenAI connection pool stay warm for
+every job after it. A job that raises is marked failed and the worker carries
+on; worker.py drops any cached bank the failure may have left inconsistent.
+A coroutine job that outlives its rq timeout is cancelled and failed the same
+way.
+
+Every job the worker pops is claimed in the scheduler's `sched:started` set
+and its lease renewed every JOB_LEASE_SECONDS / 3 while it runs. Workers also
+reap expired leases, i.e. jobs of a worker that was killed: such a job goes
+back to the head of its lane up to WORKER_MAX_RECOVERIES times, after which
+it is failed and its failure callback (jobs.generation_failed) run.
+
+With --burst the worker stops once its lanes are empty and the jobs it has
+in flight have finished, as `rq worker --burst` does.
+
+    python async_worker.py --concurrency 20 interactive bulk refill
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+import sys
+import traceback
+from datetime import datetime, timezone
+
+from rq import Queue
+from rq.exceptions import DequeueTimeout, NoSuchJobError
+from rq.job import Job, JobStatus
+
+import scheduler
+from admission import AdmissionController
+from db_manager import get_redis_connection, run_blocking
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "20"))
+# Seconds a dequeue blocks on Redis before checking for shutdown
+DEQUEUE_TIMEOUT = int(os.getenv("WORKER_DEQUEUE_TIMEOUT", "5"))
+# Seconds a burst worker waits on empty lanes before it stops
+BURST_DEQUEUE_TIMEOUT = 0.1
+FAILED_JOB_TTL = int(os.getenv("WORKER_FAILED_JOB_TTL", str(7 * 24 * 3600)))
+# Share of the slots kept free of bulk and refill jobs
+WORKER_INTERACTIVE_RESERVE = float(os.getenv("WORKER_INTERACTIVE_RESERVE", "0.25"))
+# Times a job whose worker died is run again before it is failed
+WORKER_MAX_RECOVERIES = int(os.getenv("WORKER_MAX_RECOVERIES", "1"))
+
+
+# Queue names workers used to be started with
+LANE_ALIASES = {"default": "interactive"}
+
+
+class AsyncWorker:
+    def __init__(self, lanes: list, connection, concurrency: int = WORKER_CONCURRENCY):
+        self.connection = connection
+        self.lanes = [LANE_ALIASES.get(lane, lane) for lane in lanes]
+        unknown = set(self.lanes) - set(scheduler.LANES)
+        if unknown:
+            raise ValueError(f"Unknown lanes {sorted(unknown)}; expected some of {list(scheduler.LANES)}")
+        self.lanes.sort(key=scheduler.LANES.index)
+        # Jobs pushed onto the plain rq lists, e.g. before the lanes existed
+        self.queues = [Queue(scheduler.LANE_QUEUES[lane], connection=connection) for lane in self.lanes]
+        self.admission = AdmissionController(connection)
+        self.concurrency = concurrency
+        self.reserved = int(concurrency * WORKER_INTERACTIVE_RESERVE) if "interactive" in self.lanes else 0
+        self._background = 0
+        self.name = f"async-{socket.gethostname()}-{os.getpid()}"
+        self._slots = None
+        self._stopping = False
+        self._tasks = set()
+        self._running = {}
+
+    def stop(self):
+        if not self._stopping:
+            logger.info(f"Worker {self.name} stopping after {len(self._tasks)} in-flight jobs")
+        self._stopping = True
+
+    def _open_lanes(self) -> list:
+        if self._background < self.concurrency - self.reserved:
+            return self.lanes
+        return ["interactive"]
+
+    def _dequeue(self, lanes: list, timeout: float = DEQUEUE_TIMEOUT):
+        queues = [queue for queue in self.queues if scheduler.QUEUE_LANES.get(queue.name) in lanes]
+        try:
+            result = Queue.dequeue_any(queues, None, connection=self.connection)
+        except DequeueTimeout:
+            result = None
+        job = result[0] if result else scheduler.next_job(self.connection, lanes, timeout)
+        if job is not None:
+            # Out of its lane now, so claim it before anything else can go wrong
+            scheduler.claim(self.connection, [job.id])
+        return job
+
+    def _mark(self, job, status: str, exc_string: str = None):
+        job.set_status(status)
+        if status == JobStatus.FAILED:
+            job.ended_at = datetime.now(timezone.utc)
+            Queue(job.origin, connection=self.connection).failed_job_registry.add(
+                job, ttl=FAILED_JOB_TTL, exc_string=exc_string
+            )
+
+    def _fail(self, job, exc_info, exc_string: str):
+        self._mark(job, JobStatus.FAILED, exc_string)
+        if job.failure_callback is not None:
+            job.failure_callback(job, self.connection, *exc_info)
+
+    async def _perform(self, job, background: bool):
+        logger.info(f"{self.name} started job {job.id} ({job.func_name})")
+        self._running[job.id] = job
+        try:
+            await run_blocking(self._mark, job, JobStatus.STARTED)
+            result = job.func(*job.args, **job.kwargs)
+            if asyncio.iscoroutine(result):
+                # rq's -1 means no timeout
+                await asyncio.wait_for(result, job.timeout if job.timeout and job.timeout > 0 else None)
+            await run_blocking(self._mark, job, JobStatus.FINISHED)
+            logger.info(f"{self.name} finished job {job.id}")
+        except Exception:
+            exc_info = sys.exc_info()
+            exc_string = traceback.format_exc()
+            logger.error(f"{self.name} job {job.id} failed:\n{exc_string}")
+            try:
+                await run_blocking(self._fail, job, exc_info, exc_string)
+            except Exception as e:
+                logger.error(f"Unable to record failure of job {job.id}: {e}")
+        finally:
+            self._running.pop(job.id, None)
+            try:
+                await run_blocking(scheduler.finish, self.connection, job.id)
+            except Exception as e:
+                logger.error(f"Unable to release the lease of job {job.id}: {e}")
+            self._background -= background
+            self._slots.release()
+
+    def _reap(self):
+        for job_id in scheduler.expired(self.connection):
+            try:
+                job = Job.fetch(job_id, connection=self.connection)
+            except NoSuchJobError:
+                scheduler.recover(self.connection, job_id)
+                continue
+            recoveries = job.meta.get("recoveries", 0)
+            if recoveries < WORKER_MAX_RECOVERIES:
+                if scheduler.recover(self.connection, job_id, scheduler.QUEUE_LANES.get(job.origin, "interactive")):
+                    job.meta["recoveries"] = recoveries + 1
+                    job.save_meta()
+                    job.set_status(JobStatus.QUEUED)
+                    logger.warning(f"{self.name} requeued job {job_id}; its worker stopped renewing it")
+            elif scheduler.recover(self.connection, job_id):
+                message = f"Job {job_id} was lost with its worker {recoveries + 1} times"
+                logger.error(message)
+                self._fail(job, (RuntimeError, RuntimeError(message), None), message)
+
+    async def _heartbeat(self):
+        # Renews the leases of running jobs and takes over the jobs of dead workers
+        while True:
+            try:
+                await run_blocking(scheduler.claim, self.connection, list(self._running), True)
+                await run_blocking(self._reap)
+            except Exception as e:
+                logger.error(f"Error renewing job leases: {e}")
+            await asyncio.sleep(max(scheduler.JOB_LEASE_SECONDS / 3, 1))
+
+    async def run(self, burst: bool = False):
+        """Run jobs until stop(); with `burst`, until the lanes are empty and every job has finished."""
+        self._slots = asyncio.Semaphore(self.concurrency)
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stop)
+        logger.info(f"Worker {self.name} listening on {', '.join(self.lanes)} "
+                    f"with concurrency {self.concurrency}")
+        heartbeat = asyncio.create_task(self._heartbeat())
+        while not self._stopping:
+            await self._slots.acquire()
+            try:
+                backlog = await run_blocking(self.admission.backlog)
+            except Exception as e:
+                logger.error(f"Error checking the OpenAI budget: {e}")
+                backlog = 0
+            if backlog:
+                self._slots.release()
+                await asyncio.sleep(backlog)
+                continue
+            try:
+                lanes = self._open_lanes()
+                job = await run_blocking(self._dequeue, lanes, BURST_DEQUEUE_TIMEOUT if burst else DEQUEUE_TIMEOUT)
+            except Exception as e:
+                logger.error(f"Error dequeuing job: {e}")
+                job = None
+                await asyncio.sleep(1)
+            if job is None:
+                self._slots.release()
+                if burst and lanes == self.lanes:
+                    # Nothing left to start; finish the jobs in flight and return
+                    self.stop()
+                continue
+            # Counted before the task runs, so the next dequeue already sees it
+            background = scheduler.QUEUE_LANES.get(job.origin) != "interactive"
+            self._background += background
+            task = asyncio.create_task(self._perform(job, background))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        heartbeat.cancel()
+        logger.info(f"Worker {self.name} stopped")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run generation jobs concurrently on one event loop.")
+    parser.add_argument("lanes", nargs="*", default=list(scheduler.LANES))
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY)
+    parser.add_argument("--no-warm", action="store_true",
+                        help="keep no question banks in memory; every job reads its bank from Mongo")
+    parser.add_argument("--burst", action="store_true", help="stop once the lanes are empty")
+    args = parser.parse_args()
+
+    if not args.no_warm:
+        import worker
+
+        worker.warm_up()
+
+    redis_conn = get_redis_connection()
+    if redis_conn is None:
+        raise SystemExit("Failed to connect to Redis.")
+    asyncio.run(AsyncWorker(args.lanes, redis_conn, args.concurrency).run(burst=args.burst))
@@ -0,0 +1,73 @@
+"""
+Backfill dedup fields on existing generated_questions documents.
+
+Stores the normalized question text, MinHash signature and LSH
+band keys that FindDuplicatesBatch writes for new questions. Documents not yet
+indexed for the configured engine and layout are processed in `_id` order and
+drop out of the query once written, so the command can be interrupted and
+simply run again. Signatures and band keys of other engines are kept, which
+is how the bank is migrated between MinHash engines: backfill with the new
+engine while workers still run the old one, then switch MINHASH_ENGINE.
+
+    python backfill.py --engine numpy --batch-size 500
+"""
+import argparse
+import logging
+
+from pymongo import UpdateOne
+
+from db_manager import get_mongo_connection
+from lsh_index import LSHIndex, ensure_indexes
+from tfidf_minhash import MINHASH_ENGINE, MINHASH_ENGINES, get_minhash, preprocess_question
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def backfill_questions(db, minhash, lsh: LSHIndex, batch_size: int = 500) -> int:
+    collection = db["generated_questions"]
+    query = {"$or": [
+        {f"signatures.{minhash.name}": {"$exists": False}},
+        {"lsh_layouts": {"$ne": lsh.layout}},
+    ]}
+    last_id = None
+    updated = 0
+    while True:
+        batch_query = dict(query, **({"_id": {"$gt": last_id}} if last_id is not None else {}))
+        batch = list(collection.find(batch_query, {"question.question": 1}).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+        normalized = [preprocess_question(doc["question"]["question"]) for doc in batch]
+        shingles = [set(text.split()) for text in normalized]
+        signatures = minhash.get_signatures(shingles)
+        operations = []
+        for doc, text, signature in zip(batch, normalized, signatures):
+            operations.append(UpdateOne({"_id": doc["_id"]}, {
+                "$set": {
+                    "normalized_question": text,
+                    f"signatures.{minhash.name}": minhash.serialize_signature(signature),
+                },
+                "$addToSet": {
+                    "lsh_bands": {"$each": lsh.band_keys(signature)},
+                    "lsh_layouts": lsh.layout,
+                },
+            }))
+        collection.bulk_write(operations, ordered=False)
+        updated += len(operations)
+        last_id = batch[-1]["_id"]
+        logger.info(f"Indexed {updated} questions (last _id {last_id}).")
+    return updated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill dedup fields on generated questions.")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--engine", choices=sorted(MINHASH_ENGINES), default=MINHASH_ENGINE)
+    args = parser.parse_args()
+
+    db = get_mongo_connection()
+    if db is None:
+        raise SystemExit("Database connection failed.")
+    ensure_indexes(db)
+    total = backfill_questions(db, get_minhash(args.engine), LSHIndex(engine=args.engine), args.batch_size)
+    logger.info(f"Backfill finished, {total} questions indexed.")
@@ -1,11 +1,22 @@
 from pymongo import MongoClient,errors
 import redis
+import redis.asyncio
 
 import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Connection pool sizes; REDIS_MAX_CONNECTIONS bounds the sync and the asyncio
+# client each. The API runs blocking pymongo/redis-py calls on a bounded
+# executor (run_blocking), which should not exceed either pool.
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "32"))
+
 MONGO_URI = os.getenv('MONGO_URI')
 if not MONGO_URI:
     raise ValueError("MONGO_URI is missing from environment variables.")
@@ -15,7 +26,7 @@ def get_mongo_connection():
     global _client
     try:
         if _client is None:
-            _client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+            _client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000, maxPoolSize=MONGO_MAX_POOL_SIZE)
             _client.admin.command('ping')
             print("MongoDB connected")
         return _client["hyreV3"]
@@ -43,10 +54,41 @@ def get_redis_connection():
     global _redis_client
     try:
         if _redis_client is None:
-            _redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0,password=REDIS_PASSWORD)
+            pool = redis.BlockingConnectionPool(
+                host=REDIS_HOST, port=REDIS_PORT, db=0, password=REDIS_PASSWORD,
+                max_connections=REDIS_MAX_CONNECTIONS, timeout=5,
+            )
+            _redis_client = redis.Redis(connection_pool=pool)
             _redis_client.ping()
             print("Redis connected")
         return _redis_client
     except redis.ConnectionError as e:
         print(f"Error: Unable to connect to Redis. Details: {e}")
-        return None
\ No newline at end of file
+        return None
+
+_async_redis_client = None
+
+def get_async_redis_connection():
+    """asyncio client for pub/sub listeners that run on the event loop."""
+    global _async_redis_client
+    if _async_redis_client is None:
+        pool = redis.asyncio.BlockingConnectionPool(
+            host=REDIS_HOST, port=REDIS_PORT, db=0, password=REDIS_PASSWORD,
+            max_connections=REDIS_MAX_CONNECTIONS, timeout=5,
+        )
+        _async_redis_client = redis.asyncio.Redis(connection_pool=pool)
+    return _async_redis_client
+
+
+_executor = None
+
+def get_db_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+    return _executor
+
+async def run_blocking(fn, *args, **kwargs):
+    """Run a blocking Mongo/Redis call on the bounded executor without stalling the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_db_executor(), functools.partial(fn, *args, **kwargs))
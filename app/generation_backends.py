@@ -0,0 +1,233 @@
+"""
+Pluggable question generation backends.
+
+Each `ai_assistants` document may set `backend` to choose how questions for
+that technology are generated:
+
+- "assistants" (default): an OpenAI Assistants thread, run and poll cycle
+  driving the assistant's `format_mcqs` tool.
+- "completions": a single chat completions request that forces a call to the
+  `format_mcqs` function with a strict JSON schema, optionally with `model`
+  and `instructions` set on the document.
+
+Both are driven through a session, so retries keep their conversation
+context. Sessions use the AsyncOpenAI client and never block the event loop,
+so one worker process can drive many of them at once. OPENAI_BASE_URL points
+the client at another endpoint, such as the local stub in
+benchmarks/openai_stub.py.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+GENERATION_BACKEND = os.getenv("GENERATION_BACKEND", "assistants")
+COMPLETIONS_MODEL = os.getenv("OPENAI_COMPLETIONS_MODEL", "gpt-4o-mini")
+# Seconds between Assistants run status polls
+OPENAI_POLL_INTERVAL = float(os.getenv("OPENAI_POLL_INTERVAL", "1.0"))
+
+DEFAULT_INSTRUCTIONS = (
+    "You are an expert technical interviewer who writes multiple-choice questions. "
+    "Each question has exactly four choices, a zero-based correct_answer index, a weightage of 1 "
+    "and tags naming the concepts it covers. Always return the questions by calling format_mcqs."
+)
+
+FORMAT_MCQS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "mcq_set": {
+            "type": "object",
+            "properties": {
+                "technology": {"type": "string"},
+                "concepts": {"type": "array", "items": {"type": "string"}},
+                "difficulty": {"type": "string"},
+                "total_questions": {"type": "integer"},
+                "questions": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "id": {"type": "integer"},
+                            "question": {"type": "string"},
+                            "choices": {"type": "array", "items": {"type": "string"}},
+                            "correct_answer": {"type": "integer"},
+                            "weightage": {"type": "integer"},
+                            "tags": {"type": "array", "items": {"type": "string"}},
+                        },
+                        "required": ["id", "question", "choices", "correct_answer", "weightage", "tags"],
+                        "additionalProperties": False,
+                    },
+                },
+            },
+            "required": ["technology", "concepts", "difficulty", "total_questions", "questions"],
+            "additionalProperties": False,
+        },
+    },
+    "required": ["mcq_set"],
+    "additionalProperties": False,
+}
+
+FORMAT_MCQS_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "format_mcqs",
+        "description": "Return the generated multiple-choice questions.",
+        "parameters": FORMAT_MCQS_SCHEMA,
+        "strict": True,
+    },
+}
+
+
+def _parse_arguments(arguments: str):
+    try:
+        with metrics.timer(stage="tool_parse"):
+            return json.loads(arguments)
+    except json.JSONDecodeError as e:
+        logger.error(f"Error parsing JSON: {e}")
+        return None
+
+
+class AssistantsSession:
+    def __init__(self, client, assistant_id: str):
+        self.client = client
+        self.assistant_id = assistant_id
+        self.id = None
+
+    async def open(self):
+        self.id = (await self.client.beta.threads.create()).id
+        logger.info(f"Created OpenAI thread with ID: {self.id}")
+        return self
+
+    async def generate(self, content: str, max_retries: int = 60):
+        """Send a message and wait for the run; returns (structured_response, prompt_tokens, completion_tokens)."""
+        with metrics.timer(stage="openai_submit"):
+            await self.client.beta.threads.messages.create(thread_id=self.id, role="user", content=content)
+            run = await self.client.beta.threads.runs.create(thread_id=self.id, assistant_id=self.assistant_id)
+        logger.info(f"Created run {run.id} in thread {self.id}")
+        structured_response = None
+        # openai_queue until the run leaves "queued", openai_poll from then until it finishes
+        created, started = time.perf_counter(), None
+        for i in range(max_retries):
+            logger.info(f"Waiting for OpenAI response... ({i} seconds)")
+            result = await self.client.beta.threads.runs.retrieve(thread_id=self.id, run_id=run.id)
+            if started is None and result.status != "queued":
+                started = time.perf_counter()
+                metrics.observe("qgen_stage_seconds", started - created, stage="openai_queue")
+            if result.status in ["completed", "failed", "cancelled", "expired"]:
+                metrics.observe("qgen_stage_seconds", time.perf_counter() - started, stage="openai_poll")
+            if result.status == "completed":
+                return structured_response, result.usage.prompt_tokens, result.usage.completion_tokens
+
+            elif result.status == "requires_action":
+                if result.required_action and result.required_action.submit_tool_outputs:
+                    tool_outputs = []
+                    for tool_call in result.required_action.submit_tool_outputs.tool_calls:
+                        if tool_call.function.name == "format_mcqs":
+                            if tool_call.function.arguments:
+                                structured_response = _parse_arguments(tool_call.function.arguments)
+                            tool_outputs.append({
+                                "tool_call_id": tool_call.id,
+                                "output": json.dumps(structured_response),
+                            })
+                    await self.client.beta.threads.runs.submit_tool_outputs(
+                        thread_id=self.id, run_id=run.id, tool_outputs=tool_outputs
+                    )
+                continue
+
+            elif result.status in ["failed", "cancelled", "expired"]:
+                logger.error(f"Run ended with status: {result.status}")
+                return None, 0, 0
+
+            await asyncio.sleep(OPENAI_POLL_INTERVAL)
+        raise TimeoutError("OpenAI response timeout")
+
+    async def close(self):
+        if self.id:
+            await self.client.beta.threads.delete(self.id)
+
+
+class CompletionsSession:
+    def __init__(self, client, model: str, instructions: str):
+        self.client = client
+        self.model = model
+        self.id = f"completion-{uuid.uuid4()}"
+        self.messages = [{"role": "system", "content": instructions}]
+
+    async def open(self):
+        return self
+
+    async def generate(self, content: str):
+        """One request per attempt; the forced tool call carries the structured response."""
+        self.messages.append({"role": "user", "content": content})
+        with metrics.timer(stage="openai_completion"):
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=self.messages,
+                tools=[FORMAT_MCQS_TOOL],
+                tool_choice={"type": "function", "function": {"name": "format_mcqs"}},
+            )
+        message = response.choices[0].message
+        structured_response = None
+        tool_calls = message.tool_calls or []
+        for tool_call in tool_calls:
+            if tool_call.function.name == "format_mcqs" and tool_call.function.arguments:
+                structured_response = _parse_arguments(tool_call.function.arguments)
+        # Keep the exchange in the conversation so a retry sees what was already generated
+        self.messages.append({
+            "role": "assistant",
+            "content": message.content,
+            "tool_calls": [{
+                "id": tool_call.id,
+                "type": "function",
+                "function": {"name": tool_call.function.name, "arguments": tool_call.function.arguments},
+            } for tool_call in tool_calls],
+        } if tool_calls else {"role": "assistant", "content": message.content or ""})
+        for tool_call in tool_calls:
+            self.messages.append({"role": "tool", "tool_call_id": tool_call.id, "content": "received"})
+        return structured_response, response.usage.prompt_tokens, response.usage.completion_tokens
+
+    async def close(self):
+        pass
+
+
+class AssistantsBackend:
+    name = "assistants"
+
+    def __init__(self, client):
+        self.client = client
+
+    async def start(self, assistant: dict) -> AssistantsSession:
+        if "assistant_id" not in assistant:
+            raise ValueError("Assistant ID not found in database.")
+        return await AssistantsSession(self.client, assistant["assistant_id"]).open()
+
+
+class CompletionsBackend:
+    name = "completions"
+
+    def __init__(self, client):
+        self.client = client
+
+    async def start(self, assistant: dict) -> CompletionsSession:
+        return await CompletionsSession(
+            self.client,
+            assistant.get("model", COMPLETIONS_MODEL),
+            assistant.get("instructions", DEFAULT_INSTRUCTIONS),
+        ).open()
+
+
+GENERATION_BACKENDS = {AssistantsBackend.name: AssistantsBackend, CompletionsBackend.name: CompletionsBackend}
+
+
+def get_backend(client, assistant: dict):
+    name = assistant.get("backend", GENERATION_BACKEND)
+    if name not in GENERATION_BACKENDS:
+        raise ValueError(f"Unknown generation backend '{name}' for technology {assistant.get('technology')}")
+    return GENERATION_BACKENDS[name](client)
@@ -0,0 +1,182 @@
+"""
+Bloom filter of generate_question_hash values in a Redis bitmap.
+
+The exact-match step of dedup used to ask Mongo for every generated hash,
+although almost all of them are new. The filter answers "definitely new" for
+a whole generated set with one BITFIELD command, and only the possible hits
+are looked up in Mongo. It never gives a false negative once seeded, so
+nothing is missed; a false positive only costs that Mongo lookup.
+
+Bits per hash come from the sha256 hex digest itself (double hashing), and
+the bitmap is sized for HASH_FILTER_CAPACITY hashes at HASH_FILTER_ERROR_RATE.
+The size is part of the key, so changing either setting starts a new filter
+instead of misreading the old one. Until a filter is seeded it reports every
+hash as possible and callers fall back to Mongo alone.
+
+Seed it from the bank (a warmed-up async worker also does this on startup):
+
+    python hash_filter.py --seed
+    python hash_filter.py --stats
+
+Lookups are counted in qgen_hash_filter_total{result=...}; the measured false
+positive rate is (possible - confirmed) / (lookups - confirmed).
+"""
+import argparse
+import logging
+import math
+import os
+import time
+
+from pymongo import ASCENDING
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+HASH_FILTER_CAPACITY = int(os.getenv("HASH_FILTER_CAPACITY", "2000000"))
+HASH_FILTER_ERROR_RATE = float(os.getenv("HASH_FILTER_ERROR_RATE", "0.001"))
+HASH_FILTER_PREFIX = "hashfilter:"
+SEED_BATCH_SIZE = 5000
+SEED_LOCK_TTL = 600
+# Seconds of questions re-added after a seed, covering inserts made while it ran
+SEED_OVERLAP = 5
+
+
+class HashFilter:
+    def __init__(self, redis_conn, capacity: int = HASH_FILTER_CAPACITY, error_rate: float = HASH_FILTER_ERROR_RATE):
+        self.redis_conn = redis_conn
+        self.bits = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, int(round(self.bits / capacity * math.log(2))))
+        self.key = f"{HASH_FILTER_PREFIX}{self.bits}:{self.hashes}"
+        self.ready_key = self.key + ":ready"
+
+    def _offsets(self, hash_value: str) -> list:
+        first, second = int(hash_value[:16], 16), int(hash_value[16:32], 16) | 1
+        return [(first + i * second) % self.bits for i in range(self.hashes)]
+
+    def ready(self) -> bool:
+        return bool(self.redis_conn.exists(self.ready_key))
+
+    def possible(self, hashes: list) -> list:
+        """The hashes that may already be stored; all of them while the filter is not seeded."""
+        if not hashes:
+            return []
+        pipe = self.redis_conn.pipeline(transaction=False)
+        pipe.exists(self.ready_key)
+        bitfield = pipe.bitfield(self.key)
+        for hash_value in hashes:
+            for offset in self._offsets(hash_value):
+                bitfield.get("u1", offset)
+        bitfield.execute()
+        ready, bits = pipe.execute()
+        if not ready:
+            return list(hashes)
+        found = [hash_value for index, hash_value in enumerate(hashes)
+                 if all(bits[index * self.hashes:(index + 1) * self.hashes])]
+        metrics.inc("qgen_hash_filter_total", len(hashes) - len(found), result="new")
+        metrics.inc("qgen_hash_filter_total", len(found), result="possible")
+        return found
+
+    def confirmed(self, count: int):
+        """Count possible hits that Mongo confirmed as real duplicates."""
+        metrics.inc("qgen_hash_filter_total", count, result="confirmed")
+
+    def add(self, hashes: list, key: str = None):
+        if not hashes:
+            return
+        bitfield = self.redis_conn.bitfield(key or self.key)
+        for hash_value in hashes:
+            for offset in self._offsets(hash_value):
+                bitfield.set("u1", offset, 1)
+        bitfield.execute()
+
+    def invalidate(self):
+        """Stop trusting the filter, e.g. after an insert could not be added to it."""
+        self.redis_conn.delete(self.ready_key)
+
+    def seed(self, db, batch_size: int = SEED_BATCH_SIZE) -> int:
+        """Rebuild the filter from every stored hash and swap it in."""
+        collection = db["generated_questions"]
+        staging = self.key + ":seeding"
+        started = int(time.time())
+        self.redis_conn.delete(staging)
+        seeded, batch = 0, []
+        for doc in collection.find({"hash": {"$exists": True}}, {"hash": 1, "_id": 0}).batch_size(batch_size):
+            batch.append(doc["hash"])
+            if len(batch) == batch_size:
+                self.add(batch, staging)
+                seeded, batch = seeded + len(batch), []
+        self.add(batch, staging)
+        seeded += len(batch)
+        if seeded:
+            self.redis_conn.rename(staging, self.key)
+        # Questions inserted while seeding went to the old bitmap
+        recent = [doc["hash"] for doc in collection.find(
+            {"created_at": {"$gte": started - SEED_OVERLAP}, "hash": {"$exists": True}}, {"hash": 1, "_id": 0}
+        )]
+        self.add(recent)
+        self.redis_conn.set(self.ready_key, started)
+        logger.info(f"Seeded hash filter {self.key} with {seeded} hashes")
+        return seeded
+
+    def ensure_seeded(self, db) -> bool:
+        """Seed the filter unless it is ready or another process is already seeding it."""
+        if self.ready():
+            return False
+        if not self.redis_conn.set(self.key + ":lock", 1, nx=True, ex=SEED_LOCK_TTL):
+            return False
+        try:
+            self.seed(db)
+        finally:
+            self.redis_conn.delete(self.key + ":lock")
+        return True
+
+    def stats(self) -> dict:
+        set_bits = self.redis_conn.bitcount(self.key)
+        fill = set_bits / self.bits
+        return {
+            "key": self.key,
+            "ready": self.ready(),
+            "bits": self.bits,
+            "hashes_per_item": self.hashes,
+            "fill_ratio": round(fill, 6),
+            "estimated_items": int(-self.bits / self.hashes * math.log(1 - fill)) if fill < 1 else None,
+            "expected_false_positive_rate": fill ** self.hashes,
+        }
+
+
+def ensure_indexes(db):
+    # The remaining exact-match lookups are by hash
+    db["generated_questions"].create_index([("hash", ASCENDING)])
+
+
+if __name__ == "__main__":
+    from db_manager import get_mongo_connection, get_redis_connection
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Exact-hash Bloom filter maintenance.")
+    parser.add_argument("--seed", action="store_true", help="rebuild the filter from generated_questions")
+    parser.add_argument("--stats", action="store_true", help="print fill ratio and false positive rates")
+    args = parser.parse_args()
+
+    redis_conn = get_redis_connection()
+    hash_filter = HashFilter(redis_conn)
+    if args.seed:
+        db = get_mongo_connection()
+        ensure_indexes(db)
+        print(f"Seeded {hash_filter.seed(db)} hashes into {hash_filter.key}.")
+    if args.stats:
+        stats = hash_filter.stats()
+        totals = {}
+        for series, value in redis_conn.hgetall(metrics.METRICS_KEY).items():
+            series = series.decode("utf-8")
+            if series.startswith("qgen_hash_filter_total{"):
+                totals[series.split('"')[1]] = float(value)
+        lookups = totals.get("new", 0) + totals.get("possible", 0)
+        negatives = lookups - totals.get("confirmed", 0)
+        stats["lookups"] = int(lookups)
+        stats["measured_false_positive_rate"] = (
+            (totals.get("possible", 0) - totals.get("confirmed", 0)) / negatives if negatives else None
+        )
+        for name, value in stats.items():
+            print(f"{name}: {value}")
@@ -0,0 +1,75 @@
+import logging
+import os
+import threading
+from typing import List
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Ids reserved per round trip to the counter document. Unused ids of a block are
+# skipped when the worker exits, so ids stay unique but may have gaps.
+QUESTION_ID_BLOCK_SIZE = int(os.getenv("QUESTION_ID_BLOCK_SIZE", "50"))
+
+
+class QuestionIdAllocator:
+    """
+    Hands out `question.id` values from blocks reserved with an atomic `$inc`
+    on a document in the `counters` collection, so concurrent workers never
+    hand out the same id and no sorted max-id query is needed per insert.
+    """
+
+    def __init__(self, db, block_size: int = QUESTION_ID_BLOCK_SIZE, counter: str = "question_id"):
+        self.db = db
+        self.block_size = block_size
+        self.counter = counter
+        self._next = 0
+        self._end = 0
+        self._seeded = False
+        self._lock = threading.Lock()
+
+    def _upsert(self, update: dict, **kwargs):
+        # Two processes upserting a missing counter at once can race on _id; the loser retries as an update
+        try:
+            return self.db["counters"].find_one_and_update({"_id": self.counter}, update, upsert=True, **kwargs)
+        except DuplicateKeyError:
+            return self.db["counters"].find_one_and_update({"_id": self.counter}, update, upsert=True, **kwargs)
+
+    def _seed(self):
+        # Continue from ids handed out before the counter existed; $max makes this safe to repeat
+        max_question = self.db["generated_questions"].find_one(
+            sort=[("question.id", -1)], projection={"question.id": 1}
+        )
+        current = max_question["question"]["id"] if max_question else 0
+        self._upsert({"$max": {"seq": current}})
+        self._seeded = True
+
+    def _reserve(self, count: int):
+        doc = self._upsert({"$inc": {"seq": count}}, return_document=ReturnDocument.AFTER)
+        self._next, self._end = doc["seq"] - count + 1, doc["seq"] + 1
+        logger.info(f"Reserved question ids {self._next}-{self._end - 1}")
+
+    def allocate(self, count: int = 1) -> List[int]:
+        with self._lock:
+            if not self._seeded:
+                self._seed()
+            ids = []
+            while len(ids) < count:
+                if self._next >= self._end:
+                    self._reserve(max(self.block_size, count - len(ids)))
+                take = min(count - len(ids), self._end - self._next)
+                ids.extend(range(self._next, self._next + take))
+                self._next += take
+            return ids
+
+    def next_id(self) -> int:
+        return self.allocate(1)[0]
+
+
+def ensure_unique_question_ids(db):
+    try:
+        db["generated_questions"].create_index("question.id", unique=True)
+    except OperationFailure as e:
+        # Ids handed out by the old max-id + 1 scheme may already collide
+        logger.error(f"Unable to create unique index on question.id, resolve duplicate ids first: {e}")
@@ -0,0 +1,85 @@
+"""
+Job status and partial results pushed over Redis pub/sub.
+
+The worker publishes every status change of a generation job, and each batch
+of questions as soon as it survives dedup, on the JOB_EVENTS_CHANNEL channel.
+Each API process keeps one subscription to that channel (JobEventHub) and
+hands events to the requests waiting on a job, which backs the long-poll form
+of /get_questions and the /job_events/{job_id} Server-Sent Events stream.
+
+Pub/sub does not replay missed messages, so waiters always subscribe first
+and then read the stored status, and re-read it whenever they time out.
+"""
+import asyncio
+import contextlib
+import json
+import logging
+import os
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+JOB_EVENTS_CHANNEL = os.getenv("JOB_EVENTS_CHANNEL", "job_events")
+FINAL_STATUSES = ("completed", "failed")
+
+
+def publish_event(redis_conn, job_id: str, event: str, **fields):
+    redis_conn.publish(JOB_EVENTS_CHANNEL, json.dumps({"job_id": job_id, "event": event, **fields}))
+
+
+def publish_status(redis_conn, job_id: str, status: str):
+    publish_event(redis_conn, job_id, "status", status=status)
+
+
+def publish_questions(redis_conn, job_id: str, questions: list):
+    publish_event(redis_conn, job_id, "questions", questions=questions)
+
+
+class JobEventHub:
+    """One pub/sub subscription per process, fanned out to in-process listeners by job id."""
+
+    def __init__(self, async_redis):
+        self.redis = async_redis
+        self._listeners = defaultdict(set)
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+
+    async def _run(self):
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                await pubsub.subscribe(JOB_EVENTS_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    event = json.loads(message["data"])
+                    for queue in list(self._listeners.get(event["job_id"], ())):
+                        queue.put_nowait(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job event subscription failed, retrying: {e}")
+                await asyncio.sleep(1)
+
+    @contextlib.asynccontextmanager
+    async def listen(self, job_id: str):
+        """Queue receiving the events of `job_id` while the block runs."""
+        self.start()
+        queue = asyncio.Queue()
+        self._listeners[job_id].add(queue)
+        try:
+            yield queue
+        finally:
+            self._listeners[job_id].discard(queue)
+            if not self._listeners[job_id]:
+                del self._listeners[job_id]
@@ -0,0 +1,150 @@
+"""
+Generation job records in Redis.
+
+Each job is one hash, `job:<job_id>`, expiring JOB_TTL seconds after its last
+write:
+
+    status        queued | in-progress | completed | failed | attached
+    created_at, started_at, finished_at, updated_at   (unix seconds)
+    requested     questions the job has to generate
+    accepted      questions accepted so far
+    attempts      generation attempts made so far
+    selected      zlib JSON of the pool questions picked by the API
+    alias         for a coalesced request, the job it is attached to
+    result        zlib JSON of the /get_questions payload
+
+Every write is one MULTI/EXEC pipeline that also refreshes the TTL and, for
+status changes, publishes the job event, so a reader never sees "completed"
+before the result is there. Jobs written before this layout (`<job_id>:status`
+and `<job_id>` keys) are still readable until they are cleaned up.
+"""
+import json
+import os
+import time
+import zlib
+
+import metrics
+from job_events import publish_questions, publish_status
+
+JOB_TTL = int(os.getenv("JOB_TTL", str(24 * 3600)))
+JOB_PREFIX = "job:"
+COMPRESSED_FIELDS = ("selected", "result")
+INT_FIELDS = ("created_at", "started_at", "finished_at", "updated_at", "requested", "accepted", "attempts")
+
+
+def _key(job_id: str) -> str:
+    return JOB_PREFIX + job_id
+
+
+def compress(value) -> bytes:
+    return zlib.compress(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+
+
+def decompress(blob: bytes):
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+def _write(redis_conn, job_id: str, fields: dict, status: str = None):
+    pipe = redis_conn.pipeline(transaction=True)
+    pipe.hset(_key(job_id), mapping={"updated_at": int(time.time()), **fields})
+    pipe.expire(_key(job_id), JOB_TTL)
+    if status is not None:
+        publish_status(pipe, job_id, status)
+    with metrics.timer(stage="redis_write"):
+        pipe.execute()
+
+
+def create_job(redis_conn, job_id: str, status: str, requested: int = 0, selected: list = None,
+               alias: str = None, result: dict = None):
+    now = int(time.time())
+    fields = {"status": status, "created_at": now, "requested": requested, "accepted": 0, "attempts": 0}
+    if selected is not None:
+        fields["selected"] = compress(selected)
+    if alias is not None:
+        fields["alias"] = alias
+    if result is not None:
+        fields["result"] = compress(result)
+        fields["finished_at"] = now
+    _write(redis_conn, job_id, fields)
+
+
+def set_status(redis_conn, job_id: str, status: str):
+    fields = {"status": status}
+    if status == "in-progress":
+        fields["started_at"] = int(time.time())
+    elif status == "failed":
+        fields["finished_at"] = int(time.time())
+    _write(redis_conn, job_id, fields, status)
+
+
+def complete_job(redis_conn, job_id: str, result: dict, attempts: int = None):
+    """Store the result and mark the job completed in one transaction."""
+    fields = {
+        "status": "completed",
+        "result": compress(result),
+        "finished_at": int(time.time()),
+        "accepted": result.get("total_questions", 0),
+    }
+    if attempts is not None:
+        fields["attempts"] = attempts
+    _write(redis_conn, job_id, fields, "completed")
+
+
+def record_progress(redis_conn, job_id: str, attempts: int, accepted: int, questions: list):
+    """Progress counters plus an event carrying the newly accepted questions."""
+    pipe = redis_conn.pipeline(transaction=True)
+    pipe.hset(_key(job_id), mapping={"attempts": attempts, "accepted": accepted, "updated_at": int(time.time())})
+    pipe.expire(_key(job_id), JOB_TTL)
+    if questions:
+        publish_questions(pipe, job_id, questions)
+    with metrics.timer(stage="redis_write"):
+        pipe.execute()
+
+
+def _decode(raw: dict) -> dict:
+    record = {}
+    for field, value in raw.items():
+        field = field.decode("utf-8")
+        if field in COMPRESSED_FIELDS:
+            record[field] = value
+        elif field in INT_FIELDS:
+            record[field] = int(value)
+        else:
+            record[field] = value.decode("utf-8")
+    return record
+
+
+def _read_legacy(redis_conn, job_id: str):
+    pipe = redis_conn.pipeline(transaction=False)
+    pipe.get(f"{job_id}:status")
+    pipe.get(job_id)
+    status, data = pipe.execute()
+    if status is None:
+        return None
+    record = {"status": status.decode("utf-8")}
+    if data is not None:
+        record["result"] = zlib.compress(data)
+    return record
+
+
+def read_jobs(redis_conn, job_ids: list) -> list:
+    """Records of several jobs in one round trip; None for jobs that do not exist."""
+    pipe = redis_conn.pipeline(transaction=False)
+    for job_id in job_ids:
+        pipe.hgetall(_key(job_id))
+    records = []
+    for job_id, raw in zip(job_ids, pipe.execute()):
+        records.append(_decode(raw) if raw else _read_legacy(redis_conn, job_id))
+    return records
+
+
+def read_job(redis_conn, job_id: str):
+    return read_jobs(redis_conn, [job_id])[0]
+
+
+def job_result(record: dict):
+    return decompress(record["result"]) if record.get("result") else None
+
+
+def job_selected(record: dict) -> list:
+    return decompress(record["selected"]) if record.get("selected") else []
@@ -0,0 +1,59 @@
+"""
+Job specs shared by the processes that enqueue generation jobs and the worker.
+
+The API and the replenisher enqueue by task name, so they never import
+worker.py and its stack (openai, httpx, scikit-learn, the dedup indexes);
+rq resolves GENERATION_TASK when a worker picks the job up. Jobs go into a
+scheduler lane (scheduler.py) rather than straight onto an rq queue.
+
+The request model lives here too: job arguments are pickled with their
+class's module path, and a worker unpickling `main.GenerateQuestionRequestModel`
+would have to import the whole API to run the job.
+
+generation_failed is the jobs' rq failure callback. The task marks its own
+job failed when it raises, but not when the worker times it out or is killed
+in the middle of it; the worker runs the callback for those.
+"""
+import os
+from typing import List
+
+from pydantic import BaseModel
+from rq.job import Callback
+
+import scheduler
+from job_store import set_status as set_job_status
+from single_flight import release as release_inflight
+
+GENERATION_TASK = "worker.process_question_generation_task"
+# Larger requests are split into parallel shards by the worker (worker.plan_shards)
+MAX_QUESTIONS_PER_REQUEST = int(os.getenv("MAX_QUESTIONS_PER_REQUEST", "50"))
+
+
+class GenerateQuestionRequestModel(BaseModel):
+    technology_name: str
+    concepts: List[str]
+    difficulty_level: str
+    number_of_questions: int
+    company_Id: str
+    strict_question: bool
+
+
+def enqueue_generation(redis_conn, request: GenerateQuestionRequestModel, job_id: str, selected: list,
+                       lane: str = None, **kwargs):
+    """
+    Queue a generation job in `lane` (by default picked from how many questions
+    it has to generate); kwargs go to Queue.create_job (job_id, result_ttl, ...).
+    """
+    # number_of_questions is what is left to generate once the pool questions in `selected` are taken
+    lane = lane or scheduler.lane_for(request)
+    return scheduler.submit(
+        redis_conn, lane, GENERATION_TASK, (request, job_id, selected), request.company_Id,
+        request.number_of_questions, on_failure=Callback(generation_failed), **kwargs
+    )
+
+
+def generation_failed(job, connection, exc_type, exc_value, traceback):
+    """Fail the job record and free its in-flight key, so identical requests start a new job."""
+    request, job_id = job.args[0], job.args[1]
+    set_job_status(connection, job_id, "failed")
+    release_inflight(connection, request, job_id)
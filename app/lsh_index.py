@@ -0,0 +1,72 @@
+import hashlib
+import os
+from typing import List
+
+from pymongo import ASCENDING
+
+# Banding layout for the MinHash LSH index. bands * rows must not exceed the
+# number of MinHash permutations. The approximate similarity at which a pair
+# becomes a likely candidate is (1 / bands) ** (1 / rows): 20x5 gives ~0.55,
+# which keeps recall at the 0.85 duplicate threshold above 99.99%.
+LSH_BANDS = int(os.getenv("LSH_BANDS", "20"))
+LSH_ROWS = int(os.getenv("LSH_ROWS", "5"))
+
+
+class LSHIndex:
+    """Locality-sensitive hashing band index over MinHash signatures.
+
+    Band keys are stored on each `generated_questions` document in the
+    `lsh_bands` array, so a multikey index turns the candidate lookup into a
+    handful of bucket hits instead of a scan of every question with the same
+    technology and difficulty. Keys are prefixed with the MinHash engine name,
+    so a document can be indexed for several engines while migrating.
+    """
+
+    def __init__(self, bands: int = LSH_BANDS, rows: int = LSH_ROWS, engine: str = "md5"):
+        if bands < 1 or rows < 1:
+            raise ValueError("LSH bands and rows must both be positive.")
+        self.bands = bands
+        self.rows = rows
+        self.engine = engine
+
+    @property
+    def layout(self) -> str:
+        return f"{self.engine}:{self.bands}x{self.rows}"
+
+    @property
+    def threshold(self) -> float:
+        return (1 / self.bands) ** (1 / self.rows)
+
+    def band_keys(self, signature: list) -> List[str]:
+        if len(signature) < self.bands * self.rows:
+            raise ValueError(
+                f"Signature of length {len(signature)} is too short for a {self.layout} LSH layout."
+            )
+        keys = []
+        for band in range(self.bands):
+            start = band * self.rows
+            values = ",".join(str(int(value)) for value in signature[start:start + self.rows])
+            digest = hashlib.md5(values.encode()).hexdigest()[:16]
+            keys.append(f"{self.engine}:{band}:{digest}")
+        return keys
+
+    def index_fields(self, signature: list) -> dict:
+        """Fields to store on a question document so it can be found by `find_candidates`."""
+        return {"lsh_bands": self.band_keys(signature), "lsh_layouts": [self.layout]}
+
+    def find_candidates(self, db, metadata: dict, signature: list, tags: list, projection: dict = None):
+        """Questions sharing at least one band bucket with the given signature."""
+        return db["generated_questions"].find({
+            "metadata.technology": metadata["technology"],
+            "metadata.difficulty": metadata["difficulty"],
+            "lsh_bands": {"$in": self.band_keys(signature)},
+            "question.tags": {"$in": tags},
+        }, projection)
+
+
+def ensure_indexes(db):
+    db["generated_questions"].create_index([
+        ("metadata.technology", ASCENDING),
+        ("metadata.difficulty", ASCENDING),
+        ("lsh_bands", ASCENDING),
+    ])
@@ -1,4 +1,5 @@
 from fastapi import FastAPI, HTTPException,Header,Depends,Request
+from fastapi.responses import PlainTextResponse,StreamingResponse
 from fastapi.security import APIKeyHeader
 from pydantic import BaseModel,ValidationError
 from typing import List
@@ -7,9 +8,19 @@ import os
 import time
 import uuid
 import logging,json
-from rq import Queue
-from worker import process_question_generation_task
-from db_manager import get_mongo_connection,get_redis_connection
+import asyncio
+from jobs import MAX_QUESTIONS_PER_REQUEST,GenerateQuestionRequestModel,enqueue_generation
+from db_manager import get_mongo_connection,get_redis_connection,get_async_redis_connection,run_blocking
+from assistant_registry import AssistantRegistry
+from pool_inventory import pool_stats,record_request
+from question_usage import ensure_indexes as ensure_usage_indexes
+from question_usage import find_unused,mark_used
+from single_flight import attach_or_lead,follower_result
+from job_store import create_job,job_result,job_selected,read_job
+from job_events import FINAL_STATUSES,JobEventHub
+from usage import usage_summary
+from scheduler import depths as lane_depths
+import metrics
 from fastapi.middleware.cors import CORSMiddleware
 
 db = get_mongo_connection()
@@ -20,8 +31,12 @@ redis_conn = get_redis_connection()
 if redis_conn is None:
     print("Failed to connect to Redis.")
 
-# RQ queue
-question_queue = Queue(connection=redis_conn)
+# technology -> assistant, served from memory
+assistant_registry = AssistantRegistry(db, redis_conn)
+
+# Job status and partial results pushed by the worker
+job_event_hub = JobEventHub(get_async_redis_connection())
+
 
 
 
@@ -31,9 +46,33 @@ logger = logging.getLogger(__name__)
 
 # Environment variables
 API_KEY = os.getenv("API_KEY")
+# Longest a /get_questions call may wait for its job to finish
+MAX_LONG_POLL_WAIT = int(os.getenv("MAX_LONG_POLL_WAIT", "60"))
+# Seconds between keepalive comments on an idle event stream
+SSE_KEEPALIVE = int(os.getenv("SSE_KEEPALIVE", "15"))
 
 app = FastAPI()
 
+
+@app.on_event("startup")
+async def start_assistant_registry():
+    await run_blocking(assistant_registry.start)
+    await run_blocking(assistant_registry.technologies)
+    await run_blocking(ensure_usage_indexes, db)
+    job_event_hub.start()
+    metrics.start_publisher(redis_conn)
+
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    metrics.observe(
+        "qgen_http_request_seconds", time.perf_counter() - started,
+        route=route.path if route is not None else "unmatched", method=request.method, status=response.status_code,
+    )
+    return response
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -42,13 +81,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-class GenerateQuestionRequestModel(BaseModel):
-    technology_name: str
-    concepts: List[str]
-    difficulty_level: str
-    number_of_questions: int
-    company_Id: str
-    strict_question:bool
 class StoreQuestionRequestModel(BaseModel):
     questions:List[int]
     company_Id:str
@@ -56,6 +88,8 @@ class StoreQuestionRequestModel(BaseModel):
 
 class QuestionRequestModel(BaseModel):
     job_Id: str
+    # Seconds to wait for the job to finish before answering; 0 answers immediately
+    wait: int = 0
 
 
 def verify_token(authorization: str = Header(None)):
@@ -91,20 +125,15 @@ async def generate_ai_question(request: GenerateQuestionRequestModel,authorized:
         raise HTTPException(status_code=400, detail="Difficulty level cannot be empty")
     if not request.concepts:
         raise HTTPException(status_code=400, detail="Concepts list cannot be empty.")
-    if request.number_of_questions < 1 or request.number_of_questions > 10:
-        raise HTTPException(status_code=400, detail="Number of questions must be between 1 and 10")
+    if request.number_of_questions < 1 or request.number_of_questions > MAX_QUESTIONS_PER_REQUEST:
+        raise HTTPException(status_code=400, detail=f"Number of questions must be between 1 and {MAX_QUESTIONS_PER_REQUEST}")
 
     request.concepts = list({concept.strip().lower() for concept in request.concepts if concept.strip()})
-    relevant_docs = list(
-    db["generated_questions"].find({
-        "companies_used_by": {"$nin": [request.company_Id]},
-        "metadata.technology": request.technology_name,
-        "metadata.difficulty": request.difficulty_level,
-        "question.tags": {"$in": request.concepts},
-        "strict_question": request.strict_question,
-        **({"generated_by": request.company_Id} if request.strict_question else {})
-    }).limit(request.number_of_questions)
-)
+    relevant_docs = await run_blocking(find_pool_questions, request)
+    try:
+        await run_blocking(record_request, redis_conn, request, request.number_of_questions, len(relevant_docs))
+    except Exception as e:
+        logger.error(f"Failed to record pool demand: {e}")
 
     Questions = []
     job_id = str(uuid.uuid4())
@@ -112,14 +141,13 @@ async def generate_ai_question(request: GenerateQuestionRequestModel,authorized:
         Questions = [doc["question"] for doc in relevant_docs]
 
         if(len(Questions) == request.number_of_questions):
-            redis_conn.set(f"{job_id}:status", "completed")
             data = {
                     "technology": request.technology_name,
                     "difficulty": request.difficulty_level,
                     "total_questions": len(Questions),
                     "questions": Questions
                 }
-            redis_conn.set(job_id, json.dumps(data))
+            await run_blocking(store_completed_job, job_id, data)
             return {"data":data,"status":"success","job_id":job_id}
         else:
             print("question found..needed_Question status queued")
@@ -128,42 +156,76 @@ async def generate_ai_question(request: GenerateQuestionRequestModel,authorized:
 
     else:
         print("no question found..status queued")
-    redis_conn.set(f"{job_id}:status", "queued")
-    question_queue.enqueue(process_question_generation_task, request, job_id, Questions)
-    logger.info(f"Enqueued job with ID: {job_id}")
+    leader_id = await run_blocking(enqueue_job, request, job_id, Questions)
+    if leader_id:
+        logger.info(f"Job {job_id} coalesced into in-flight job {leader_id}")
+    else:
+        logger.info(f"Enqueued job with ID: {job_id}")
     return {"job_id": job_id,"status":"queued"}
 
 
-@app.post("/get_questions")
-async def get_questions(request: QuestionRequestModel, authorized: bool = Depends(verify_token)):
-    key = f"{request.job_Id}:status"
+@app.get("/pool_stats")
+async def get_pool_stats(limit: int = 100, authorized: bool = Depends(verify_token)):
     try:
-        status = redis_conn.get(key)
-        if not status:
-            raise HTTPException(
-                status_code=404,
-                detail=f"No job found for ID: {request.job_Id}"
-            )
+        stats = await run_blocking(pool_stats, redis_conn, limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching pool stats: {str(e)}")
+    requests = sum(bucket["requests"] for bucket in stats)
+    hits = sum(bucket["hits"] for bucket in stats)
+    return {
+        "status": "success",
+        "hit_rate": round(hits / requests, 4) if requests else None,
+        "data": stats,
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(authorized: bool = Depends(verify_token)):
+    # Totals of every API and worker process, in Prometheus text format
+    try:
+        await run_blocking(metrics.push, redis_conn)
+        depths = await run_blocking(lane_depths, redis_conn)
+        body = await run_blocking(
+            metrics.render, redis_conn, [metrics.gauge("qgen_lane_depth", n, lane=lane) for lane, n in depths.items()]
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching metrics: {str(e)}")
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
 
-        status = status.decode("utf-8")
-        if status == "completed":
-            data = redis_conn.get(request.job_Id)
-            if not data:
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Job {request.job_Id} is marked as completed, but no data is available."
-                )
-            data = json.loads(data.decode("utf-8"))
-            return {
-                "status": "completed",
-                "data": data
-            }
 
-        return {
-            "status": status,
-            "message": f"Job is currently in {status} status."
-        }
+@app.get("/usage_summary")
+async def get_usage_summary(company_Id: str, start_day: str = None, end_day: str = None,
+                            authorized: bool = Depends(verify_token)):
+    # Reads the per-day rollups only; start_day/end_day are YYYY-MM-DD (UTC), default the last 30 days
+    try:
+        summary = await run_blocking(usage_summary, db, company_Id, start_day, end_day)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching usage summary: {str(e)}")
+    return {"status": "success", "data": summary}
+
 
+@app.post("/get_questions")
+async def get_questions(request: QuestionRequestModel, authorized: bool = Depends(verify_token)):
+    try:
+        result_id, response = await run_blocking(job_response, request.job_Id)
+        wait = min(max(request.wait, 0), MAX_LONG_POLL_WAIT)
+        if wait and response["status"] not in FINAL_STATUSES:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + wait
+            async with job_event_hub.listen(result_id) as events:
+                # Read again now that we are subscribed, so a change in between is not missed
+                result_id, response = await run_blocking(job_response, request.job_Id)
+                while response["status"] not in FINAL_STATUSES and loop.time() < deadline:
+                    try:
+                        event = await asyncio.wait_for(events.get(), deadline - loop.time())
+                    except asyncio.TimeoutError:
+                        break
+                    if event["event"] == "status":
+                        result_id, response = await run_blocking(job_response, request.job_Id)
+        return response
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -171,6 +233,78 @@ async def get_questions(request: QuestionRequestModel, authorized: bool = Depend
         )
 
 
+@app.get("/job_events/{job_id}")
+async def job_events(job_id: str, authorized: bool = Depends(verify_token)):
+    """Server-Sent Events: the job's status on connect, each accepted batch of questions, then the final status."""
+    result_id, _ = await run_blocking(job_response, job_id)
+
+    def sse(event: str, data: dict) -> str:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    async def stream():
+        async with job_event_hub.listen(result_id) as events:
+            try:
+                _, response = await run_blocking(job_response, job_id)
+                yield sse("status", response)
+                while response["status"] not in FINAL_STATUSES:
+                    try:
+                        event = await asyncio.wait_for(events.get(), SSE_KEEPALIVE)
+                    except asyncio.TimeoutError:
+                        # Also covers events missed while the subscription was reconnecting
+                        _, current = await run_blocking(job_response, job_id)
+                        if current["status"] == response["status"]:
+                            yield ": keepalive\n\n"
+                            continue
+                        response = current
+                        yield sse("status", response)
+                        continue
+                    if event["event"] == "questions":
+                        yield sse("questions", {"job_id": job_id, "questions": event["questions"]})
+                    elif event["event"] == "status":
+                        _, response = await run_blocking(job_response, job_id)
+                        yield sse("status", response)
+            except HTTPException as e:
+                yield sse("error", {"job_id": job_id, "detail": e.detail})
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def job_response(job_id: str):
+    """(id the result is stored under, /get_questions response) for a job or an alias of one."""
+    record = own_record = read_job(redis_conn, job_id)
+    result_id = job_id
+    if record and record.get("alias"):
+        # A coalesced request reads the status and result of the job it is attached to
+        result_id = record["alias"]
+        record = read_job(redis_conn, result_id)
+    if not record:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No job found for ID: {job_id}"
+        )
+
+    status = record["status"]
+    if status == "completed":
+        data = job_result(record)
+        if data is None:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Job {job_id} is marked as completed, but no data is available."
+            )
+        if result_id != job_id:
+            data = follower_result(data, job_selected(record), job_selected(own_record))
+        return result_id, {
+            "status": "completed",
+            "data": data
+        }
+
+    return result_id, {
+        "status": status,
+        "message": f"Job is currently in {status} status."
+    }
+
+
 
 @app.post("/store_question")
 async def store_question(request: StoreQuestionRequestModel,
@@ -186,20 +320,21 @@ async def store_question(request: StoreQuestionRequestModel,
                 status_code=400,
                 detail="The 'company_Id' cannot be empty."
             )
-        result = db["generated_questions"].update_many(
-            {"question.id": {"$in": request.questions}},
-            {"$addToSet": {"companies_used_by": request.company_Id}},
-            upsert=False
+        existing_ids = await run_blocking(
+            db["generated_questions"].distinct,
+            "question.id",
+            {"question.id": {"$in": request.questions}}
         )
-        if result.matched_count == 0:
+        if len(existing_ids) == 0:
             raise HTTPException(
                 status_code=404,
                 detail="No matching questions found for the provided IDs."
             )
+        modified_count = await run_blocking(mark_used, db, redis_conn, request.company_Id, existing_ids)
         return {
             "message": "Questions updated successfully.",
-            "matched_count": result.matched_count,
-            "modified_count": result.modified_count
+            "matched_count": len(existing_ids),
+            "modified_count": modified_count
         }
       except ValidationError as e:
         raise HTTPException(
@@ -214,7 +349,29 @@ async def store_question(request: StoreQuestionRequestModel,
 
 
 def available_tech():
-    collection = db['ai_assistants']
-    documents = collection.find()
-    valid_technologies = {doc["technology"] for doc in documents}
-    return valid_technologies
\ No newline at end of file
+    return assistant_registry.technologies()
+
+
+def find_pool_questions(request: GenerateQuestionRequestModel):
+    # Indexed lookup of the bucket; questions the company already used are dropped via its bitmap
+    return find_unused(db, redis_conn, request.company_Id, {
+            "metadata.technology": request.technology_name,
+            "metadata.difficulty": request.difficulty_level,
+            "question.tags": {"$in": request.concepts},
+            "strict_question": request.strict_question,
+            **({"generated_by": request.company_Id} if request.strict_question else {})
+        }, {"question": 1}, request.number_of_questions)
+
+
+def store_completed_job(job_id: str, data: dict):
+    create_job(redis_conn, job_id, "completed", result=data)
+
+
+def enqueue_job(request: GenerateQuestionRequestModel, job_id: str, questions: list):
+    leader_id = attach_or_lead(redis_conn, request, job_id)
+    if leader_id:
+        # An identical request is already being generated; share its result
+        create_job(redis_conn, job_id, "attached", request.number_of_questions, questions, alias=leader_id)
+        return leader_id
+    create_job(redis_conn, job_id, "queued", request.number_of_questions, questions)
+    enqueue_generation(redis_conn, request, job_id, questions)
@@ -0,0 +1,210 @@
+"""
+Stage timings and counters in Prometheus text format.
+
+Every process (API, async worker, replenisher) counts into an
+in-memory table and pushes the increments since its last push into one Redis
+hash, METRICS_KEY, with HINCRBYFLOAT. Hash fields are the Prometheus series
+themselves (`qgen_stage_seconds_bucket{stage="tfidf",le="0.1"}`), so the
+hash holds the cluster-wide totals and GET /metrics only has to render it.
+
+Each process pushes from a background thread every METRICS_PUSH_INTERVAL
+seconds (start_publisher). Recording is a dict update under a lock, cheap enough to
+leave on.
+"""
+import bisect
+import contextlib
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY = os.getenv("METRICS_KEY", "metrics")
+METRICS_PUSH_INTERVAL = float(os.getenv("METRICS_PUSH_INTERVAL", "10"))
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    "qgen_stage_seconds": ("histogram", "Time spent in each stage of question generation.", LATENCY_BUCKETS),
+    "qgen_http_request_seconds": ("histogram", "API request latency by route.", LATENCY_BUCKETS),
+    "qgen_job_seconds": ("histogram", "Generation job duration by final status.", LATENCY_BUCKETS),
+    "qgen_job_attempts": ("histogram", "Generation attempts per job, summed over its shards.",
+                          (1, 2, 3, 4, 5, 10, 15)),
+    "qgen_job_shards": ("histogram", "Parallel shards a generation job was split into.", (1, 2, 3, 4, 5, 10)),
+    "qgen_tokens_per_question": (
+        "histogram", "OpenAI tokens spent per accepted question, per job.",
+        (100, 250, 500, 1000, 2000, 5000, 10000),
+    ),
+    "qgen_jobs_total": ("counter", "Finished generation jobs by status.", None),
+    "qgen_tokens_total": ("counter", "OpenAI tokens by kind (prompt, output).", None),
+    "qgen_questions_generated_total": ("counter", "Questions returned by OpenAI.", None),
+    "qgen_duplicates_total": ("counter", "Generated questions rejected as duplicates, by dedup stage.", None),
+    "qgen_questions_stored_total": ("counter", "Generated questions stored in the bank.", None),
+    "qgen_surplus_questions_total": (
+        "counter", "Unique questions over-generated beyond what their job needed, left in the bank.", None,
+    ),
+    "qgen_pool_requests_total": ("counter", "Question requests fully served from the pool (hit) or not (miss).", None),
+    "qgen_pool_questions_total": ("counter", "Questions requested and served from the pool.", None),
+    "qgen_hash_filter_total": (
+        "counter", "Exact-hash filter lookups: definitely new, possible duplicate, confirmed in Mongo.", None,
+    ),
+    "qgen_queue_wait_seconds": ("histogram", "Time a job waited in its scheduler lane before a worker took it.",
+                                LATENCY_BUCKETS),
+    "qgen_jobs_enqueued_total": ("counter", "Generation jobs queued, by scheduler lane.", None),
+    "qgen_lane_depth": ("gauge", "Jobs waiting in each scheduler lane.", None),
+}
+
+_lock = threading.Lock()
+_pending = {}
+# (name, sorted label items) -> per-bucket counts (last one is +Inf), sum and count
+_histograms = {}
+_publisher = None
+
+
+def _series(name: str, labels: dict) -> str:
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{key}="{labels[key]}"' for key in sorted(labels)) + "}"
+
+
+def inc(name: str, value: float = 1, **labels):
+    series = _series(name, labels)
+    with _lock:
+        _pending[series] = _pending.get(series, 0) + value
+
+
+def observe(name: str, value: float, **labels):
+    buckets = METRICS[name][2]
+    key = (name, tuple(sorted(labels.items())))
+    index = bisect.bisect_left(buckets, value)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * (len(buckets) + 3)
+        histogram[index] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+
+@contextlib.contextmanager
+def timer(name: str = "qgen_stage_seconds", **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def _bucket_prefix(name: str, labels: str) -> str:
+    # `le` always goes last
+    return f"{name}_bucket{{{labels}," if labels else f"{name}_bucket{{"
+
+
+def _expand(histograms: dict, into: dict):
+    """Add histogram counts to `into` as cumulative Prometheus bucket series."""
+    for (name, labels), histogram in histograms.items():
+        labels = dict(labels)
+        prefix = _bucket_prefix(name, _series("", labels)[1:-1])
+        cumulative = 0
+        for bound, count in zip(METRICS[name][2] + ("+Inf",), histogram):
+            cumulative += count
+            if cumulative:
+                series = f'{prefix}le="{bound}"}}'
+                into[series] = into.get(series, 0) + cumulative
+        for suffix, value in (("_sum", histogram[-2]), ("_count", histogram[-1])):
+            series = _series(name + suffix, labels)
+            into[series] = into.get(series, 0) + value
+
+
+def push(redis_conn) -> int:
+    """Add the increments recorded since the last push to the shared hash."""
+    global _pending, _histograms
+    with _lock:
+        pending, _pending = _pending, {}
+        histograms, _histograms = _histograms, {}
+    _expand(histograms, pending)
+    if not pending:
+        return 0
+    try:
+        pipe = redis_conn.pipeline(transaction=False)
+        for series, value in pending.items():
+            pipe.hincrbyfloat(METRICS_KEY, series, value)
+        pipe.execute()
+    except Exception:
+        with _lock:
+            for series, value in pending.items():
+                _pending[series] = _pending.get(series, 0) + value
+        raise
+    return len(pending)
+
+
+def _publish_loop(redis_conn, interval: float):
+    while True:
+        time.sleep(interval)
+        try:
+            push(redis_conn)
+        except Exception as e:
+            logger.error(f"Error pushing metrics: {e}")
+
+
+def start_publisher(redis_conn, interval: float = METRICS_PUSH_INTERVAL):
+    global _publisher
+    if _publisher is None or not _publisher.is_alive():
+        _publisher = threading.Thread(target=_publish_loop, args=(redis_conn, interval), name="metrics", daemon=True)
+        _publisher.start()
+
+
+def _base_name(series: str) -> str:
+    name = series.split("{", 1)[0]
+    for suffix in ("_bucket", "_sum", "_count"):
+        if name.endswith(suffix) and name[: -len(suffix)] in METRICS:
+            return name[: -len(suffix)]
+    return name
+
+
+def _sort_key(series: str):
+    # Group a histogram's lines by label set, buckets in increasing order before _sum and _count
+    name, _, labels = series.partition("{")
+    labels = labels.rstrip("}").split(",") if labels else []
+    bound = [label for label in labels if label.startswith("le=")]
+    others = ",".join(label for label in labels if not label.startswith("le="))
+    if bound:
+        value = bound[0][4:-1]
+        return others, 0, float("inf") if value == "+Inf" else float(value)
+    return others, 1 if name.endswith("_sum") else 2, 0
+
+
+def gauge(name: str, value: float, **labels) -> tuple:
+    """A (series, value) pair read at scrape time, for render(gauges=...)."""
+    return _series(name, labels), value
+
+
+def render(redis_conn, gauges: list = ()) -> str:
+    """Prometheus text exposition of the shared totals, plus point-in-time `gauges`."""
+    raw = redis_conn.hgetall(METRICS_KEY)
+    families = {}
+    for series, value in list(raw.items()) + list(gauges):
+        series = series.decode("utf-8") if isinstance(series, bytes) else series
+        families.setdefault(_base_name(series), []).append((series, float(value)))
+    for name, series_values in families.items():
+        if name in METRICS and METRICS[name][0] == "histogram":
+            # Buckets nothing has fallen into yet were never written; expose them as 0
+            present = {series for series, _ in series_values}
+            for series, _ in list(series_values):
+                if series.startswith(name + "_count"):
+                    prefix = _bucket_prefix(name, series[len(name + "_count"):].strip("{}"))
+                    for bound in METRICS[name][2]:
+                        bucket = f'{prefix}le="{bound}"}}'
+                        if bucket not in present:
+                            series_values.append((bucket, 0.0))
+    lines = []
+    for name in sorted(families):
+        if name in METRICS:
+            kind, help_text, _ = METRICS[name]
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+        for series, value in sorted(families[name], key=lambda item: _sort_key(item[0])):
+            lines.append(f"{series} {value:.17g}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,155 @@
+"""
+Over-generation: ask OpenAI for enough extra questions that the job usually
+finishes in one attempt.
+
+Every retry after dedup rejects questions is another full round trip, with a
+prompt that grows by the list of duplicates. Instead the worker asks for
+N + k questions up front and keeps N. k comes from the duplicate rate seen so
+far for the request's (technology, difficulty, concept) buckets, recorded in
+`dedup_stats` after every attempt:
+
+    {technology, difficulty, concept, generated, duplicates, updated_at}
+
+A concept's rate is shrunk towards its technology's rate, and that one
+towards OVERGEN_PRIOR_RATE, each with OVERGEN_PRIOR_WEIGHT questions of
+weight, so a new or rarely asked bucket gets a sensible k. k is the smallest
+number for which N unique questions are still expected OVERGEN_CONFIDENCE_Z
+standard deviations below the mean; it is capped by OVERGEN_MAX_EXTRA and
+MAX_QUESTIONS_PER_CALL.
+
+The questions a job does not keep are unique and already stored, so they stay
+in the bank for the pool to serve later.
+
+    python overgeneration.py --stats React
+"""
+import argparse
+import logging
+import math
+import os
+import time
+from collections import defaultdict
+
+from pymongo import ASCENDING, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+OVERGENERATION = os.getenv("OVERGENERATION", "1") == "1"
+OVERGEN_PRIOR_RATE = float(os.getenv("OVERGEN_PRIOR_RATE", "0.1"))
+OVERGEN_PRIOR_WEIGHT = float(os.getenv("OVERGEN_PRIOR_WEIGHT", "50"))
+OVERGEN_CONFIDENCE_Z = float(os.getenv("OVERGEN_CONFIDENCE_Z", "1.0"))
+OVERGEN_MAX_EXTRA = int(os.getenv("OVERGEN_MAX_EXTRA", "10"))
+# Questions asked for in one call at most; longer tool outputs get slow and truncated
+MAX_QUESTIONS_PER_CALL = int(os.getenv("MAX_QUESTIONS_PER_CALL", "20"))
+STATS_COLLECTION = "dedup_stats"
+
+
+def ensure_indexes(db):
+    db[STATS_COLLECTION].create_index(
+        [("technology", ASCENDING), ("difficulty", ASCENDING), ("concept", ASCENDING)], unique=True
+    )
+
+
+def _question_concepts(question: dict, concepts: list) -> list:
+    # Requested concepts the question is tagged with; untagged ones count towards all of them
+    tags = {tag.strip().lower() for tag in question.get("tags", [])}
+    return [concept for concept in concepts if concept in tags] or concepts
+
+
+def record_attempt(db, technology: str, difficulty: str, concepts: list, generated: list, accepted: list):
+    """Add one attempt's questions and the ones dedup rejected to the concept counters."""
+    accepted_ids = {id(question) for question in accepted}
+    counts = defaultdict(lambda: [0, 0])
+    for question in generated:
+        for concept in _question_concepts(question, concepts):
+            counts[concept][0] += 1
+            counts[concept][1] += id(question) not in accepted_ids
+    if not counts:
+        return
+    now = int(time.time())
+    db[STATS_COLLECTION].bulk_write([
+        UpdateOne(
+            {"technology": technology, "difficulty": difficulty, "concept": concept},
+            {"$inc": {"generated": generated_count, "duplicates": duplicate_count}, "$set": {"updated_at": now}},
+            upsert=True,
+        )
+        for concept, (generated_count, duplicate_count) in counts.items()
+    ], ordered=False)
+
+
+def _shrunk(duplicates: float, generated: float, prior: float) -> float:
+    return (duplicates + prior * OVERGEN_PRIOR_WEIGHT) / (generated + OVERGEN_PRIOR_WEIGHT)
+
+
+def duplicate_rate(db, technology: str, difficulty: str, concepts: list) -> float:
+    """Expected share of a request's generated questions that dedup will reject."""
+    docs = list(db[STATS_COLLECTION].find(
+        {"technology": technology, "difficulty": difficulty},
+        {"concept": 1, "generated": 1, "duplicates": 1, "_id": 0},
+    ))
+    technology_rate = _shrunk(
+        sum(doc.get("duplicates", 0) for doc in docs), sum(doc.get("generated", 0) for doc in docs),
+        OVERGEN_PRIOR_RATE,
+    )
+    by_concept = {doc["concept"]: doc for doc in docs}
+    rates = []
+    for concept in concepts or [None]:
+        doc = by_concept.get(concept)
+        rates.append(_shrunk(doc.get("duplicates", 0), doc.get("generated", 0), technology_rate)
+                     if doc else technology_rate)
+    return sum(rates) / len(rates)
+
+
+def extra_questions(rate: float, needed: int) -> int:
+    """How many questions to ask for on top of `needed`, given the duplicate rate."""
+    if not OVERGENERATION or needed <= 0:
+        return 0
+    rate = min(max(rate, 0.0), 0.95)
+    limit = max(needed, min(needed + OVERGEN_MAX_EXTRA, MAX_QUESTIONS_PER_CALL))
+    asked = needed
+    while asked < limit:
+        unique = asked * (1 - rate) - OVERGEN_CONFIDENCE_Z * math.sqrt(asked * rate * (1 - rate))
+        if unique >= needed:
+            break
+        asked += 1
+    return asked - needed
+
+
+def select_questions(candidates: list, concepts: list, count: int, kept: list = ()) -> list:
+    """
+    Up to `count` of `candidates` to keep, spreading them over the requested
+    concepts: each pick goes to the concept with the fewest questions so far
+    (counting `kept`), earliest candidate first.
+    """
+    if count >= len(candidates):
+        return list(candidates)
+    if count <= 0:
+        return []
+    picked_per_concept = defaultdict(int)
+    for question in kept:
+        picked_per_concept[_question_concepts(question, concepts)[0]] += 1
+    remaining = list(candidates)
+    picked = []
+    while len(picked) < count:
+        best = min(range(len(remaining)),
+                   key=lambda index: (picked_per_concept[_question_concepts(remaining[index], concepts)[0]], index))
+        question = remaining.pop(best)
+        picked_per_concept[_question_concepts(question, concepts)[0]] += 1
+        picked.append(question)
+    # Keep the order OpenAI returned them in
+    order = {id(question): index for index, question in enumerate(candidates)}
+    return sorted(picked, key=lambda question: order[id(question)])
+
+
+if __name__ == "__main__":
+    from db_manager import get_mongo_connection
+
+    parser = argparse.ArgumentParser(description="Duplicate rates behind over-generation.")
+    parser.add_argument("--stats", metavar="TECHNOLOGY", help="print the recorded rates of a technology")
+    args = parser.parse_args()
+    if args.stats:
+        db = get_mongo_connection()
+        for doc in db[STATS_COLLECTION].find({"technology": args.stats}).sort(
+                [("difficulty", ASCENDING), ("concept", ASCENDING)]):
+            rate = duplicate_rate(db, doc["technology"], doc["difficulty"], [doc["concept"]])
+            print(f"{doc['difficulty']:<10} {doc['concept']:<30} generated {doc['generated']:>6} "
+                  f"duplicates {doc['duplicates']:>6} rate {rate:.3f} extra for 10: {extra_questions(rate, 10)}")
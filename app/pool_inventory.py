@@ -0,0 +1,124 @@
+"""
+Question pool inventory and demand, per bucket.
+
+A bucket is (technology, difficulty, concept, strict flag), plus the company
+for strict buckets since those questions are only served to the company that
+generated them. The API records every generate_ai_question call against the
+buckets of its concepts: demand in a Redis sorted set, used by replenisher.py
+to decide what to refill first, and hit/miss counters served by /pool_stats.
+"""
+import os
+
+from pymongo import ASCENDING
+
+import metrics
+from question_usage import ANY_COMPANY, find_unused
+
+POOL_LOW_WATER = int(os.getenv("POOL_LOW_WATER", "30"))
+POOL_HIGH_WATER = int(os.getenv("POOL_HIGH_WATER", "60"))
+
+DEMAND_KEY = "pool:demand"
+STATS_PREFIX = "pool:stats:"
+SHARED, STRICT = "shared", "strict"
+
+
+def bucket_key(technology: str, difficulty: str, concept: str, strict: bool, company_id: str = None) -> str:
+    parts = [technology, difficulty, concept, STRICT if strict else SHARED]
+    if strict:
+        parts.append(company_id)
+    return "|".join(parts)
+
+
+def parse_bucket_key(key: str) -> dict:
+    parts = key.split("|")
+    return {
+        "technology": parts[0],
+        "difficulty": parts[1],
+        "concept": parts[2],
+        "strict": parts[3] == STRICT,
+        "company_id": parts[4] if len(parts) > 4 else None,
+    }
+
+
+def request_buckets(request) -> list:
+    return [
+        bucket_key(request.technology_name, request.difficulty_level, concept, request.strict_question,
+                   request.company_Id)
+        for concept in request.concepts
+    ]
+
+
+def record_request(redis_conn, request, requested: int, served: int):
+    """Count demand and a hit (fully served from the pool) or miss for each bucket of a request."""
+    buckets = request_buckets(request)
+    hit = served >= requested
+    pipe = redis_conn.pipeline(transaction=False)
+    for key in buckets:
+        pipe.zincrby(DEMAND_KEY, requested / len(buckets), key)
+        stats_key = STATS_PREFIX + key
+        pipe.hincrby(stats_key, "requests", 1)
+        pipe.hincrby(stats_key, "hits" if hit else "misses", 1)
+        pipe.hincrby(stats_key, "questions_requested", requested)
+        pipe.hincrby(stats_key, "questions_served", served)
+    pipe.execute()
+    metrics.inc("qgen_pool_requests_total", result="hit" if hit else "miss")
+    metrics.inc("qgen_pool_questions_total", requested, kind="requested")
+    metrics.inc("qgen_pool_questions_total", served, kind="served")
+
+
+def top_buckets(redis_conn, limit: int) -> list:
+    """(bucket key, demand) pairs, most requested first."""
+    return [
+        (key.decode("utf-8") if isinstance(key, bytes) else key, score)
+        for key, score in redis_conn.zrevrange(DEMAND_KEY, 0, limit - 1, withscores=True)
+    ]
+
+
+def pool_stats(redis_conn, limit: int = 100) -> list:
+    buckets = top_buckets(redis_conn, limit)
+    pipe = redis_conn.pipeline(transaction=False)
+    for key, _ in buckets:
+        pipe.hgetall(STATS_PREFIX + key)
+    stats = []
+    for (key, demand), counters in zip(buckets, pipe.execute()):
+        counters = {field.decode("utf-8"): int(value) for field, value in counters.items()}
+        requests = counters.get("requests", 0)
+        requested = counters.get("questions_requested", 0)
+        stats.append({
+            **parse_bucket_key(key),
+            "demand": round(demand, 2),
+            "requests": requests,
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "hit_rate": round(counters.get("hits", 0) / requests, 4) if requests else None,
+            "fill_rate": round(counters.get("questions_served", 0) / requested, 4) if requested else None,
+        })
+    return stats
+
+
+def bucket_filter(bucket: dict) -> dict:
+    query = {
+        "metadata.technology": bucket["technology"],
+        "metadata.difficulty": bucket["difficulty"],
+        "question.tags": bucket["concept"],
+        "strict_question": bucket["strict"],
+    }
+    if bucket["strict"]:
+        query["generated_by"] = bucket["company_id"]
+    return query
+
+
+def count_stock(db, redis_conn, bucket: dict) -> int:
+    """Questions of a bucket no company has used yet (strict ones: not used by their company), up to POOL_HIGH_WATER."""
+    company_id = bucket["company_id"] if bucket["strict"] else ANY_COMPANY
+    return len(find_unused(db, redis_conn, company_id, bucket_filter(bucket), {"_id": 1}, POOL_HIGH_WATER))
+
+
+def ensure_indexes(db):
+    # Pool lookups and stock counts filter on exactly these fields
+    db["generated_questions"].create_index([
+        ("metadata.technology", ASCENDING),
+        ("metadata.difficulty", ASCENDING),
+        ("question.tags", ASCENDING),
+        ("strict_question", ASCENDING),
+    ])
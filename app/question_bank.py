@@ -0,0 +1,168 @@
+"""
+In-memory copy of the question bank for long-lived worker processes.
+
+A QuestionBank holds what deduplication reads for one (technology, difficulty)
+pair: exact hashes, deserialized MinHash signatures, LSH buckets, tags and the
+TF-IDF model. It is loaded once and then kept current with an indexed query for
+questions created since the last refresh, so checking a generated set costs one
+small query instead of pulling every candidate document again.
+
+Only worth keeping in a process that outlives its jobs (async_worker.py);
+a one-off process would load the whole bank and throw it away.
+"""
+import logging
+import os
+import threading
+from collections import defaultdict
+
+from pymongo import ASCENDING
+
+from tfidf_minhash import (drop_tfidf_model, get_normalized_question, get_stored_signature,
+                           get_tfidf_model)
+
+logger = logging.getLogger(__name__)
+
+# Seconds re-read on every refresh; created_at only has one second resolution
+# and concurrent inserts from other workers can land slightly out of order
+BANK_REFRESH_OVERLAP = int(os.getenv("BANK_REFRESH_OVERLAP", "5"))
+
+
+class QuestionBank:
+    def __init__(self, metadata: dict, minhash, lsh=None):
+        self.metadata = {"technology": metadata["technology"], "difficulty": metadata["difficulty"]}
+        self.minhash = minhash
+        self.lsh = lsh
+        self.model = get_tfidf_model(self.metadata)
+        self.hashes = set()
+        self._documents = {}
+        self._signatures = {}
+        self._buckets = defaultdict(set)
+        # Tag -> ids of the questions carrying it
+        self.by_tag = defaultdict(set)
+        self._tags_of = {}
+        self._last_created_at = None
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def _projection(self) -> dict:
+        return {
+            "question.id": 1,
+            "question.question": 1,
+            "question.tags": 1,
+            "normalized_question": 1,
+            "hash": 1,
+            "created_at": 1,
+            f"signatures.{self.minhash.name}": 1,
+        }
+
+    def refresh(self, collection):
+        """Load questions created since the previous refresh (everything on the first call)."""
+        query = dict(("metadata." + field, value) for field, value in self.metadata.items())
+        with self._lock:
+            if self._last_created_at is not None:
+                query["created_at"] = {"$gte": self._last_created_at - BANK_REFRESH_OVERLAP}
+            added = 0
+            for doc in collection.find(query, self._projection()):
+                added += self.add(doc)
+        if added:
+            logger.info(f"Question bank {self.metadata} +{added} questions ({len(self)} total)")
+        return added
+
+    def add(self, doc: dict, signature=None) -> int:
+        question_id = doc["question"]["id"]
+        with self._lock:
+            if question_id in self._documents:
+                return 0
+            if signature is None:
+                signature = get_stored_signature(doc, self.minhash)
+            tags = doc["question"].get("tags", [])
+            self._documents[question_id] = {
+                "question": {"id": question_id, "tags": tags},
+                "normalized_question": get_normalized_question(doc),
+            }
+            self._signatures[question_id] = signature
+            if doc.get("hash"):
+                self.hashes.add(doc["hash"])
+            if self.lsh is not None:
+                for key in self.lsh.band_keys(signature):
+                    self._buckets[key].add(question_id)
+            for tag in tags:
+                self.by_tag[tag].add(question_id)
+            self._tags_of[question_id] = frozenset(tags)
+            self.model.add(question_id, self._documents[question_id]["normalized_question"])
+            created_at = doc.get("created_at")
+            if created_at is not None and (self._last_created_at is None or created_at > self._last_created_at):
+                self._last_created_at = created_at
+        return 1
+
+    def find(self, tags, band_keys=None) -> list:
+        """Documents sharing a tag and, when band keys are given, an LSH bucket."""
+        with self._lock:
+            if band_keys is not None:
+                # Band buckets are small; a tag's bucket can be a good part of the bank
+                tags = set(tags)
+                question_ids = {
+                    question_id for question_id in set().union(*(self._buckets.get(key, ()) for key in band_keys))
+                    if not self._tags_of[question_id].isdisjoint(tags)
+                }
+            else:
+                question_ids = set().union(*(self.by_tag.get(tag, ()) for tag in tags))
+            return [self._documents[question_id] for question_id in sorted(question_ids)]
+
+    def signature(self, doc: dict):
+        return self._signatures[doc["question"]["id"]]
+
+
+class QuestionBankCache:
+    """QuestionBank per (technology, difficulty), created and loaded on first use."""
+
+    def __init__(self, db, minhash, lsh=None):
+        self.db = db
+        self.minhash = minhash
+        self.lsh = lsh
+        self._banks = {}
+        self._lock = threading.Lock()
+
+    def get(self, metadata: dict) -> QuestionBank:
+        key = (metadata["technology"], metadata["difficulty"])
+        with self._lock:
+            if key not in self._banks:
+                self._banks[key] = QuestionBank(metadata, self.minhash, self.lsh)
+            return self._banks[key]
+
+    def preload(self, technologies=None) -> int:
+        """Load every (technology, difficulty) bank up front, optionally only for some technologies."""
+        collection = self.db["generated_questions"]
+        query = {} if technologies is None else {"metadata.technology": {"$in": sorted(technologies)}}
+        pairs = collection.distinct("metadata", query)
+        loaded = 0
+        for metadata in pairs:
+            if "technology" in metadata and "difficulty" in metadata:
+                loaded += self.get(metadata).refresh(collection)
+        logger.info(f"Preloaded {loaded} questions into {len(self._banks)} question banks")
+        return loaded
+
+    def discard(self, metadata: dict):
+        """Forget a bank and its TF-IDF model so the next job reloads both from Mongo."""
+        key = (metadata["technology"], metadata["difficulty"])
+        with self._lock:
+            self._banks.pop(key, None)
+            drop_tfidf_model(metadata)
+        logger.warning(f"Discarded question bank {key}")
+
+    def clear(self):
+        with self._lock:
+            for technology, difficulty in list(self._banks):
+                drop_tfidf_model({"technology": technology, "difficulty": difficulty})
+            self._banks.clear()
+
+
+def ensure_indexes(db):
+    # Incremental refreshes read only recently created questions of one bank
+    db["generated_questions"].create_index([
+        ("metadata.technology", ASCENDING),
+        ("metadata.difficulty", ASCENDING),
+        ("created_at", ASCENDING),
+    ])
@@ -0,0 +1,158 @@
+"""
+Which companies have used which questions.
+
+The durable record is the `question_usage` collection, one small document per
+(company_id, question_id). Lookups are served from a Redis bitmap per company
+(`used:<company_id>`, bit N set when question N was used) plus one for any
+company (`used:*`), so the pool query fetches candidates by an indexed
+technology/difficulty/tag lookup and drops used ids with one pipelined GETBIT
+round trip per batch. A bitmap is rebuilt from Mongo the first time it is
+needed, so Redis can be flushed without losing anything.
+
+Move the old `companies_used_by` arrays over with:
+
+    python question_usage.py --migrate [--unset]
+"""
+import argparse
+import logging
+import os
+import time
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+USED_PREFIX = "used:"
+ANY_COMPANY = "*"
+LOADED_KEY = "used:loaded"
+# Candidates checked against the bitmap per Redis round trip
+POOL_SCAN_BATCH = int(os.getenv("POOL_SCAN_BATCH", "200"))
+REBUILD_BATCH = 10000
+
+
+def _key(company_id: str) -> str:
+    return USED_PREFIX + company_id
+
+
+def ensure_indexes(db):
+    db["question_usage"].create_index([("company_id", ASCENDING), ("question_id", ASCENDING)], unique=True)
+    db["question_usage"].create_index([("question_id", ASCENDING)])
+
+
+def ensure_loaded(db, redis_conn, company_id: str):
+    """Rebuild a company's bitmap from question_usage unless it is already in Redis."""
+    if redis_conn.sismember(LOADED_KEY, company_id):
+        return
+    query = {} if company_id == ANY_COMPANY else {"company_id": company_id}
+    pipe = redis_conn.pipeline(transaction=False)
+    loaded = 0
+    for doc in db["question_usage"].find(query, {"_id": 0, "question_id": 1}).batch_size(REBUILD_BATCH):
+        pipe.setbit(_key(company_id), doc["question_id"], 1)
+        loaded += 1
+        if loaded % REBUILD_BATCH == 0:
+            pipe.execute()
+    pipe.sadd(LOADED_KEY, company_id)
+    pipe.execute()
+    logger.info(f"Loaded {loaded} used questions for company {company_id}")
+
+
+def mark_used(db, redis_conn, company_id: str, question_ids: list) -> int:
+    """Record questions as used by a company; returns how many were not already recorded."""
+    if not question_ids:
+        return 0
+    now = int(time.time())
+    try:
+        result = db["question_usage"].bulk_write([
+            UpdateOne({"company_id": company_id, "question_id": question_id},
+                      {"$setOnInsert": {"used_at": now}}, upsert=True)
+            for question_id in question_ids
+        ], ordered=False)
+        added = result.upserted_count
+    except BulkWriteError as e:
+        # A concurrent call for the same pair loses the upsert race; the record exists either way
+        added = e.details.get("nUpserted", 0)
+    ensure_loaded(db, redis_conn, company_id)
+    ensure_loaded(db, redis_conn, ANY_COMPANY)
+    pipe = redis_conn.pipeline(transaction=False)
+    for question_id in question_ids:
+        pipe.setbit(_key(company_id), question_id, 1)
+        pipe.setbit(_key(ANY_COMPANY), question_id, 1)
+    pipe.execute()
+    return added
+
+
+def used_flags(redis_conn, company_id: str, question_ids: list) -> list:
+    pipe = redis_conn.pipeline(transaction=False)
+    for question_id in question_ids:
+        pipe.getbit(_key(company_id), question_id)
+    return [bool(bit) for bit in pipe.execute()]
+
+
+def find_unused(db, redis_conn, company_id: str, query: dict, projection: dict, limit: int) -> list:
+    """Up to `limit` generated_questions matching `query` that the company has not used."""
+    ensure_loaded(db, redis_conn, company_id)
+    if "question" not in projection:
+        projection = dict(projection, **{"question.id": 1})
+    found, chunk = [], []
+    cursor = db["generated_questions"].find(query, projection).batch_size(POOL_SCAN_BATCH)
+    for doc in cursor:
+        chunk.append(doc)
+        if len(chunk) < POOL_SCAN_BATCH:
+            continue
+        found.extend(_drop_used(redis_conn, company_id, chunk))
+        chunk = []
+        if len(found) >= limit:
+            break
+    if chunk and len(found) < limit:
+        found.extend(_drop_used(redis_conn, company_id, chunk))
+    cursor.close()
+    return found[:limit]
+
+
+def _drop_used(redis_conn, company_id: str, docs: list) -> list:
+    flags = used_flags(redis_conn, company_id, [doc["question"]["id"] for doc in docs])
+    return [doc for doc, used in zip(docs, flags) if not used]
+
+
+def migrate(db, redis_conn, unset: bool = False, batch_size: int = 1000) -> int:
+    """Copy every companies_used_by array into question_usage and reset the bitmaps."""
+    ensure_indexes(db)
+    migrated = 0
+    operations = []
+    cursor = db["generated_questions"].find(
+        {"companies_used_by.0": {"$exists": True}}, {"question.id": 1, "companies_used_by": 1, "created_at": 1}
+    )
+    for doc in cursor:
+        for company_id in doc["companies_used_by"]:
+            operations.append(UpdateOne(
+                {"company_id": company_id, "question_id": doc["question"]["id"]},
+                {"$setOnInsert": {"used_at": doc.get("created_at", 0)}},
+                upsert=True,
+            ))
+        if len(operations) >= batch_size:
+            migrated += db["question_usage"].bulk_write(operations, ordered=False).upserted_count
+            operations = []
+    if operations:
+        migrated += db["question_usage"].bulk_write(operations, ordered=False).upserted_count
+    if unset:
+        db["generated_questions"].update_many({"companies_used_by": {"$exists": True}},
+                                              {"$unset": {"companies_used_by": ""}})
+    # Bitmaps are rebuilt from question_usage on next use
+    loaded = [company.decode("utf-8") for company in redis_conn.smembers(LOADED_KEY)]
+    redis_conn.delete(LOADED_KEY, *[_key(company) for company in loaded])
+    return migrated
+
+
+if __name__ == "__main__":
+    from db_manager import get_mongo_connection, get_redis_connection
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Per-company question usage maintenance.")
+    parser.add_argument("--migrate", action="store_true", help="copy companies_used_by arrays into question_usage")
+    parser.add_argument("--unset", action="store_true", help="remove companies_used_by after migrating")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    if args.migrate:
+        count = migrate(get_mongo_connection(), get_redis_connection(), args.unset, args.batch_size)
+        print(f"Migrated {count} usage records.")
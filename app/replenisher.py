@@ -0,0 +1,109 @@
+"""
+Background replenisher for the question pool.
+
+Every REPLENISH_INTERVAL seconds it walks the most requested buckets (see
+pool_inventory.py), counts the unused questions in each and, for any bucket
+below POOL_LOW_WATER, enqueues a generation job in the "refill" lane to bring
+it back towards POOL_HIGH_WATER. Workers serve the interactive and bulk lanes
+first (scheduler.py), so refills only use capacity that requests leave.
+Demand decays every cycle so the order follows recent traffic.
+
+    python replenisher.py
+    python replenisher.py --once
+"""
+import argparse
+import logging
+import os
+import time
+import uuid
+
+from db_manager import get_mongo_connection, get_redis_connection
+from jobs import GenerateQuestionRequestModel, enqueue_generation
+from pool_inventory import (DEMAND_KEY, POOL_HIGH_WATER, POOL_LOW_WATER, count_stock, ensure_indexes,
+                            parse_bucket_key, top_buckets)
+from question_usage import ensure_indexes as ensure_usage_indexes
+from scheduler import depth
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+REPLENISH_INTERVAL = int(os.getenv("REPLENISH_INTERVAL", "30"))
+REPLENISH_TOP_BUCKETS = int(os.getenv("REPLENISH_TOP_BUCKETS", "50"))
+# Multiplier applied to every bucket's demand once per cycle
+REPLENISH_DEMAND_DECAY = float(os.getenv("REPLENISH_DEMAND_DECAY", "0.95"))
+REPLENISH_STRICT = os.getenv("REPLENISH_STRICT", "1") == "1"
+# Refill jobs allowed to wait in the lane at once
+REFILL_MAX_QUEUED = int(os.getenv("REFILL_MAX_QUEUED", "20"))
+# A bucket is not refilled again until its last refill had time to land
+REFILL_INFLIGHT_TTL = int(os.getenv("REFILL_INFLIGHT_TTL", "300"))
+REFILL_COMPANY_ID = "replenisher"
+MAX_QUESTIONS_PER_JOB = 10
+
+
+def refill_request(bucket: dict, count: int) -> GenerateQuestionRequestModel:
+    return GenerateQuestionRequestModel(
+        technology_name=bucket["technology"],
+        concepts=[bucket["concept"]],
+        difficulty_level=bucket["difficulty"],
+        number_of_questions=count,
+        # Strict questions belong to the company that asked for them
+        company_Id=bucket["company_id"] if bucket["strict"] else REFILL_COMPANY_ID,
+        strict_question=bucket["strict"],
+    )
+
+
+def replenish_once(db, redis_conn) -> list:
+    """One pass over the most requested buckets; returns the keys of buckets a refill was enqueued for."""
+    enqueued = []
+    for key, demand in top_buckets(redis_conn, REPLENISH_TOP_BUCKETS):
+        queued = depth(redis_conn, "refill")
+        if queued >= REFILL_MAX_QUEUED:
+            logger.info(f"Refill lane holds {queued} jobs, waiting for the workers to catch up")
+            break
+        bucket = parse_bucket_key(key)
+        if bucket["strict"] and not REPLENISH_STRICT:
+            continue
+        stock = count_stock(db, redis_conn, bucket)
+        if stock >= POOL_LOW_WATER:
+            continue
+        if not redis_conn.set(f"pool:refill:{key}", "1", nx=True, ex=REFILL_INFLIGHT_TTL):
+            continue
+        count = min(MAX_QUESTIONS_PER_JOB, POOL_HIGH_WATER - stock)
+        job_id = f"refill-{uuid.uuid4()}"
+        enqueue_generation(redis_conn, refill_request(bucket, count), job_id, [], lane="refill",
+                           job_id=job_id, result_ttl=0)
+        logger.info(f"Refilling {key} (stock {stock}, demand {demand:.1f}) with {count} questions")
+        enqueued.append(key)
+    return enqueued
+
+
+def decay_demand(redis_conn):
+    redis_conn.zunionstore(DEMAND_KEY, {DEMAND_KEY: REPLENISH_DEMAND_DECAY})
+
+
+def run(db, redis_conn, interval: int = REPLENISH_INTERVAL, once: bool = False):
+    ensure_indexes(db)
+    ensure_usage_indexes(db)
+    while True:
+        started = time.monotonic()
+        try:
+            replenish_once(db, redis_conn)
+            decay_demand(redis_conn)
+        except Exception as e:
+            logger.error(f"Replenish cycle failed: {e}")
+        if once:
+            return
+        time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep the question pool stocked ahead of demand.")
+    parser.add_argument("--interval", type=int, default=REPLENISH_INTERVAL)
+    parser.add_argument("--once", action="store_true", help="run a single cycle and exit")
+    args = parser.parse_args()
+
+    db = get_mongo_connection()
+    redis_conn = get_redis_connection()
+    if db is None or redis_conn is None:
+        raise SystemExit("Replenisher needs both Mongo and Redis.")
+    run(db, redis_conn, args.interval, args.once)
@@ -0,0 +1,215 @@
+"""
+Priority lanes and per-company fair queueing for generation jobs.
+
+Jobs go into one of three lanes, each a sorted set `sched:<lane>` of rq job
+ids:
+
+    interactive   requests that need fewer than BULK_MIN_QUESTIONS new questions
+    bulk          larger requests
+    refill        pool refills from replenisher.py
+
+Workers pop with one BZPOPMIN over the lanes in that order, so a lane is only
+served while the lanes before it are empty; an interactive request never
+waits behind bulk or refill work that has not started yet. Jobs are not
+preempted, so async_worker.py also keeps a share of its slots for the
+interactive lane; otherwise a worker full of long bulk jobs would still make
+interactive requests wait for one of them to finish.
+
+Inside a lane, companies share the workers by weight (self-clocked fair
+queueing). A job's score is its finish tag:
+
+    finish = max(lane virtual time, company's previous finish) + cost / weight
+
+where cost is the number of questions it has to generate and the lane's
+virtual time is the tag of the job most recently popped. A company that
+drops a burst of jobs gets tags far ahead of the others, so a job another
+company submits later still goes in front of the rest of the burst. Weights
+default to 1 and come from COMPANY_WEIGHTS ("acme=2,trial=0.5").
+
+The rq job itself is saved as usual (queued status, origin queue "default",
+"bulk" or "refill"), only its id skips the rq list. Jobs found on those rq
+lists, e.g. enqueued before the lanes existed, are still run first.
+
+Popping a job takes it out of its lane, so a worker claims it right away in
+`sched:started`, scored by when its lease runs out, and renews the lease
+while the job runs (async_worker.py). A job whose lease ran out belonged to a
+worker that was killed; recover() puts it back at the head of its lane, or
+only drops it from `sched:started` when it has been recovered too often and
+should be failed instead.
+"""
+import logging
+import os
+import time
+
+import redis
+from rq import Queue
+from rq.exceptions import NoSuchJobError
+from rq.job import Job
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+LANES = ("interactive", "bulk", "refill")
+# rq queue each lane's jobs belong to (job.origin, failed job registry)
+LANE_QUEUES = {"interactive": "default", "bulk": "bulk", "refill": "refill"}
+QUEUE_LANES = {queue: lane for lane, queue in LANE_QUEUES.items()}
+BULK_MIN_QUESTIONS = int(os.getenv("BULK_MIN_QUESTIONS", "8"))
+SCHED_PREFIX = "sched:"
+# Virtual time and per-company finish tags of an idle lane are dropped after this long
+SCHED_STATE_TTL = int(os.getenv("SCHED_STATE_TTL", "86400"))
+STARTED_KEY = SCHED_PREFIX + "started"
+# Seconds a started job stays claimed without its worker renewing the lease
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+
+def _parse_weights(value: str) -> dict:
+    weights = {}
+    for item in value.split(","):
+        company, _, weight = item.partition("=")
+        if company.strip() and weight.strip():
+            weights[company.strip()] = float(weight)
+    return weights
+
+
+COMPANY_WEIGHTS = _parse_weights(os.getenv("COMPANY_WEIGHTS", ""))
+
+
+def lane_key(lane: str) -> str:
+    return SCHED_PREFIX + lane
+
+
+def lane_for(request) -> str:
+    return "bulk" if request.number_of_questions >= BULK_MIN_QUESTIONS else "interactive"
+
+
+def push(redis_conn, lane: str, member: str, company_id: str, cost: float) -> float:
+    """Queue `member` in `lane` behind the company's earlier jobs; returns its finish tag."""
+    key = lane_key(lane)
+    vtime_key, finish_key = key + ":vtime", key + ":finish"
+    weight = COMPANY_WEIGHTS.get(company_id, 1.0)
+    with redis_conn.pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(vtime_key, finish_key)
+                vtime, last = pipe.get(vtime_key), pipe.hget(finish_key, company_id)
+                finish = max(float(vtime or 0), float(last or 0)) + max(cost, 1) / weight
+                pipe.multi()
+                pipe.hset(finish_key, company_id, finish)
+                pipe.zadd(key, {member: finish})
+                pipe.expire(finish_key, SCHED_STATE_TTL)
+                pipe.execute()
+                return finish
+            except redis.WatchError:
+                continue
+
+
+def _advance(redis_conn, lane: str, finish: float):
+    # Virtual time only moves forward, however the pops of several workers interleave
+    vtime_key = lane_key(lane) + ":vtime"
+    with redis_conn.pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(vtime_key)
+                if float(pipe.get(vtime_key) or 0) >= finish:
+                    return
+                pipe.multi()
+                pipe.set(vtime_key, finish, ex=SCHED_STATE_TTL)
+                pipe.execute()
+                return
+            except redis.WatchError:
+                continue
+
+
+def pop(redis_conn, lanes=LANES, timeout: int = 0):
+    """Block up to `timeout` seconds for the next job; (lane, member) or None."""
+    result = redis_conn.bzpopmin([lane_key(lane) for lane in lanes], timeout)
+    if result is None:
+        return None
+    key, member, finish = result
+    lane = key.decode("utf-8")[len(SCHED_PREFIX):]
+    _advance(redis_conn, lane, finish)
+    return lane, member.decode("utf-8")
+
+
+def submit(redis_conn, lane: str, func, args: tuple, company_id: str, cost: float, **kwargs) -> Job:
+    """Save an rq job for `func` and queue it in `lane`; kwargs go to Queue.create_job."""
+    queue = Queue(LANE_QUEUES[lane], connection=redis_conn)
+    job = queue.create_job(func, args=args, **kwargs)
+    job.enqueued_at = job.created_at
+    job.save()
+    push(redis_conn, lane, job.id, company_id, cost)
+    metrics.inc("qgen_jobs_enqueued_total", lane=lane)
+    return job
+
+
+def next_job(redis_conn, lanes=LANES, timeout: int = 0):
+    """The next job to run, or None when the lanes stayed empty for `timeout` seconds."""
+    popped = pop(redis_conn, lanes, timeout)
+    if popped is None:
+        return None
+    lane, job_id = popped
+    try:
+        job = Job.fetch(job_id, connection=redis_conn)
+    except NoSuchJobError:
+        logger.warning(f"Job {job_id} left lane {lane} after it expired")
+        return None
+    if job.enqueued_at is not None:
+        metrics.observe("qgen_queue_wait_seconds", time.time() - job.enqueued_at.timestamp(), lane=lane)
+    return job
+
+
+def claim(redis_conn, job_ids: list, renew: bool = False):
+    """Lease `job_ids` to the calling worker for JOB_LEASE_SECONDS; `renew` only extends existing leases."""
+    if not job_ids:
+        return
+    deadline = time.time() + JOB_LEASE_SECONDS
+    redis_conn.zadd(STARTED_KEY, {job_id: deadline for job_id in job_ids}, xx=renew)
+
+
+def finish(redis_conn, job_id: str):
+    redis_conn.zrem(STARTED_KEY, job_id)
+
+
+def expired(redis_conn, now: float = None) -> list:
+    """Ids of started jobs whose lease ran out."""
+    now = time.time() if now is None else now
+    return [member.decode("utf-8") for member in redis_conn.zrangebyscore(STARTED_KEY, "-inf", now)]
+
+
+def recover(redis_conn, job_id: str, lane: str = None, now: float = None) -> bool:
+    """
+    Take a job with an expired lease out of `sched:started` and, given a
+    lane, put it in front of that lane's waiting jobs. False when it was not
+    expired any more, e.g. another worker recovered it first.
+    """
+    now = time.time() if now is None else now
+    key = lane_key(lane) if lane else None
+    with redis_conn.pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(STARTED_KEY, *([key + ":vtime"] if key else []))
+                deadline = pipe.zscore(STARTED_KEY, job_id)
+                if deadline is None or deadline > now:
+                    return False
+                vtime = float(pipe.get(key + ":vtime") or 0) if key else 0
+                pipe.multi()
+                pipe.zrem(STARTED_KEY, job_id)
+                if key:
+                    # It waited its turn once already
+                    pipe.zadd(key, {job_id: vtime})
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                continue
+
+
+def depth(redis_conn, lane: str) -> int:
+    return redis_conn.zcard(lane_key(lane))
+
+
+def depths(redis_conn) -> dict:
+    pipe = redis_conn.pipeline(transaction=False)
+    for lane in LANES:
+        pipe.zcard(lane_key(lane))
+    return dict(zip(LANES, pipe.execute()))
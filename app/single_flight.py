@@ -0,0 +1,82 @@
+"""
+Single-flight coalescing of identical generation requests.
+
+Requests that would generate the same thing (technology, difficulty, concept
+set, number of questions still needed, strict flag, and the company when
+strict) share a canonical key. The first one to claim `inflight:<key>` runs
+the generation job; identical requests arriving while it is in flight get
+their own job record with `alias` set to the running job instead of being
+enqueued (see job_store.py). /get_questions resolves an alias to the running
+job's result and swaps in the alias's own pool questions, so every caller sees
+the same freshly generated questions plus what the pool had for its company.
+"""
+import hashlib
+import json
+import logging
+import os
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+COALESCE_REQUESTS = os.getenv("COALESCE_REQUESTS", "1") == "1"
+# Upper bound on how long a job holds its key; normally released when it finishes
+COALESCE_INFLIGHT_TTL = int(os.getenv("COALESCE_INFLIGHT_TTL", "900"))
+INFLIGHT_PREFIX = "inflight:"
+
+
+def request_key(request) -> str:
+    canonical = {
+        "technology": request.technology_name.strip(),
+        "difficulty": request.difficulty_level.strip(),
+        "concepts": sorted({concept.strip().lower() for concept in request.concepts}),
+        "count": request.number_of_questions,
+        "strict": request.strict_question,
+        # Strict questions are only ever served to the company that generated them
+        "company": request.company_Id if request.strict_question else None,
+    }
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def attach_or_lead(redis_conn, request, job_id: str):
+    """
+    Claim the request's in-flight key for `job_id`, or attach to the job that
+    holds it. Returns the leading job id when attached, None when `job_id`
+    should run the generation itself.
+    """
+    if not COALESCE_REQUESTS:
+        return None
+    key = INFLIGHT_PREFIX + request_key(request)
+    for _ in range(2):
+        if redis_conn.set(key, job_id, nx=True, ex=COALESCE_INFLIGHT_TTL):
+            return None
+        leader = redis_conn.get(key)
+        if leader is not None:
+            leader = leader.decode("utf-8")
+            logger.info(f"Job {job_id} attached to in-flight job {leader}")
+            return leader
+        # The leader finished between SET NX and GET; try to lead again
+    return None
+
+
+def release(redis_conn, request, job_id: str):
+    """Drop the in-flight key if `job_id` still holds it, so later requests start a new job."""
+    key = INFLIGHT_PREFIX + request_key(request)
+    with redis_conn.pipeline() as pipe:
+        try:
+            pipe.watch(key)
+            holder = pipe.get(key)
+            if holder is None or holder.decode("utf-8") != job_id:
+                return
+            pipe.multi()
+            pipe.delete(key)
+            pipe.execute()
+        except redis.WatchError:
+            pass
+
+
+def follower_result(data: dict, leader_selected: list, own_selected: list) -> dict:
+    """The leader's result with its pool questions replaced by the follower's."""
+    leader_ids = {question["id"] for question in leader_selected}
+    questions = [question for question in data["questions"] if question["id"] not in leader_ids] + own_selected
+    return dict(data, questions=questions, total_questions=len(questions))
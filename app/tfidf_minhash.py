@@ -1,15 +1,30 @@
 import hashlib
+import threading
+import numpy as np
+from collections import Counter, defaultdict
+from scipy.sparse import csr_matrix
 from sklearn.feature_extraction.text import TfidfVectorizer
 from datetime import datetime
 import re
 import time
 import os
 
+from pymongo.errors import BulkWriteError
 
+import metrics
+from lsh_index import LSHIndex
+from id_allocator import QuestionIdAllocator
 
 
+
+
+# Signature engine used by the worker; see get_minhash
+MINHASH_ENGINE = os.getenv("MINHASH_ENGINE", "md5")
+
 # MinHash Class
 class MinHash:
+    name = "md5"
+
     def __init__(self, num_permutations: int = 100):
         self.num_permutations = num_permutations
         self.hash_seeds = list(range(num_permutations))
@@ -32,6 +47,95 @@ class MinHash:
         matches = sum(1 for i in range(len(sig1)) if sig1[i] == sig2[i])
         return matches / len(sig1)
 
+    def get_signatures(self, documents: list) -> list:
+        return [self.get_signature(document) for document in documents]
+
+    # 128-bit values don't fit in a BSON integer, so they are stored as hex
+    def serialize_signature(self, signature: list) -> list:
+        return [format(value, "x") for value in signature]
+
+    def deserialize_signature(self, stored: list) -> list:
+        return [int(value, 16) for value in stored]
+
+
+class NumpyMinHash:
+    """
+    MinHash engine that hashes every shingle once and derives all permutations
+    with universal hashing ((a * x + b) mod p) over uint64 arrays.
+
+    Shingle hashes are 32-bit and p is the largest 32-bit prime, so the product
+    never overflows uint64 and signatures fit in uint32 arrays. Signatures are
+    not comparable with the md5 engine; switch engines with MINHASH_ENGINE after
+    re-indexing the bank with backfill.py.
+    """
+    name = "numpy"
+    _prime = np.uint64(4294967291)
+
+    def __init__(self, num_permutations: int = 100, seed: int = 1):
+        self.num_permutations = num_permutations
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, int(self._prime), size=num_permutations, dtype=np.uint64)
+        self._b = rng.randint(0, int(self._prime), size=num_permutations, dtype=np.uint64)
+
+    @staticmethod
+    def _hash_shingles(items) -> np.ndarray:
+        return np.fromiter(
+            (int.from_bytes(hashlib.blake2b(item.encode(), digest_size=4).digest(), "little") for item in items),
+            dtype=np.uint64,
+        )
+
+    def _permute(self, hashes: np.ndarray) -> np.ndarray:
+        return (np.outer(hashes, self._a) + self._b) % self._prime
+
+    def _empty_signature(self) -> np.ndarray:
+        return np.full(self.num_permutations, self._prime, dtype=np.uint32)
+
+    def get_signature(self, document: set) -> np.ndarray:
+        if not document:
+            return self._empty_signature()
+        return self._permute(self._hash_shingles(document)).min(axis=0).astype(np.uint32)
+
+    def get_signatures(self, documents: list) -> np.ndarray:
+        """Sign many shingle sets at once; returns a (len(documents), num_permutations) uint32 array."""
+        signatures = np.empty((len(documents), self.num_permutations), dtype=np.uint32)
+        vocabulary = {}
+        columns, offsets, signed = [], [], []
+        for row, document in enumerate(documents):
+            if not document:
+                signatures[row] = self._empty_signature()
+                continue
+            offsets.append(len(columns))
+            signed.append(row)
+            columns.extend(vocabulary.setdefault(item, len(vocabulary)) for item in document)
+        if signed:
+            permuted = self._permute(self._hash_shingles(vocabulary))
+            mins = np.minimum.reduceat(permuted[np.asarray(columns)], np.asarray(offsets), axis=0)
+            signatures[np.asarray(signed)] = mins.astype(np.uint32)
+        return signatures
+
+    def serialize_signature(self, signature) -> bytes:
+        return np.asarray(signature, dtype=np.uint32).tobytes()
+
+    def deserialize_signature(self, stored: bytes) -> np.ndarray:
+        return np.frombuffer(stored, dtype=np.uint32)
+
+    def estimate_similarity(self, sig1, sig2) -> float:
+        sig1, sig2 = np.asarray(sig1), np.asarray(sig2)
+        return np.count_nonzero(sig1 == sig2) / len(sig1)
+
+    def estimate_similarities(self, signature, signatures) -> np.ndarray:
+        """Similarity of one signature against every row of a signature matrix."""
+        return (np.asarray(signatures) == np.asarray(signature)).mean(axis=1)
+
+
+MINHASH_ENGINES = {MinHash.name: MinHash, NumpyMinHash.name: NumpyMinHash}
+
+def get_minhash(engine: str = None, num_permutations: int = 100):
+    engine = engine or MINHASH_ENGINE
+    if engine not in MINHASH_ENGINES:
+        raise ValueError(f"Unknown MinHash engine '{engine}', expected one of: {', '.join(MINHASH_ENGINES)}")
+    return MINHASH_ENGINES[engine](num_permutations=num_permutations)
+
 # Generate unique question hash
 def generate_question_hash(question: str, metadata: dict) -> str:
     hash_input = f"{question}:{metadata}"
@@ -44,81 +148,423 @@ def preprocess_question(question: str) -> str:
     question = ' '.join(question.split())
     return question
 
-# TF-IDF Similarity
-def calculate_tfidf_similarity(question1: str, question2: str) -> float:
-    vectorizer = TfidfVectorizer()
-    tfidf_matrix = vectorizer.fit_transform([question1, question2])
-    cosine_similarity = (tfidf_matrix * tfidf_matrix.T).toarray()[0, 1]
-    return cosine_similarity
-
-# Check for duplicate questions
-def is_duplicate(question, metadata, minhash: MinHash, db, hash_value):
-    # Exact Match (Hash-based)
-    exact_match = db["generated_questions"].find_one({"hash": hash_value})
-    if exact_match:
-        print("exact duplicate found")
-        return True
-
-    # Filter documents by technology and tags
-    relevant_docs = db["generated_questions"].find({
+class TfidfModel:
+    """
+    TF-IDF vocabulary and document frequencies for one (technology, difficulty)
+    bank, updated one question at a time instead of refit per comparison.
+
+    Weights follow TfidfVectorizer defaults (same tokenizer, smooth idf, l2
+    norm). Term counts of every question seen are appended to one CSR layout,
+    so candidate vectors are weighted with the current idf in a few vectorized
+    steps and scored with one sparse matrix product; the weighted matrix is
+    cached until add() changes the document frequencies. Query terms missing
+    from the vocabulary still count towards the query norm, as they would if
+    the query were part of the fit.
+
+    Candidates come from an inverted index over terms (prefix filtering): a
+    question can only score above the threshold if it shares one of the
+    query's rarest terms that together carry more than threshold**2 of the
+    query's squared weight, so the postings of common words are never read.
+    """
+
+    def __init__(self):
+        self.vocabulary = {}
+        self.document_frequency = np.zeros(1024, dtype=np.int64)
+        self.num_documents = 0
+        self._analyzer = TfidfVectorizer().build_analyzer()
+        # Term counts of every known question, row by row in the order added
+        self._indices = np.zeros(8192, dtype=np.int64)
+        self._counts = np.zeros(8192, dtype=np.float64)
+        self._indptr = [0]
+        self._row_of = {}
+        self._postings = defaultdict(list)
+        self._weighted = None
+        self._lock = threading.Lock()
+
+    def __contains__(self, question_id) -> bool:
+        return question_id in self._row_of
+
+    @staticmethod
+    def _grown(array: np.ndarray, size: int) -> np.ndarray:
+        if size <= len(array):
+            return array
+        grown = np.zeros(max(size, 2 * len(array)), dtype=array.dtype)
+        grown[:len(array)] = array
+        return grown
+
+    def add(self, question_id, normalized_question: str):
+        with self._lock:
+            if question_id in self._row_of:
+                return
+            counts = Counter(self._analyzer(normalized_question))
+            columns = [self.vocabulary.setdefault(term, len(self.vocabulary)) for term in counts]
+            for column in columns:
+                self._postings[column].append(question_id)
+            self.document_frequency = self._grown(self.document_frequency, len(self.vocabulary))
+            self.document_frequency[columns] += 1
+            start, end = self._indptr[-1], self._indptr[-1] + len(columns)
+            self._indices = self._grown(self._indices, end)
+            self._counts = self._grown(self._counts, end)
+            self._indices[start:end] = columns
+            self._counts[start:end] = list(counts.values())
+            self._indptr.append(end)
+            self._row_of[question_id] = self.num_documents
+            self.num_documents += 1
+            self._weighted = None
+
+    def _idf(self) -> np.ndarray:
+        df = self.document_frequency[:len(self.vocabulary)]
+        return np.log((1 + self.num_documents) / (1 + df)) + 1
+
+    @staticmethod
+    def _normalized(indices: np.ndarray, counts: np.ndarray, indptr: np.ndarray, idf: np.ndarray,
+                    extra_norm=None) -> csr_matrix:
+        rows = len(indptr) - 1
+        data = counts * idf[indices]
+        row_of_value = np.repeat(np.arange(rows), np.diff(indptr))
+        squares = np.bincount(row_of_value, weights=data ** 2, minlength=rows)
+        if extra_norm is not None:
+            squares = squares + extra_norm
+        norms = np.sqrt(squares)
+        norms[norms == 0] = 1
+        return csr_matrix((data / norms[row_of_value], indices, indptr), shape=(rows, len(idf)))
+
+    def _matrix(self, rows: list, idf: np.ndarray, extra_norm=None) -> csr_matrix:
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(columns) for columns, _ in rows])
+        indices = np.concatenate([columns for columns, _ in rows]) if rows else np.zeros(0, dtype=np.int64)
+        counts = np.concatenate([counts for _, counts in rows]) if rows else np.zeros(0)
+        return self._normalized(indices, counts, indptr, idf, extra_norm)
+
+    def _queries(self, normalized_questions: list, idf: np.ndarray):
+        """Query rows over the known vocabulary, and each query's squared weight outside it."""
+        oov_idf = np.log(1 + self.num_documents) + 1
+        query_rows, oov_norms = [], []
+        for text in normalized_questions:
+            counts = Counter(self._analyzer(text))
+            known = [(self.vocabulary[term], count) for term, count in counts.items() if term in self.vocabulary]
+            query_rows.append((
+                np.array([column for column, _ in known], dtype=np.int64),
+                np.array([count for _, count in known], dtype=np.float64),
+            ))
+            oov_norms.append(sum(
+                (count * oov_idf) ** 2 for term, count in counts.items() if term not in self.vocabulary
+            ))
+        return query_rows, np.array(oov_norms)
+
+    def _candidate_matrix(self, question_ids: list, idf: np.ndarray) -> csr_matrix:
+        if self._weighted is None:
+            nnz = self._indptr[-1]
+            # The indices are copied; scipy may sort a matrix's indices in place
+            self._weighted = self._normalized(
+                self._indices[:nnz].copy(), self._counts[:nnz], np.array(self._indptr, dtype=np.int64), idf
+            )
+        return self._weighted[[self._row_of[question_id] for question_id in question_ids]]
+
+    def candidates(self, normalized_questions: list, threshold: float) -> list:
+        """For each query text, the known question ids that can score above `threshold`."""
+        with self._lock:
+            idf = self._idf()
+            query_rows, oov_norms = self._queries(normalized_questions, idf)
+            found = []
+            for (columns, counts), oov_norm in zip(query_rows, oov_norms):
+                weights = (counts * idf[columns]) ** 2
+                total = weights.sum() + oov_norm
+                ids = set()
+                if total:
+                    # Rarest terms first, so the postings read are the short ones
+                    remaining = weights.sum() / total
+                    for index in np.argsort(self.document_frequency[columns], kind="stable"):
+                        if remaining <= threshold ** 2:
+                            break
+                        ids.update(self._postings[int(columns[index])])
+                        remaining -= weights[index] / total
+                found.append(ids)
+        return found
+
+    def similarities(self, normalized_questions: list, question_ids: list) -> np.ndarray:
+        """Cosine similarity of each query text against each known question id."""
+        with self._lock:
+            idf = self._idf()
+            query_rows, oov_norms = self._queries(normalized_questions, idf)
+            queries = self._matrix(query_rows, idf, oov_norms)
+            candidates = self._candidate_matrix(question_ids, idf)
+        return (queries @ candidates.T).toarray()
+
+    def pairwise(self, normalized_questions: list) -> np.ndarray:
+        """Cosine similarity between the query texts, none of which has to be known."""
+        with self._lock:
+            idf = self._idf()
+            oov_idf = np.log(1 + self.num_documents) + 1
+            new_terms = {}
+            rows = []
+            for text in normalized_questions:
+                counts = Counter(self._analyzer(text))
+                rows.append((
+                    np.array([self.vocabulary[term] if term in self.vocabulary
+                              else len(self.vocabulary) + new_terms.setdefault(term, len(new_terms))
+                              for term in counts], dtype=np.int64),
+                    np.fromiter(counts.values(), dtype=np.float64, count=len(counts)),
+                ))
+            matrix = self._matrix(rows, np.concatenate([idf, np.full(len(new_terms), oov_idf)]))
+        return (matrix @ matrix.T).toarray()
+
+
+_tfidf_models = {}
+
+def get_tfidf_model(metadata: dict) -> TfidfModel:
+    key = (metadata["technology"], metadata["difficulty"])
+    if key not in _tfidf_models:
+        _tfidf_models[key] = TfidfModel()
+    return _tfidf_models[key]
+
+def drop_tfidf_model(metadata: dict):
+    _tfidf_models.pop((metadata["technology"], metadata["difficulty"]), None)
+
+# Shingles used for MinHash signatures
+def get_shingles(question: str) -> set:
+    return set(preprocess_question(question).split())
+
+# Fields read from candidate documents; choice lists are never needed for dedup
+def candidate_projection(minhash) -> dict:
+    return {
+        "question.id": 1,
+        "question.question": 1,
+        "normalized_question": 1,
+        f"signatures.{minhash.name}": 1,
+    }
+
+# Dedup fields stored on a question document so later checks never recompute them
+def question_index_fields(question_text: str, minhash, lsh: LSHIndex = None, signature=None) -> dict:
+    normalized = preprocess_question(question_text)
+    if signature is None:
+        signature = minhash.get_signature(set(normalized.split()))
+    fields = {
+        "normalized_question": normalized,
+        "signatures": {minhash.name: minhash.serialize_signature(signature)},
+    }
+    if lsh is not None:
+        fields.update(lsh.index_fields(signature))
+    return fields
+
+def get_normalized_question(doc: dict) -> str:
+    return doc.get("normalized_question") or preprocess_question(doc["question"]["question"])
+
+def get_stored_signature(doc: dict, minhash):
+    stored = doc.get("signatures", {}).get(minhash.name)
+    if stored is None:
+        # Not backfilled yet
+        return minhash.get_signature(get_shingles(doc["question"]["question"]))
+    return minhash.deserialize_signature(stored)
+
+def _add_to_hash_filter(hash_filter, hashes: list):
+    if hash_filter is None:
+        return
+    try:
+        hash_filter.add(hashes)
+    except Exception as e:
+        # A stored hash missing from the filter would read as new, so stop trusting it until reseeded
+        print(f"Error adding hashes to the filter, invalidating it: {e}")
+        try:
+            hash_filter.invalidate()
+        except Exception as e:
+            print(f"Error invalidating the hash filter: {e}")
+
+def _max_minhash_similarity(minhash, signature, signatures: list) -> float:
+    if not signatures:
+        return 0.0
+    if hasattr(minhash, "estimate_similarities"):
+        return float(minhash.estimate_similarities(signature, np.vstack(signatures)).max())
+    return max(minhash.estimate_similarity(signature, existing) for existing in signatures)
+
+def _ids_by_tag(documents: list) -> dict:
+    by_tag = defaultdict(set)
+    for existing in documents:
+        for tag in existing["question"].get("tags", []):
+            by_tag[tag].add(existing["question"]["id"])
+    return by_tag
+
+def _tfidf_bank_duplicates(model: TfidfModel, texts: list, tags: list, by_tag: dict, threshold: float) -> list:
+    """
+    For each query text, whether any bank question sharing one of its tags
+    scores over the threshold. `by_tag` maps each tag to the ids of the bank
+    questions carrying it, all known to `model`.
+    """
+    tagged = {}
+    candidates = []
+    for ids, question_tags in zip(model.candidates(texts, threshold), tags):
+        key = frozenset(question_tags)
+        if key not in tagged:
+            tagged[key] = set().union(*(by_tag.get(tag, ()) for tag in key))
+        candidates.append(ids & tagged[key])
+    scored = sorted(set().union(*candidates))
+    if not scored:
+        return [False] * len(texts)
+    column_of = {question_id: column for column, question_id in enumerate(scored)}
+    scores = model.similarities(texts, scored)
+    return [
+        bool(ids) and scores[row, [column_of[question_id] for question_id in ids]].max() > threshold
+        for row, ids in enumerate(candidates)
+    ]
+
+# Deduplicate a whole generated set against the bank and against itself, then store the survivors
+def FindDuplicatesBatch(questions: list, metadata, minhash, db, request, lsh: LSHIndex = None,
+                        id_allocator: QuestionIdAllocator = None, threshold: float = 0.85, bank=None,
+                        hash_filter=None):
+    """
+    With `bank` (a question_bank.QuestionBank kept by a long-lived worker) the
+    bank is brought up to date with one query and every check runs in memory.
+    Without one, `hash_filter` (hash_filter.HashFilter) narrows the exact-match
+    query to the hashes it cannot rule out, and TF-IDF scores the MinHash
+    candidates: with `lsh` the questions sharing a band bucket, so the cost
+    follows the buckets and not the bank, at the price of missing a reworded
+    duplicate that shares no bucket. A warm bank scores TF-IDF against the
+    whole tag bucket through the model's inverted index. Stored hashes are
+    added to the filter either way.
+    """
+    collection = db["generated_questions"]
+    if id_allocator is None:
+        id_allocator = QuestionIdAllocator(db, block_size=len(questions))
+    metrics.inc("qgen_questions_generated_total", len(questions))
+    texts = [preprocess_question(question["question"]) for question in questions]
+    shingles = [set(text.split()) for text in texts]
+    with metrics.timer(stage="minhash_signatures"):
+        signatures = minhash.get_signatures(shingles)
+    hashes = [generate_question_hash(question["question"], metadata) for question in questions]
+    tags = [set(question["tags"]) for question in questions]
+    all_tags = sorted(set().union(*tags)) if tags else []
+
+    if bank is not None:
+        with metrics.timer(stage="bank_refresh"):
+            bank.refresh(collection)
+
+    # Exact Match (Hash-based), one query for the whole set
+    with metrics.timer(stage="exact_hash"):
+        if bank is not None:
+            existing_hashes = bank.hashes.intersection(hashes)
+        else:
+            possible = hashes if hash_filter is None else hash_filter.possible(hashes)
+            existing_hashes = {
+                doc["hash"] for doc in collection.find({"hash": {"$in": possible}}, {"hash": 1})
+            } if possible else set()
+            if hash_filter is not None:
+                hash_filter.confirmed(len(existing_hashes))
+    duplicate = [hash_value in existing_hashes for hash_value in hashes]
+    if existing_hashes:
+        print(f"{sum(duplicate)} exact duplicates found")
+        metrics.inc("qgen_duplicates_total", sum(duplicate), stage="exact_hash")
+
+    # MinHash Similarity against the bank
+    minhash_filter = {
         "metadata.technology": metadata["technology"],
         "metadata.difficulty": metadata["difficulty"],
-        "question.tags": {"$in": question["tags"]}
-    })
+        "question.tags": {"$in": all_tags},
+    }
+    projection = dict(candidate_projection(minhash), **{"question.tags": 1})
+    row_band_keys = {}
+    if lsh is not None:
+        row_band_keys = {row: lsh.band_keys(signature) for row, signature in enumerate(signatures) if not duplicate[row]}
+        minhash_filter["lsh_bands"] = {"$in": sorted({key for keys in row_band_keys.values() for key in keys})}
+    minhash_started = time.perf_counter()
+    if not all(duplicate):
+        if bank is None:
+            candidates = list(collection.find(minhash_filter, projection))
+            candidate_signatures = [get_stored_signature(existing, minhash) for existing in candidates]
+            candidate_tags = [frozenset(existing["question"].get("tags", [])) for existing in candidates]
+        for row in range(len(questions)):
+            if duplicate[row]:
+                continue
+            if bank is not None:
+                # Only the row's own buckets, not every bucket of the set
+                sharing = [bank.signature(existing) for existing in bank.find(tags[row], row_band_keys.get(row))]
+            else:
+                sharing = [
+                    candidate_signatures[index] for index, existing_tags in enumerate(candidate_tags)
+                    if not tags[row].isdisjoint(existing_tags)
+                ]
+            if _max_minhash_similarity(minhash, signatures[row], sharing) > threshold:
+                print(f"MinHash found duplicate: {questions[row]['question']}")
+                metrics.inc("qgen_duplicates_total", stage="minhash")
+                duplicate[row] = True
+    metrics.observe("qgen_stage_seconds", time.perf_counter() - minhash_started, stage="minhash")
 
-    documents = list(relevant_docs)
+    # TF-IDF Similarity against the bank
+    model = get_tfidf_model(metadata) if bank is None else bank.model
+    remaining = [row for row in range(len(questions)) if not duplicate[row]]
+    tfidf_started = time.perf_counter()
+    if remaining:
+        if bank is not None:
+            by_tag = bank.by_tag
+        else:
+            # The MinHash candidates; the model only scores what it was given
+            for existing in candidates:
+                model.add(existing["question"]["id"], get_normalized_question(existing))
+            by_tag = _ids_by_tag(candidates)
+        found = _tfidf_bank_duplicates(
+            model, [texts[row] for row in remaining], [tags[row] for row in remaining], by_tag, threshold
+        )
+        for row, is_found in zip(remaining, found):
+            if is_found:
+                print(f"TF-IDF found duplicate: {questions[row]['question']}")
+                metrics.inc("qgen_duplicates_total", stage="tfidf")
+                duplicate[row] = True
+    metrics.observe("qgen_stage_seconds", time.perf_counter() - tfidf_started, stage="tfidf")
 
-    # MinHash Similarity
-    shingles = set(preprocess_question(question["question"]).split())
-    question_signature = minhash.get_signature(shingles)
-    minhash_duplicate_found = False
-    for existing in documents:
-        # MinHash Comparison
-        existing_shingles = set(preprocess_question(existing["question"]["question"]).split())
-        existing_signature = minhash.get_signature(existing_shingles)
-        if minhash.estimate_similarity(question_signature, existing_signature) > 0.85:
-            minhash_duplicate_found = True
-            break
-    if(minhash_duplicate_found):
-        print("MinHash found duplicate")
-        return True
-    else:
-        print("MinHash didn't find a match, moving to TF-IDF")
-    # TF-IDF Similarity
-    for existing in documents:
-        existing_question = preprocess_question(existing["question"]["question"])
-        similarity = calculate_tfidf_similarity(preprocess_question(question["question"]), existing_question)
-        print("TF-IDF Similarity",similarity)
-        if similarity > 0.85:
-            print("TF-IDF found duplicate")
-            return True
-    return False
-
-
-# Store question if not duplicate
-def FindDuplicates(question, metadata, minhash:MinHash, db,request):
-    hash_value = generate_question_hash(question["question"], metadata)
-    if is_duplicate(question, metadata, minhash, db,hash_value):
-        print(f"Duplicate found: {question['question']}")
-        return False,None
-    #updating question ID
-    max_question = db["generated_questions"].find_one(sort=[("question.id", -1)])
-    next_question_id = (max_question["question"]["id"] + 1) if max_question else 1
-    question["id"] = next_question_id
-    question["type"] = "objective"
-
-    question_data = {
-        "question": question,
-        "hash": hash_value,
+    # Within the set, keeping the first of any near-identical pair
+    within_started = time.perf_counter()
+    accepted = []
+    # Scored among themselves; they only join the model once stored
+    within_scores = model.pairwise(texts) if len(questions) > 1 else None
+    for row in range(len(questions)):
+        if duplicate[row]:
+            continue
+        if accepted:
+            if hashes[row] in {hashes[other] for other in accepted} or _max_minhash_similarity(
+                minhash, signatures[row], [signatures[other] for other in accepted]
+            ) > threshold or within_scores[row, accepted].max() > threshold:
+                print(f"Duplicate within generated set: {questions[row]['question']}")
+                metrics.inc("qgen_duplicates_total", stage="within_set")
+                duplicate[row] = True
+                continue
+        questions[row]["id"] = id_allocator.next_id()
+        questions[row]["type"] = "objective"
+        accepted.append(row)
+    metrics.observe("qgen_stage_seconds", time.perf_counter() - within_started, stage="within_set")
+
+    duplicate_questions = [question["question"] for row, question in enumerate(questions) if duplicate[row]]
+    if not accepted:
+        return [], duplicate_questions
+
+    created_at = int(datetime.now().timestamp())
+    documents = [{
+        "question": questions[row],
+        "hash": hashes[row],
         "metadata": metadata,
-        "created_at": int(datetime.now().timestamp()),
+        "created_at": created_at,
         "generated_by": request.company_Id,
-        "strict_question":request.strict_question,
-    }
+        "strict_question": request.strict_question,
+        **question_index_fields(questions[row]["question"], minhash, lsh, signatures[row]),
+    } for row in accepted]
+    stored = dict(zip(accepted, documents))
     try:
-        db["generated_questions"].insert_one(question_data)
-        print(f"Stored question: {question['question']}")
-        return True, question
+        with metrics.timer(stage="mongo_insert"):
+            collection.insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        failed = {error["index"] for error in e.details.get("writeErrors", [])}
+        print(f"Error storing {len(failed)} questions: {e}")
+        accepted = [row for index, row in enumerate(accepted) if index not in failed]
     except Exception as e:
-        print(f"Error storing question: {e}")
-        return False, None
+        print(f"Error storing questions: {e}")
+        # Some may have been written; an extra hash in the filter only costs a lookup
+        _add_to_hash_filter(hash_filter, [document["hash"] for document in documents])
+        return [], duplicate_questions
+    _add_to_hash_filter(hash_filter, [hashes[row] for row in accepted])
+    if bank is not None:
+        for row in accepted:
+            bank.add(stored[row], signatures[row])
+    else:
+        for row in accepted:
+            model.add(questions[row]["id"], texts[row])
+    print(f"Stored {len(accepted)} questions")
+    metrics.inc("qgen_questions_stored_total", len(accepted))
+    return [questions[row] for row in accepted], duplicate_questions
@@ -0,0 +1,192 @@
+"""
+Buffered OpenAI usage accounting.
+
+Usage events go to `question_gen_usage` as before, but through an in-process
+buffer flushed with one insert_many every USAGE_FLUSH_INTERVAL seconds or
+USAGE_FLUSH_SIZE events. Each flush also applies per-company, per-day totals
+to `question_gen_usage_daily` with one $inc upsert per (company, day), so
+reports read a handful of rollup documents instead of scanning every event.
+
+The flusher thread is started when worker.py is imported, and flushes once
+more at exit; a recorder that was never started only writes what it buffered
+when flush() is called.
+
+Rebuild the rollups from the raw events (e.g. after first deploying this):
+
+    python usage.py --rebuild-rollups
+"""
+import argparse
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+USAGE_FLUSH_SIZE = int(os.getenv("USAGE_FLUSH_SIZE", "100"))
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "5"))
+# Events kept for retry when Mongo is unavailable; older ones are dropped first
+USAGE_MAX_BUFFERED = int(os.getenv("USAGE_MAX_BUFFERED", "10000"))
+
+EVENTS_COLLECTION = "question_gen_usage"
+ROLLUP_COLLECTION = "question_gen_usage_daily"
+ROLLUP_FIELDS = ("jobs", "prompt_tokens", "output_tokens", "total_tokens", "attempts",
+                 "success", "partial_success", "failed")
+
+
+def usage_day(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+def rollup_increments(event: dict) -> dict:
+    increments = {
+        "jobs": 1,
+        "prompt_tokens": event["prompt_tokens"],
+        "output_tokens": event["output_tokens"],
+        "total_tokens": event["total_tokens"],
+        "attempts": event["attempts"],
+    }
+    if event["status"] in ("success", "partial_success", "failed"):
+        increments[event["status"]] = 1
+    return increments
+
+
+class UsageRecorder:
+    def __init__(self, db, flush_size: int = USAGE_FLUSH_SIZE, flush_interval: float = USAGE_FLUSH_INTERVAL):
+        self.db = db
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._events = []
+        # Stored events whose rollups failed to apply
+        self._unrolled = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._flusher = None
+
+    def start(self):
+        """Buffer events and flush them from a background thread."""
+        if self._flusher is not None and self._flusher.is_alive():
+            return self
+        self._flusher = threading.Thread(target=self._flush_loop, name="usage-flusher", daemon=True)
+        self._flusher.start()
+        atexit.register(self.flush)
+        return self
+
+    def record(self, event: dict):
+        with self._lock:
+            self._events.append(event)
+            pending = len(self._events)
+        if pending >= self.flush_size:
+            self._wake.set()
+
+    def _flush_loop(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Usage flush failed: {e}")
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                events, self._events = self._events, []
+                unrolled, self._unrolled = self._unrolled, []
+            if not events and not unrolled:
+                return 0
+            try:
+                self._insert(events)
+            except Exception:
+                with self._lock:
+                    # Keep them for the next flush, newest first if the buffer is full
+                    self._events = (events + self._events)[-USAGE_MAX_BUFFERED:]
+                    self._unrolled = (unrolled + self._unrolled)[-USAGE_MAX_BUFFERED:]
+                raise
+            # Stored from here on; only their rollups are retried if the next step fails
+            pending = unrolled + events
+            try:
+                self._apply_rollups(pending)
+            except Exception:
+                with self._lock:
+                    self._unrolled = (pending + self._unrolled)[-USAGE_MAX_BUFFERED:]
+                raise
+            return len(events)
+
+    def _insert(self, events: list):
+        if not events:
+            return
+        try:
+            self.db[EVENTS_COLLECTION].insert_many(events, ordered=False)
+        except BulkWriteError as e:
+            # insert_many adds _id to the dicts, so events from a half-done earlier flush
+            # come back as duplicate keys; those are stored already
+            write_errors = e.details.get("writeErrors", [])
+            if not write_errors or any(error.get("code") != 11000 for error in write_errors):
+                raise
+            logger.warning(f"{len(write_errors)} usage events were already stored")
+
+    def _apply_rollups(self, events: list):
+        rollups = defaultdict(lambda: defaultdict(int))
+        for event in events:
+            for field, value in rollup_increments(event).items():
+                rollups[(event["company_id"], usage_day(event["timestamp"]))][field] += value
+        self.db[ROLLUP_COLLECTION].bulk_write([
+            UpdateOne({"company_id": company_id, "day": day}, {"$inc": dict(increments)}, upsert=True)
+            for (company_id, day), increments in rollups.items()
+        ], ordered=False)
+        logger.info(f"Flushed {len(events)} usage events into {len(rollups)} daily rollups")
+
+
+def ensure_indexes(db):
+    db[ROLLUP_COLLECTION].create_index([("company_id", ASCENDING), ("day", ASCENDING)], unique=True)
+
+
+def usage_summary(db, company_id: str, start_day: str = None, end_day: str = None) -> dict:
+    """Daily rollups of a company between two YYYY-MM-DD days (default: the last 30 days) and their total."""
+    today = datetime.now(timezone.utc)
+    end_day = end_day or today.strftime("%Y-%m-%d")
+    start_day = start_day or (today - timedelta(days=29)).strftime("%Y-%m-%d")
+    days = list(db[ROLLUP_COLLECTION].find(
+        {"company_id": company_id, "day": {"$gte": start_day, "$lte": end_day}},
+        {"_id": 0, "company_id": 0},
+    ).sort("day", ASCENDING))
+    totals = {field: sum(day.get(field, 0) for day in days) for field in ROLLUP_FIELDS}
+    return {"company_id": company_id, "start_day": start_day, "end_day": end_day, "totals": totals, "days": days}
+
+
+def rebuild_rollups(db) -> int:
+    """Recompute every daily rollup from the raw usage events."""
+    rollups = defaultdict(lambda: defaultdict(int))
+    for event in db[EVENTS_COLLECTION].find({}, {"_id": 0, "errors": 0, "thread_id": 0}):
+        event.setdefault("total_tokens", event.get("prompt_tokens", 0) + event.get("output_tokens", 0))
+        for field, value in rollup_increments(event).items():
+            rollups[(event["company_id"], usage_day(event["timestamp"]))][field] += value
+    ensure_indexes(db)
+    if rollups:
+        db[ROLLUP_COLLECTION].bulk_write([
+            UpdateOne({"company_id": company_id, "day": day},
+                      {"$set": {field: totals.get(field, 0) for field in ROLLUP_FIELDS}}, upsert=True)
+            for (company_id, day), totals in rollups.items()
+        ], ordered=False)
+    return len(rollups)
+
+
+if __name__ == "__main__":
+    from db_manager import get_mongo_connection
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Usage accounting maintenance.")
+    parser.add_argument("--rebuild-rollups", action="store_true", help="recompute daily rollups from raw events")
+    args = parser.parse_args()
+    if args.rebuild_rollups:
+        started = time.perf_counter()
+        count = rebuild_rollups(get_mongo_connection())
+        print(f"Rebuilt {count} daily rollups in {time.perf_counter() - started:.1f}s.")
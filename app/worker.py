@@ -1,18 +1,45 @@
 import os
 import json
+import asyncio
+import math
 import time
 import logging
 from typing import List
-from pydantic import BaseModel
-from openai import OpenAI
-
-from db_manager import get_mongo_connection,get_redis_connection
-from tfidf_minhash import MinHash,FindDuplicates
+import httpx
+import metrics
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from db_manager import get_mongo_connection,get_redis_connection,run_blocking
+from tfidf_minhash import FindDuplicatesBatch,get_minhash
+from lsh_index import LSHIndex,ensure_indexes
+from id_allocator import QuestionIdAllocator,ensure_unique_question_ids
+from assistant_registry import AssistantRegistry
+from question_bank import QuestionBankCache
+from question_bank import ensure_indexes as ensure_bank_indexes
+from hash_filter import HashFilter
+from hash_filter import ensure_indexes as ensure_hash_indexes
+from generation_backends import OPENAI_BASE_URL,get_backend
+from single_flight import release as release_inflight
+from job_store import complete_job,record_progress
+from job_store import set_status as set_job_status
+from usage import UsageRecorder
+from usage import ensure_indexes as ensure_usage_indexes
+from jobs import GenerateQuestionRequestModel
+from admission import AdmissionController
+from overgeneration import duplicate_rate,extra_questions,record_attempt,select_questions
+from overgeneration import ensure_indexes as ensure_overgeneration_indexes
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Keep-alive pool shared by every job of a long-lived worker
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+# Technologies whose question banks are loaded at worker startup: "all", "none" or a comma separated list
+WORKER_PRELOAD = os.getenv("WORKER_PRELOAD", "all")
+# Larger requests are generated in parallel shards of at most this many questions
+SHARD_SIZE = int(os.getenv("SHARD_SIZE", "10"))
+
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     raise ValueError("OPENAI_API_KEY is missing from environment variables.")
@@ -26,147 +53,151 @@ redis_conn = get_redis_connection()
 if redis_conn is None:
     print("Failed to connect to Redis.")
 
-
-# self.db["generated_questions"].create_index([("hash", ASCENDING)])
-#         self.db["generated_questions"].create_index([("metadata.technology", ASCENDING)])
-#         self.db["generated_questions"].create_index([("question.tags", ASCENDING)])
- # OpenAI client
-
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
-minhash = MinHash(num_permutations=100)
-
-# Define request model
-class GenerateQuestionRequestModel(BaseModel):
-    technology_name: str
-    concepts: List[str]
-    difficulty_level: str
-    number_of_questions: int
-    company_Id: str
-    strict_question:bool
-class Run(BaseModel):
-    id: str
-    status: str
+# OpenAI client
+openai_client = AsyncOpenAI(
+    api_key=OPENAI_API_KEY,
+    base_url=OPENAI_BASE_URL,
+    http_client=DefaultAsyncHttpxClient(limits=httpx.Limits(
+        max_connections=OPENAI_MAX_CONNECTIONS, max_keepalive_connections=OPENAI_MAX_CONNECTIONS
+    )),
+)
+minhash = get_minhash(num_permutations=100)
+lsh = LSHIndex(engine=minhash.name)
+if db is not None:
+    ensure_indexes(db)
+    ensure_bank_indexes(db)
+    ensure_unique_question_ids(db)
+    ensure_usage_indexes(db)
+    ensure_hash_indexes(db)
+    ensure_overgeneration_indexes(db)
+question_ids = QuestionIdAllocator(db)
+assistant_registry = AssistantRegistry(db, redis_conn).start()
+# Bloom filter in front of the exact-hash query; seeded by a warmed-up worker or hash_filter.py --seed
+hash_filter = HashFilter(redis_conn)
+# Buffers usage events and flushes them from a background thread
+usage_recorder = UsageRecorder(db).start()
+# Pushes this process's metrics to Redis for GET /metrics
+metrics.start_publisher(redis_conn)
+# Cluster-wide OpenAI request/token budget every generation attempt draws from
+admission = AdmissionController(redis_conn)
+# In-memory question banks, only set up by warm_up()
+question_banks = None
+
+def warm_up(preload: str = WORKER_PRELOAD):
+    """
+    Load dedup state once for a worker process that runs many jobs
+    (async_worker.py). Without it every job reads the bank from Mongo.
+    """
+    global question_banks
+    started = time.perf_counter()
+    question_banks = QuestionBankCache(db, minhash, lsh)
+    try:
+        hash_filter.ensure_seeded(db)
+    except Exception as e:
+        logger.error(f"Error seeding the hash filter: {e}")
+    if preload == "all":
+        question_banks.preload(assistant_registry.technologies())
+    elif preload != "none":
+        question_banks.preload([technology.strip() for technology in preload.split(",") if technology.strip()])
+    logger.info(f"Worker warmed up in {time.perf_counter() - started:.2f}s")
+    return question_banks
 
 def fetchAssistant(technology_name:str):
-    # Fetch assistant ID from MongoDB
-        ai_assistants = db["ai_assistants"]
-        doc = ai_assistants.find_one({"technology": technology_name})
-        if not doc or "assistant_id" not in doc:
-            logger.error(f"No assistant ID found for technology: {technology_name}")
+    # Assistant document from the in-memory registry of ai_assistants
+        assistant = assistant_registry.get(technology_name)
+        if not assistant:
+            logger.error(f"No assistant found for technology: {technology_name}")
             raise ValueError("Assistant ID not found in database.")
-        return doc["assistant_id"]
-
-def create_Thread():
-        thread = openai_client.beta.threads.create()
-        return thread.id
-def create_message(thread_id,content):
-        openai_client.beta.threads.messages.create(
-            thread_id=thread_id,
-            role="user",
-            content=content,
-        )
-def run_assistant(thread_id,assistant_id) -> Run:
-     run = openai_client.beta.threads.runs.create(
-            thread_id=thread_id,
-            assistant_id=assistant_id,
-        )
-     return run
-
-async def generate_questions(thread_id, run_id: Run, max_retries=60):
-     # Wait for the response
-        structured_response = None
-        for i in range(max_retries):
-            logger.info(f"Waiting for OpenAI response... ({i} seconds)")
-
-            result = openai_client.beta.threads.runs.retrieve(
-                thread_id=thread_id,
-                run_id=run_id
-            )
-            if result.status == "completed":
-                print("result",result.usage.prompt_tokens,result.usage.completion_tokens)
-                return structured_response,result.usage.prompt_tokens,result.usage.completion_tokens
-
-            elif result.status == "requires_action":
-                print("requires_action")
-                if result.required_action and result.required_action.submit_tool_outputs:
-                    tool_outputs = []
-                    for tool_call in result.required_action.submit_tool_outputs.tool_calls:
-                        if tool_call.function.name == "format_mcqs":
-                            if tool_call.function and tool_call.function.arguments:
-                                try:
-                                    structured_response = json.loads(tool_call.function.arguments)
-                                except json.JSONDecodeError as e:
-                                    logger.error(f"Error parsing JSON: {e}")
-                            print("structured_response_mcq",structured_response)
-                            tool_outputs.append({
-                                "tool_call_id": tool_call.id,
-                                "output": json.dumps(structured_response)
-                            })
-
-                    result = openai_client.beta.threads.runs.submit_tool_outputs(
-                        thread_id=thread_id,
-                        run_id=run_id,
-                        tool_outputs=tool_outputs
-                    )
-                continue
-
-            elif result.status in ["failed", "cancelled", "expired"]:
-                logger.error(f"Run ended with status: {result.status}")
-                return None
-
-            time.sleep(1)
-        raise TimeoutError("OpenAI response timeout")
+        return assistant
 
 async def process_questions(structured_response, metadata, minhash, db,request):
     """Process questions and identify duplicates"""
-    duplicate_questions = []
-    valid_questions = []
-    for question in structured_response["mcq_set"]["questions"]:
-        isduplicate,quest = FindDuplicates(question, metadata, minhash, db,request)
-        print(isduplicate,"isduplicate")
-        print("\n")
-        print(quest,"quest")
-        if isduplicate:
-            valid_questions.append(quest)
-        else:
-            duplicate_questions.append(question["question"])
-
+    bank = question_banks.get(metadata) if question_banks is not None else None
+    try:
+        valid_questions, duplicate_questions = await run_blocking(
+            FindDuplicatesBatch,
+            structured_response["mcq_set"]["questions"], metadata, minhash, db, request, lsh, question_ids,
+            bank=bank, hash_filter=hash_filter,
+        )
+    except Exception:
+        if bank is not None:
+            # A crash part way through may leave the cached bank out of step with Mongo
+            question_banks.discard(metadata)
+        raise
+    print(f"{len(valid_questions)} unique, {len(duplicate_questions)} duplicate questions")
     return valid_questions, duplicate_questions
 
-async def process_question_generation_task(request: GenerateQuestionRequestModel, job_id: str,selectedQuestions):
+def plan_shards(request: GenerateQuestionRequestModel) -> List[GenerateQuestionRequestModel]:
     """
-    Worker function to generate questions using OpenAI API and store results in Redis.
+    Split a request for more than SHARD_SIZE questions into sub-requests of at
+    most SHARD_SIZE, each on its own slice of the concepts when there are
+    enough of them to go round, otherwise each on all of them.
     """
-    status_key = f"{job_id}:status"
-    redis_conn.set(status_key, "in-progress")
-    logger.info(f"Job {job_id} started!")
-    print(request,selectedQuestions)
+    shard_count = math.ceil(request.number_of_questions / SHARD_SIZE)
+    if shard_count <= 1:
+        return [request]
+    if len(request.concepts) >= shard_count:
+        concept_groups = [request.concepts[index::shard_count] for index in range(shard_count)]
+    else:
+        concept_groups = [request.concepts] * shard_count
+    base, extra = divmod(request.number_of_questions, shard_count)
+    return [GenerateQuestionRequestModel(
+        technology_name=request.technology_name,
+        concepts=concepts,
+        difficulty_level=request.difficulty_level,
+        number_of_questions=base + (index < extra),
+        company_Id=request.company_Id,
+        strict_question=request.strict_question,
+    ) for index, concepts in enumerate(concept_groups)]
+
+class JobRun:
+    """What the shards of one job share: accepted questions and usage so far."""
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.questions = []
+        # Generation attempts summed over every shard
+        self.attempts = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.thread_ids = []
+        self.mcq_set = None
+        # Shards dedup one at a time, so each also checks what the others just stored
+        self.dedup_lock = asyncio.Lock()
+
+async def generate_shard(run: JobRun, request: GenerateQuestionRequestModel, backend, assistant,
+                         max_attempts: int = 3):
+    """
+    Generate `request` in a thread of its own, retrying on duplicates.
+    Accepted questions and attempts are added to `run` as they come.
+    """
+    job_id = run.job_id
+    current_attempt = 0
+    kept = []
+    remaining_count = request.number_of_questions
+    duplicate_questions = []
+    # Create a thread in OpenAI, or a conversation for the completions backend
+    session = await backend.start(assistant)
+    thread_id = session.id
+    run.thread_ids.append(thread_id)
     try:
-        max_attempts = 3
-        current_attempt = 0
-        total_input_token = 0
-        total_output_token = 0
-        all_valid_questions = []
-        remaining_count = request.number_of_questions
-        duplicate_questions = []
-        assistant_id = fetchAssistant(request.technology_name)
-        logger.info(f"Found assistant ID: {assistant_id}")
-        # Create a thread in OpenAI
-        thread_id = create_Thread()
-        logger.info(f"Created OpenAI thread with ID: {thread_id}")
+        # Recorded duplicate rate of these concepts, to ask for enough extra questions up front
+        expected_duplicate_rate = await run_blocking(
+            duplicate_rate, db, request.technology_name, request.difficulty_level, request.concepts
+        )
         #adding retry approach
         while current_attempt < max_attempts and remaining_count > 0:
              try:
                 # Generate prompt
                 combine_concept = ", ".join(request.concepts)
+                asked_count = remaining_count + extra_questions(expected_duplicate_rate, remaining_count)
                 content = (
-                    f"Generate {request.number_of_questions} {request.difficulty_level} multiple-choice "
+                    f"Generate {asked_count} {request.difficulty_level} multiple-choice "
                     f"questions based on the {request.technology_name} Technology and the concepts: {combine_concept}."
                 )
                 if current_attempt > 0:
                     duplicate_list = "\n".join(f"{i}. {question}" for i, question in enumerate(duplicate_questions, 1))
                     content = (
-                        f"I need {remaining_count} new {request.difficulty_level} multiple-choice questions "
+                        f"I need {asked_count} new {request.difficulty_level} multiple-choice questions "
                         f"about {request.technology_name} Technology focusing on concepts: {combine_concept}.\n\n"
                         "Here are the duplicate questions to avoid:\n"
                         f"{duplicate_list}\n\n"
@@ -174,53 +205,57 @@ async def process_question_generation_task(request: GenerateQuestionRequestModel
                         "1. Are substantially different from the duplicates above\n"
                         "2. Cover different aspects of the concepts\n"
                         "3. Use unique phrasing and structure\n"
-                        f"\nGenerate exactly {remaining_count} new questions meeting these criteria."
+                        f"\nGenerate exactly {asked_count} new questions meeting these criteria."
                     )
-                logger.info(f"Attempt {current_attempt + 1}: Sending new message to thread {thread_id}")
-
-                create_message(thread_id,content)
-                run = run_assistant(thread_id,assistant_id)
-                # print("\n","run",run)
-                logger.info(f"Created run {run.id} in thread {thread_id}")
-
-                structured_response,input_token,output_token = await generate_questions(thread_id, run.id,60)
+                logger.info(f"Attempt {current_attempt + 1}: Asking for {asked_count} questions "
+                            f"({remaining_count} needed) in thread {thread_id}")
+
+                estimated_tokens = admission.estimate(asked_count)
+                await admit(estimated_tokens)
+                run.attempts += 1
+                input_token = output_token = 0
+                try:
+                    structured_response,input_token,output_token = await session.generate(content)
+                finally:
+                    # Refunds the estimate of a failed attempt too, which reports no usage
+                    try:
+                        await run_blocking(admission.settle, estimated_tokens, input_token + output_token)
+                    except Exception as e:
+                        logger.error(f"Error settling OpenAI tokens of job {job_id}: {str(e)}")
                 print("structured_response",structured_response)
                 if structured_response:
-                    total_input_token += input_token
-                    total_output_token += output_token
+                    run.input_tokens += input_token
+                    run.output_tokens += output_token
+                    run.mcq_set = structured_response["mcq_set"]
                     metadata = {
                         "technology": structured_response["mcq_set"]["technology"],
                         "difficulty": structured_response["mcq_set"]["difficulty"],
                     }
-                    valid_questions, duplicate_questions = await process_questions(
-                            structured_response, metadata, minhash, db,request
+                    async with run.dedup_lock:
+                        valid_questions, duplicate_questions = await process_questions(
+                                structured_response, metadata, minhash, db,request
+                            )
+                        # Keep what the shard still needs; the surplus is stored already and stays in the bank
+                        kept_questions = select_questions(valid_questions, request.concepts, remaining_count, kept)
+                        kept.extend(kept_questions)
+                        run.questions.extend(kept_questions)
+                        # Progress counters, and the new questions so clients can start rendering early
+                        await run_blocking(
+                            record_progress, redis_conn, job_id, run.attempts, len(run.questions), kept_questions
                         )
-                    all_valid_questions.extend(valid_questions)
-                    remaining_count = request.number_of_questions - len(all_valid_questions)
-
-                    if remaining_count == 0:
-                            all_valid_questions.extend(selectedQuestions)
-                            final_response = {
-                                    "status":"success",
-                                    "technology": structured_response["mcq_set"]["technology"],
-                                    "difficulty": structured_response["mcq_set"]["difficulty"],
-                                    "total_questions": len(all_valid_questions),
-                                    "questions": all_valid_questions
-                            }
-                            redis_conn.set(job_id, json.dumps(final_response))
-                            redis_conn.set(status_key, "completed")
-                            logger.info(f"Job {job_id} completed successfully with {len(all_valid_questions)} questions.")
-                            track_api_usage(
-                            company_id=request.company_Id,
-                            input_tokens=total_input_token,
-                            output_tokens=total_output_token,
-                            attempts=current_attempt + 1,
-                            thread_id=thread_id,
-                            status="success",
-                            errors=None
+                    try:
+                        await run_blocking(
+                            record_attempt, db, request.technology_name, request.difficulty_level, request.concepts,
+                            structured_response["mcq_set"]["questions"], valid_questions,
                         )
-                            return final_response
-                    elif duplicate_questions:
+                    except Exception as e:
+                        logger.error(f"Error recording duplicate rates of job {job_id}: {str(e)}")
+                    if len(kept_questions) < len(valid_questions):
+                        surplus = len(valid_questions) - len(kept_questions)
+                        metrics.inc("qgen_surplus_questions_total", surplus)
+                        logger.info(f"Job {job_id} left {surplus} surplus unique questions in the bank")
+                    remaining_count = request.number_of_questions - len(kept)
+                    if remaining_count > 0 and duplicate_questions:
                         logger.info(
                             f"Found {len(duplicate_questions)} duplicate questions in attempt {current_attempt + 1}. "
                             f"Regenerating {remaining_count} questions in same thread."
@@ -232,64 +267,150 @@ async def process_question_generation_task(request: GenerateQuestionRequestModel
                 logger.error(f"Timeout on attempt {current_attempt + 1} in thread {thread_id}: {str(te)}")
                 if current_attempt == max_attempts - 1:
                     raise
+                current_attempt += 1
                 continue
              except json.JSONDecodeError as je:
                  print(f"JSONDecodeError: {je}")
+                 current_attempt += 1
                  continue
              except Exception as e:
                 logger.error(f"Error on attempt {current_attempt + 1} in thread {thread_id}: {str(e)}")
                 if current_attempt == max_attempts - 1:
                     raise
+                current_attempt += 1
                 continue
+        if not kept:
+            raise Exception(f"Failed to generate unique questions after {max_attempts} attempts in thread {thread_id}")
+    finally:
+        try:
+            await session.close()
+            logger.info(f"Completed processing thread {thread_id}")
+        except Exception as e:
+            logger.error(f"Error cleaning up thread {thread_id}: {str(e)}")
 
-        if all_valid_questions:
+async def process_question_generation_task(request: GenerateQuestionRequestModel, job_id: str,selectedQuestions):
+    """
+    Worker function to generate questions using OpenAI API and store results in Redis.
+
+    Requests for more than SHARD_SIZE questions are split into shards
+    (plan_shards) generated in parallel, each in its own thread, and merged
+    into one result, so a 50-question job takes about as long as a 10-question
+    one.
+    """
+    job_started = time.perf_counter()
+    await run_blocking(set_job_status, redis_conn, job_id, "in-progress")
+    logger.info(f"Job {job_id} started!")
+    print(request,selectedQuestions)
+    run = JobRun(job_id)
+    try:
+        assistant = await run_blocking(fetchAssistant, request.technology_name)
+        backend = get_backend(openai_client, assistant)
+        shards = plan_shards(request)
+        logger.info(f"Using {backend.name} backend for {request.technology_name} with {len(shards)} shard(s)")
+        metrics.observe("qgen_job_shards", len(shards))
+        results = await asyncio.gather(
+            *(generate_shard(run, shard, backend, assistant) for shard in shards), return_exceptions=True
+        )
+        errors = [result for result in results if isinstance(result, Exception)]
+        thread_id = ",".join(run.thread_ids)
+        all_valid_questions = list(run.questions)
+        if errors and not all_valid_questions:
+            raise errors[0]
+        for error in errors:
+            logger.error(f"A shard of job {job_id} failed: {str(error)}")
+
+        if len(all_valid_questions) >= request.number_of_questions:
             all_valid_questions.extend(selectedQuestions)
             final_response = {
-                    "status":"partial_success",
-                    "technology": structured_response["mcq_set"]["technology"],
-                    "difficulty": structured_response["mcq_set"]["difficulty"],
+                    "status":"success",
+                    "technology": run.mcq_set["technology"],
+                    "difficulty": run.mcq_set["difficulty"],
                     "total_questions": len(all_valid_questions),
-                    "questions": all_valid_questions,
-                    "note": "Only partial questions could be generated due to duplicates"
+                    "questions": all_valid_questions
             }
-            track_api_usage(
+            await run_blocking(complete_job, redis_conn, job_id, final_response, run.attempts)
+            logger.info(f"Job {job_id} completed successfully with {len(all_valid_questions)} questions.")
+            await run_blocking(
+                track_api_usage,
                 company_id=request.company_Id,
-                input_tokens=total_input_token,
-                output_tokens=total_output_token,
-                attempts=current_attempt,
+                input_tokens=run.input_tokens,
+                output_tokens=run.output_tokens,
+                attempts=run.attempts,
                 thread_id=thread_id,
-                status="partial_success",
+                status="success",
                 errors=None
             )
-            redis_conn.set(job_id, json.dumps(final_response))
-            redis_conn.set(status_key, "completed")
-            logger.warning(f"Job {job_id} completed partially with {len(all_valid_questions)} questions in thread {thread_id}")
+            record_job_metrics("success", job_started, run.attempts,
+                               run.input_tokens, run.output_tokens, request.number_of_questions)
             return final_response
 
-        raise Exception(f"Failed to generate unique questions after {max_attempts} attempts in thread {thread_id}")
+        all_valid_questions.extend(selectedQuestions)
+        final_response = {
+                "status":"partial_success",
+                "technology": run.mcq_set["technology"],
+                "difficulty": run.mcq_set["difficulty"],
+                "total_questions": len(all_valid_questions),
+                "questions": all_valid_questions,
+                "note": "Only partial questions could be generated due to duplicates"
+        }
+        await run_blocking(
+            track_api_usage,
+            company_id=request.company_Id,
+            input_tokens=run.input_tokens,
+            output_tokens=run.output_tokens,
+            attempts=run.attempts,
+            thread_id=thread_id,
+            status="partial_success",
+            errors=[str(error) for error in errors] or None
+        )
+        record_job_metrics("partial_success", job_started, run.attempts, run.input_tokens,
+                           run.output_tokens, len(all_valid_questions) - len(selectedQuestions))
+        await run_blocking(complete_job, redis_conn, job_id, final_response, run.attempts)
+        logger.warning(f"Job {job_id} completed partially with {len(all_valid_questions)} questions in thread {thread_id}")
+        return final_response
 
     except Exception as e:
         error_message = str(e)
-        track_api_usage(
+        await run_blocking(
+        track_api_usage,
         company_id=request.company_Id,
-        input_tokens=total_input_token,
-        output_tokens=total_output_token,
-        attempts=current_attempt + 1,
-        thread_id=thread_id,
+        input_tokens=run.input_tokens,
+        output_tokens=run.output_tokens,
+        attempts=max(run.attempts, 1),
+        thread_id=",".join(run.thread_ids) or None,
         status="failed",
         errors=[error_message],
         )
-        logger.error(f"Error processing job {job_id} in thread {thread_id}: {str(e)}")
-        redis_conn.set(status_key, "failed")
+        record_job_metrics("failed", job_started, max(run.attempts, 1), run.input_tokens, run.output_tokens, 0)
+        logger.error(f"Error processing job {job_id}: {str(e)}")
+        await run_blocking(set_job_status, redis_conn, job_id, "failed")
         raise e
 
     finally:
-        if 'thread_id' in locals():
-            try:
-                openai_client.beta.threads.delete(thread_id)
-                logger.info(f"Completed processing thread {thread_id}")
-            except Exception as e:
-                logger.error(f"Error cleaning up thread {thread_id}: {str(e)}")
+        try:
+            # Identical requests arriving from now on start a new job
+            await run_blocking(release_inflight, redis_conn, request, job_id)
+        except Exception as e:
+            logger.error(f"Error releasing in-flight key of job {job_id}: {str(e)}")
+
+async def admit(tokens: int):
+    # Wait for the OpenAI budget instead of spending an attempt on a rate limit error
+    with metrics.timer(stage="admission"):
+        while True:
+            wait = await run_blocking(admission.try_acquire, tokens)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+def record_job_metrics(status: str, started: float, attempts: int, input_tokens: int, output_tokens: int,
+                       generated: int):
+    metrics.inc("qgen_jobs_total", status=status)
+    metrics.observe("qgen_job_seconds", time.perf_counter() - started, status=status)
+    metrics.observe("qgen_job_attempts", attempts)
+    metrics.inc("qgen_tokens_total", input_tokens, kind="prompt")
+    metrics.inc("qgen_tokens_total", output_tokens, kind="output")
+    if generated:
+        metrics.observe("qgen_tokens_per_question", (input_tokens + output_tokens) / generated)
 
 def track_api_usage(company_id: str,
     input_tokens: int,
@@ -299,11 +420,10 @@ def track_api_usage(company_id: str,
     status: str = "completed",
     errors: List[str] = None,):
     """
-    Logs API usage to MongoDB.
+    Logs API usage to MongoDB through the buffered usage recorder.
     """
     if errors is None:
      errors = []
-    usage_collection = db["question_gen_usage"]
     usage_data = {
         "company_id": company_id,
         "prompt_tokens": input_tokens,
@@ -315,7 +435,7 @@ def track_api_usage(company_id: str,
         "errors":errors,
         "timestamp": time.time(),
     }
-    usage_collection.insert_one(usage_data)
+    usage_recorder.record(usage_data)
     logger.info(f"API usage tracked for company {company_id}.")
 
 
@@ -0,0 +1,97 @@
+"""
+Load test for the API event loop.
+
+Measures /get_questions latency on its own, then again while a stream of
+/generate_ai_question requests keeps the question pool query busy. With the
+blocking Mongo/Redis calls moved off the event loop the two p99 values should
+stay close.
+
+    python benchmarks/api_load.py --url http://localhost:8000 --api-key $API_KEY \\
+        --technology Golang --concepts array
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+from bench_common import percentile
+
+
+async def poll_get_questions(client: httpx.AsyncClient, job_id: str, duration: float, concurrency: int) -> list:
+    latencies = []
+
+    async def poller():
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            await client.post("/get_questions", json={"job_Id": job_id})
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(poller() for _ in range(concurrency)))
+    return latencies
+
+
+async def generate_load(client: httpx.AsyncClient, args, stop: asyncio.Event):
+    body = {
+        "technology_name": args.technology,
+        "concepts": args.concepts,
+        "difficulty_level": args.difficulty,
+        "number_of_questions": 10,
+        "company_Id": "load-test",
+        "strict_question": False,
+    }
+
+    async def generator():
+        while not stop.is_set():
+            await client.post("/generate_ai_question", json=body)
+
+    await asyncio.gather(*(generator() for _ in range(args.generators)))
+
+
+def summary(latencies: list) -> dict:
+    return {
+        "requests": len(latencies),
+        "p50_ms": percentile(latencies, 50),
+        "p99_ms": percentile(latencies, 99),
+        "mean_ms": round(statistics.mean(latencies), 2),
+    }
+
+
+async def main(args):
+    headers = {"Authorization": f"Bearer {args.api_key}"}
+    async with httpx.AsyncClient(base_url=args.url, headers=headers, timeout=60) as client:
+        response = await client.post("/generate_ai_question", json={
+            "technology_name": args.technology,
+            "concepts": args.concepts,
+            "difficulty_level": args.difficulty,
+            "number_of_questions": 1,
+            "company_Id": "load-test-probe",
+            "strict_question": False,
+        })
+        job_id = response.json()["job_id"]
+
+        baseline = await poll_get_questions(client, job_id, args.duration, args.pollers)
+
+        stop = asyncio.Event()
+        load = asyncio.create_task(generate_load(client, args, stop))
+        loaded = await poll_get_questions(client, job_id, args.duration, args.pollers)
+        stop.set()
+        await load
+
+    print(json.dumps({"baseline": summary(baseline), "under_generate_load": summary(loaded)}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--api-key", required=True)
+    parser.add_argument("--technology", required=True)
+    parser.add_argument("--concepts", nargs="+", required=True)
+    parser.add_argument("--difficulty", default="easy")
+    parser.add_argument("--duration", type=float, default=20, help="seconds per phase")
+    parser.add_argument("--pollers", type=int, default=10)
+    parser.add_argument("--generators", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
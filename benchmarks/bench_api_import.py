@@ -0,0 +1,100 @@
+"""
+Import time and memory of the API process.
+
+Each run is a fresh interpreter that imports main.py and reports how long the
+import took, its peak RSS, how many modules it loaded and which of the worker's
+heavy dependencies it pulled in. The "worker" variant imports worker.py first,
+which is what main.py did before it enqueued jobs by task name (jobs.py), so
+the two variants are the before and after of that change on the same tree.
+With --in-memory, Mongo and Redis are replaced by mongomock and fakeredis
+(imported before the clock starts) so nothing needs to be running.
+
+    python benchmarks/bench_api_import.py --in-memory
+    python benchmarks/bench_api_import.py --runs 10 --output import.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "app"))
+BENCH_DIR = os.path.abspath(os.path.dirname(__file__))
+HEAVY_MODULES = ("worker", "openai", "httpx", "sklearn", "scipy", "numpy", "datasketch", "tfidf_minhash")
+
+CHILD = """
+import json, os, resource, sys, time
+sys.path.insert(0, {app_dir!r})
+sys.path.insert(0, {bench_dir!r})
+if {in_memory!r}:
+    from bench_common import use_in_memory_stores
+    use_in_memory_stores()
+before = set(sys.modules)
+rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+started = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+elapsed = time.perf_counter() - started
+print(json.dumps({{
+    "seconds": elapsed,
+    "rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "rss_growth_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before,
+    "modules": len(set(sys.modules) - before),
+    "heavy": [name for name in {heavy!r} if name in sys.modules and name not in before],
+}}))
+"""
+
+VARIANTS = {
+    "api": ["main"],
+    "worker": ["worker", "main"],
+}
+
+
+def run_once(modules: list, in_memory: bool) -> dict:
+    env = dict(os.environ)
+    if "worker" in modules:
+        env.setdefault("OPENAI_API_KEY", "stub")
+    else:
+        # The API must come up without OpenAI credentials
+        env.pop("OPENAI_API_KEY", None)
+    code = CHILD.format(app_dir=APP_DIR, bench_dir=BENCH_DIR, in_memory=in_memory, modules=modules, heavy=HEAVY_MODULES)
+    completed = subprocess.run([sys.executable, "-c", code], cwd=APP_DIR, env=env, capture_output=True, text=True)
+    if completed.returncode:
+        raise RuntimeError(f"import of {modules} failed:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--variants", nargs="+", default=list(VARIANTS), choices=list(VARIANTS))
+    parser.add_argument("--in-memory", action="store_true", help="use mongomock and fakeredis")
+    parser.add_argument("--output", help="also write the report to this JSON file")
+    args = parser.parse_args()
+
+    report = {}
+    for variant in args.variants:
+        runs = [run_once(VARIANTS[variant], args.in_memory) for _ in range(args.runs)]
+        report[variant] = {
+            "imports": VARIANTS[variant],
+            "seconds_median": round(statistics.median(run["seconds"] for run in runs), 4),
+            "seconds_min": round(min(run["seconds"] for run in runs), 4),
+            "rss_mb_median": round(statistics.median(run["rss_kb"] for run in runs) / 1024, 1),
+            "rss_growth_mb_median": round(statistics.median(run["rss_growth_kb"] for run in runs) / 1024, 1),
+            "modules": runs[-1]["modules"],
+            "heavy_modules": runs[-1]["heavy"],
+        }
+    if "api" in report and "worker" in report:
+        report["saved"] = {
+            "seconds": round(report["worker"]["seconds_median"] - report["api"]["seconds_median"], 4),
+            "rss_mb": round(report["worker"]["rss_mb_median"] - report["api"]["rss_mb_median"], 1),
+        }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
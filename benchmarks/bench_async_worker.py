@@ -0,0 +1,85 @@
+"""
+Throughput benchmark for the asyncio worker against a fake OpenAI endpoint.
+
+Enqueues generation jobs on a dedicated RQ queue and drains it with
+AsyncWorker at each requested concurrency, reporting jobs/sec and jobs per
+CPU-second. Concurrency 1 approximates a plain one-job-at-a-time rq worker.
+Start the OpenAI stub first; with --in-memory, Mongo and Redis are replaced
+by mongomock and fakeredis so nothing else needs to be running.
+
+    python benchmarks/openai_stub.py --port 8100 --latency 2.0
+    python benchmarks/bench_async_worker.py --jobs 40 --concurrency 1 10 40 --in-memory
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from bench_common import use_in_memory_stores
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8100/v1")
+    parser.add_argument("--jobs", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 40])
+    parser.add_argument("--backend", default="completions", choices=["assistants", "completions"])
+    parser.add_argument("--in-memory", action="store_true", help="use mongomock and fakeredis")
+    args = parser.parse_args()
+
+    os.environ["OPENAI_BASE_URL"] = args.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    os.environ.setdefault("OPENAI_POLL_INTERVAL", "0.2")
+    # Measure the worker, not the OpenAI budget
+    os.environ.setdefault("ADMISSION_CONTROL", "0")
+    if args.in_memory:
+        use_in_memory_stores()
+
+    import scheduler
+    import worker
+    from async_worker import AsyncWorker
+
+    worker.db["ai_assistants"].update_one(
+        {"technology": "Benchmark"},
+        {"$set": {"assistant_id": "asst_stub", "backend": args.backend}},
+        upsert=True,
+    )
+    worker.assistant_registry.invalidate()
+    # As async_worker.py does at startup
+    worker.warm_up()
+
+    async def levels():
+        # One event loop for all of them; the OpenAI client's connections belong to it
+        results = []
+        for concurrency in args.concurrency:
+            for _ in range(args.jobs):
+                request = worker.GenerateQuestionRequestModel(
+                    technology_name="Benchmark", concepts=["state", "hooks"], difficulty_level="easy",
+                    number_of_questions=5, company_Id="bench", strict_question=False,
+                )
+                scheduler.submit(worker.redis_conn, "interactive", worker.process_question_generation_task,
+                                 (request, str(uuid.uuid4()), []), "bench", request.number_of_questions)
+
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            await AsyncWorker(["interactive"], worker.redis_conn, concurrency).run(burst=True)
+            wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+            results.append({
+                "concurrency": concurrency,
+                "jobs": args.jobs,
+                "wall_s": round(wall, 2),
+                "jobs_per_s": round(args.jobs / wall, 2),
+                "cpu_s": round(cpu, 2),
+                "jobs_per_cpu_s": round(args.jobs / cpu, 2) if cpu else None,
+            })
+        return results
+
+    print(json.dumps(asyncio.run(levels()), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Latency comparison of the generation backends.
+
+Runs the same prompt through the Assistants and completions backends against
+an OpenAI-compatible endpoint (by default the local stub) and reports the wall
+time per generation. Start the stub first:
+
+    python benchmarks/openai_stub.py --port 8100 --latency 2.0
+    python benchmarks/bench_backends.py --base-url http://127.0.0.1:8100/v1 --runs 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from openai import AsyncOpenAI  # noqa: E402
+
+from generation_backends import GENERATION_BACKENDS  # noqa: E402
+
+PROMPT = "Generate 10 easy multiple-choice questions based on the React Technology and the concepts: state, hooks."
+
+
+async def measure(backend, assistant: dict, runs: int) -> list:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        session = await backend.start(assistant)
+        try:
+            structured_response, _, _ = await session.generate(PROMPT)
+        finally:
+            await session.close()
+        timings.append(time.perf_counter() - start)
+        if not structured_response:
+            raise RuntimeError(f"{backend.name} returned no questions")
+    return timings
+
+
+async def compare(client, assistant: dict, runs: int) -> dict:
+    results = {}
+    for name, backend_class in GENERATION_BACKENDS.items():
+        timings = await measure(backend_class(client), assistant, runs)
+        results[name] = {
+            "runs": runs,
+            "mean_s": round(statistics.mean(timings), 3),
+            "min_s": round(min(timings), 3),
+            "max_s": round(max(timings), 3),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8100/v1")
+    parser.add_argument("--api-key", default=os.getenv("OPENAI_API_KEY", "stub"))
+    parser.add_argument("--assistant-id", default="asst_stub")
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    client = AsyncOpenAI(api_key=args.api_key, base_url=args.base_url)
+    assistant = {"technology": "React", "assistant_id": args.assistant_id, "model": args.model}
+    results = asyncio.run(compare(client, assistant, args.runs))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+Helpers shared by the benchmark scripts.
+
+Import them from a script in this directory (its own directory is on
+sys.path), after putting app/ on sys.path as the scripts already do:
+
+    from bench_common import percentile, use_in_memory_stores
+"""
+import os
+
+
+def percentile(values: list, pct: float):
+    """Nearest-rank percentile, rounded to 2 places; None for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))], 2)
+
+
+def use_in_memory_stores():
+    """Point db_manager at mongomock and fakeredis before anything connects; returns (db, redis_conn)."""
+    import fakeredis
+    import mongomock
+
+    # db_manager insists on these at import; nothing connects to them
+    for name, placeholder in (("MONGO_URI", "mongodb://unused"), ("REDIS_HOST", "localhost"),
+                              ("REDIS_PORT", "6379"), ("REDIS_PASSWORD", "unused")):
+        os.environ.setdefault(name, placeholder)
+    import db_manager
+
+    db = mongomock.MongoClient()["hyreV3"]
+    redis_conn = fakeredis.FakeRedis()
+    db_manager.get_mongo_connection = lambda: db
+    db_manager.get_redis_connection = lambda: redis_conn
+    db_manager.get_async_redis_connection = lambda: fakeredis.FakeAsyncRedis()
+    return db, redis_conn
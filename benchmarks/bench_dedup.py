@@ -0,0 +1,380 @@
+"""
+Deduplication cost and quality across bank sizes.
+
+For each bank size, builds a synthetic (technology, difficulty) bank from the
+vocabulary of 1731318394.json, stored the way FindDuplicatesBatch stores
+questions (hash, normalized text, MinHash signature, LSH bands), then runs a
+probe set through it: exact copies of bank questions, near duplicates (a word
+dropped, swapped or added, or case and punctuation changed) and new questions.
+
+Reported per bank size:
+- each stage on its own (exact hash, MinHash over the LSH candidates, TF-IDF
+  over the tag bucket) as a forked job runs it: ms per question and
+  precision/recall against the probe labels
+- the whole pipeline (FindDuplicatesBatch), cold as in a forked rq job and
+  warm against a preloaded QuestionBank: ms per question, questions/s,
+  precision/recall and ms per question spent in each stage
+
+Scaling: warm, MinHash only scores each question's LSH bucket-mates and
+TF-IDF only the questions sharing one of its rarer terms (the model's
+inverted index), so both grow with how many questions look alike, not with
+the bank. The synthetic bank draws every question from a ~80 word
+vocabulary, which is close to the worst case for the inverted index: most
+questions share a rare enough term, so the TF-IDF candidates stay a large,
+roughly constant share of the bank. Cold, TF-IDF scores the same LSH
+candidates MinHash read, so neither stage reads the whole tag bucket. On
+mongomock the Mongo stages (exact_hash, bank_refresh, mongo_insert and all
+cold stages) scan the collection, as it has no indexes.
+- process RSS after the bank is built, and what loading the warm bank adds
+
+Uses mongomock by default, which holds everything in process memory and has
+no indexes, so bank sizes past ~100k are meant for --mongo-uri against a
+local mongod (a scratch database is created and dropped per size).
+
+Results are printed and, with --output, written as JSON. --baseline compares
+against an earlier result file and exits 1 when a pipeline got slower by
+more than --tolerance or lost recall.
+
+    python benchmarks/bench_dedup.py --sizes 1000 10000 --output dedup.json
+    python benchmarks/bench_dedup.py --mongo-uri mongodb://localhost:27017 --engine numpy \\
+        --sizes 1000 10000 100000 1000000 --baseline dedup.json
+"""
+import argparse
+import copy
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import fakeredis
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from bench_minhash import synthetic_questions  # noqa: E402
+import metrics  # noqa: E402
+from id_allocator import QuestionIdAllocator  # noqa: E402
+from lsh_index import LSHIndex, ensure_indexes  # noqa: E402
+from question_bank import QuestionBankCache  # noqa: E402
+from question_bank import ensure_indexes as ensure_bank_indexes  # noqa: E402
+import tfidf_minhash  # noqa: E402
+from tfidf_minhash import (  # noqa: E402
+    FindDuplicatesBatch, _max_minhash_similarity, _ids_by_tag, _tfidf_bank_duplicates, candidate_projection,
+    generate_question_hash, get_minhash, get_normalized_question, get_shingles, get_stored_signature,
+    get_tfidf_model, preprocess_question, question_index_fields,
+)
+
+METADATA = {"technology": "Benchmark", "difficulty": "easy"}
+TAGS = ["state", "hooks", "props", "effects"]
+FILLERS = ["really", "exactly", "typically", "still", "also"]
+PROBE_COMPANY = "bench-probe"
+REQUEST = SimpleNamespace(company_Id=PROBE_COMPANY, strict_question=False)
+INSERT_CHUNK = 5000
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        # Peak rather than current RSS where /proc is unavailable
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def mcq(text: str, tag: str, question_id: int) -> dict:
+    return {
+        "id": question_id, "question": text, "choices": ["a", "b", "c", "d"],
+        "correct_answer": 0, "weightage": 1, "tags": [tag], "type": "objective",
+    }
+
+
+def build_bank(db, minhash, lsh, size: int) -> list:
+    """Insert `size` questions straight into generated_questions; returns their texts."""
+    texts = synthetic_questions(size, seed=11)
+    # One second apart, so a bank refresh only re-reads the last few
+    created_at = int(time.time()) - 3600 - size
+    for start in range(0, size, INSERT_CHUNK):
+        chunk = texts[start:start + INSERT_CHUNK]
+        signatures = minhash.get_signatures([get_shingles(text) for text in chunk])
+        db["generated_questions"].insert_many([{
+            "question": mcq(text, TAGS[(start + index) % len(TAGS)], start + index + 1),
+            "hash": generate_question_hash(text, METADATA),
+            "metadata": dict(METADATA),
+            "created_at": created_at + start + index,
+            "generated_by": "bench",
+            "strict_question": False,
+            **question_index_fields(text, minhash, lsh, signatures[index]),
+        } for index, text in enumerate(chunk)], ordered=False)
+    return texts
+
+
+def near_duplicate(text: str, rng: random.Random) -> str:
+    words = text.rstrip("?").split()
+    edit = rng.choice(("drop", "swap", "insert", "case"))
+    if edit == "drop":
+        del words[rng.randrange(len(words))]
+    elif edit == "swap":
+        index = rng.randrange(len(words) - 1)
+        words[index], words[index + 1] = words[index + 1], words[index]
+    elif edit == "insert":
+        words.insert(rng.randrange(len(words) + 1), rng.choice(FILLERS))
+    else:
+        return " ".join(word.capitalize() if rng.random() < 0.3 else word for word in words) + "!"
+    return " ".join(words) + "?"
+
+
+def probe_set(bank_texts: list, count: int, seed: int) -> list:
+    """(question, label) pairs, label being "exact", "near" or "unique"."""
+    rng = random.Random(seed)
+    duplicates = count // 4
+    sources = rng.sample(range(len(bank_texts)), min(2 * duplicates, len(bank_texts)))
+    probes = []
+    for position, source in enumerate(sources):
+        label = "exact" if position < duplicates else "near"
+        text = bank_texts[source] if label == "exact" else near_duplicate(bank_texts[source], rng)
+        probes.append((mcq(text, TAGS[source % len(TAGS)], position + 1), label))
+    for index, text in enumerate(synthetic_questions(count - len(probes), seed=seed + 1)):
+        probes.append((mcq(text, rng.choice(TAGS), len(probes) + 1), "unique"))
+    rng.shuffle(probes)
+    return probes
+
+
+def quality(labels: list, flagged: list) -> dict:
+    true_positive = sum(1 for label, flag in zip(labels, flagged) if flag and label != "unique")
+    false_positive = sum(1 for label, flag in zip(labels, flagged) if flag and label == "unique")
+    positives = sum(1 for label in labels if label != "unique")
+    result = {
+        "precision": round(true_positive / (true_positive + false_positive), 4) if true_positive + false_positive else None,
+        "recall": round(true_positive / positives, 4) if positives else None,
+    }
+    for kind in ("exact", "near", "unique"):
+        rows = [flag for label, flag in zip(labels, flagged) if label == kind]
+        result[f"{kind}_flagged"] = round(sum(rows) / len(rows), 4) if rows else None
+    return result
+
+
+def timing(seconds: float, questions: int) -> dict:
+    return {
+        "ms_per_question": round(seconds / questions * 1000, 3),
+        "questions_per_s": round(questions / seconds, 1) if seconds else None,
+    }
+
+
+def exact_stage(collection, questions: list) -> list:
+    hashes = [generate_question_hash(question["question"], METADATA) for question in questions]
+    existing = {doc["hash"] for doc in collection.find({"hash": {"$in": hashes}}, {"hash": 1})}
+    return [hash_value in existing for hash_value in hashes]
+
+
+def minhash_stage(collection, minhash, lsh, questions: list, threshold: float) -> list:
+    signatures = minhash.get_signatures([get_shingles(question["question"]) for question in questions])
+    tags = [set(question["tags"]) for question in questions]
+    band_keys = sorted({key for signature in signatures for key in lsh.band_keys(signature)})
+    candidates = list(collection.find({
+        "metadata.technology": METADATA["technology"],
+        "metadata.difficulty": METADATA["difficulty"],
+        "question.tags": {"$in": sorted(set().union(*tags))},
+        "lsh_bands": {"$in": band_keys},
+    }, dict(candidate_projection(minhash), **{"question.tags": 1})))
+    candidate_signatures = [get_stored_signature(doc, minhash) for doc in candidates]
+    return [_max_minhash_similarity(minhash, signature, [
+        candidate_signatures[index] for index, doc in enumerate(candidates)
+        if question_tags & set(doc["question"].get("tags", []))
+    ]) > threshold for signature, question_tags in zip(signatures, tags)]
+
+
+def tfidf_stage(collection, questions: list, threshold: float) -> list:
+    tags = [set(question["tags"]) for question in questions]
+    documents = list(collection.find({
+        "metadata.technology": METADATA["technology"],
+        "metadata.difficulty": METADATA["difficulty"],
+        "question.tags": {"$in": sorted(set().union(*tags))},
+    }, {"question.id": 1, "question.question": 1, "question.tags": 1, "normalized_question": 1}))
+    texts = [preprocess_question(question["question"]) for question in questions]
+    model = get_tfidf_model(METADATA)
+    for doc in documents:
+        model.add(doc["question"]["id"], get_normalized_question(doc))
+    return _tfidf_bank_duplicates(model, texts, tags, _ids_by_tag(documents), threshold)
+
+
+def run_stages(db, minhash, lsh, sets: list, threshold: float) -> dict:
+    collection = db["generated_questions"]
+    stages = {
+        "exact_hash": lambda questions: exact_stage(collection, questions),
+        "minhash": lambda questions: minhash_stage(collection, minhash, lsh, questions, threshold),
+        "tfidf": lambda questions: tfidf_stage(collection, questions, threshold),
+    }
+    labels = [label for probes in sets for _, label in probes]
+    results = {}
+    for name, stage in stages.items():
+        flagged, elapsed = [], 0.0
+        for probes in sets:
+            # Each set starts from an empty TF-IDF model, as a forked job does
+            tfidf_minhash._tfidf_models.clear()
+            started = time.perf_counter()
+            flagged.extend(stage([question for question, _ in probes]))
+            elapsed += time.perf_counter() - started
+        results[name] = dict(timing(elapsed, len(labels)), **quality(labels, flagged))
+    return results
+
+
+def stage_seconds(redis_conn) -> dict:
+    """Seconds each pipeline stage has spent so far, from the qgen_stage_seconds histogram."""
+    metrics.push(redis_conn)
+    prefix = 'qgen_stage_seconds_sum{stage="'
+    return {
+        field.decode("utf-8")[len(prefix):-2]: float(value)
+        for field, value in redis_conn.hgetall(metrics.METRICS_KEY).items()
+        if field.decode("utf-8").startswith(prefix)
+    }
+
+
+def run_pipeline(db, minhash, lsh, sets: list, threshold: float, banks=None) -> dict:
+    allocator = QuestionIdAllocator(db)
+    redis_conn = fakeredis.FakeRedis()
+    before = stage_seconds(redis_conn)
+    labels, flagged, elapsed = [], [], 0.0
+    for probes in sets:
+        questions = copy.deepcopy([question for question, _ in probes])
+        if banks is None:
+            tfidf_minhash._tfidf_models.clear()
+        started = time.perf_counter()
+        _, duplicates = FindDuplicatesBatch(
+            questions, METADATA, minhash, db, REQUEST, lsh, allocator, threshold=threshold,
+            bank=banks.get(METADATA) if banks is not None else None,
+        )
+        elapsed += time.perf_counter() - started
+        duplicates = set(duplicates)
+        labels.extend(label for _, label in probes)
+        flagged.extend(question["question"] in duplicates for question, _ in probes)
+        # Keep the bank at its nominal size for the next set
+        db["generated_questions"].delete_many({"generated_by": PROBE_COMPANY})
+    after = stage_seconds(redis_conn)
+    stages = {stage: round((seconds - before.get(stage, 0)) / len(labels) * 1000, 3) for stage, seconds in after.items()}
+    return dict(timing(elapsed, len(labels)), **quality(labels, flagged), stage_ms_per_question=stages)
+
+
+def run_size(client, size: int, args) -> dict:
+    database = f"bench_dedup_{uuid.uuid4().hex[:8]}"
+    db = client[database]
+    try:
+        minhash = get_minhash(args.engine, num_permutations=args.permutations)
+        lsh = LSHIndex(engine=minhash.name)
+        ensure_indexes(db)
+        ensure_bank_indexes(db)
+        tfidf_minhash._tfidf_models.clear()
+        rss_before = rss_mb()
+        started = time.perf_counter()
+        bank_texts = build_bank(db, minhash, lsh, size)
+        build_seconds = time.perf_counter() - started
+        rss_bank = rss_mb()
+        probes = probe_set(bank_texts, args.probes, seed=size)
+        sets = [probes[start:start + args.set_size] for start in range(0, len(probes), args.set_size)]
+        print(f"bank {size}: built in {build_seconds:.1f}s", file=sys.stderr)
+
+        stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+        try:
+            stages = run_stages(db, minhash, lsh, sets, args.threshold)
+            cold = run_pipeline(db, minhash, lsh, sets, args.threshold)
+            tfidf_minhash._tfidf_models.clear()
+            warm = None
+            if not args.skip_warm:
+                rss_cold = rss_mb()
+                banks = QuestionBankCache(db, minhash, lsh)
+                started = time.perf_counter()
+                banks.preload()
+                preload_seconds = time.perf_counter() - started
+                warm = dict(
+                    run_pipeline(db, minhash, lsh, sets, args.threshold, banks),
+                    preload_s=round(preload_seconds, 2),
+                    preload_rss_mb=round(rss_mb() - rss_cold, 1),
+                )
+                banks.clear()
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        return {
+            "bank": size,
+            "probes": len(probes),
+            "build_s": round(build_seconds, 1),
+            "bank_rss_mb": round(rss_bank - rss_before, 1),
+            "stages": stages,
+            "pipeline": {"cold": cold, "warm": warm},
+        }
+    finally:
+        client.drop_database(database)
+        tfidf_minhash._tfidf_models.clear()
+
+
+def regressions(report: dict, baseline: dict, tolerance: float) -> list:
+    found = []
+    previous = {run["bank"]: run for run in baseline.get("runs", [])}
+    for run in report["runs"]:
+        before = previous.get(run["bank"])
+        if before is None:
+            continue
+        for mode in ("cold", "warm"):
+            now, then = run["pipeline"].get(mode), before["pipeline"].get(mode)
+            if not now or not then:
+                continue
+            if now["ms_per_question"] > then["ms_per_question"] * (1 + tolerance):
+                found.append(f"bank {run['bank']} {mode}: {then['ms_per_question']} -> {now['ms_per_question']} ms/question")
+            if (now["recall"] or 0) < (then["recall"] or 0):
+                found.append(f"bank {run['bank']} {mode}: recall {then['recall']} -> {now['recall']}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--probes", type=int, default=200, help="probe questions per bank size")
+    parser.add_argument("--set-size", type=int, default=10, help="questions per generated set")
+    parser.add_argument("--threshold", type=float, default=0.85)
+    parser.add_argument("--engine", help="MinHash engine (default: MINHASH_ENGINE)")
+    parser.add_argument("--permutations", type=int, default=100)
+    parser.add_argument("--skip-warm", action="store_true", help="skip the preloaded QuestionBank pipeline")
+    parser.add_argument("--mongo-uri")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="earlier JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before flagging, as a fraction")
+    args = parser.parse_args()
+
+    if args.mongo_uri:
+        from pymongo import MongoClient
+        client = MongoClient(args.mongo_uri)
+    else:
+        import mongomock
+        client = mongomock.MongoClient()
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "mongo": "mongod" if args.mongo_uri else "mongomock",
+        "engine": get_minhash(args.engine).name,
+        "permutations": args.permutations,
+        "threshold": args.threshold,
+        "set_size": args.set_size,
+        "runs": [run_size(client, size, args) for size in args.sizes],
+    }
+    failed = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            failed = regressions(report, json.load(f), args.tolerance)
+        report["regressions"] = failed
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
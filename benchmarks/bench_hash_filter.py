@@ -0,0 +1,89 @@
+"""
+False positive rate and lookup cost of the exact-hash Bloom filter.
+
+Adds --items question hashes to a HashFilter sized for --capacity, then
+checks --probes hashes that were never added, in sets of --set-size as the
+worker does. Reports the measured false positive rate next to the configured
+one and the time per set lookup, which is one BITFIELD command. Uses
+fakeredis unless --redis-url is given (the filter keys are deleted after).
+
+    python benchmarks/bench_hash_filter.py --items 100000 --capacity 200000
+    python benchmarks/bench_hash_filter.py --redis-url redis://:root@localhost:6379/15 --items 2000000
+"""
+import argparse
+import hashlib
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from hash_filter import HashFilter  # noqa: E402
+
+
+def synthetic_hashes(count: int, prefix: str) -> list:
+    return [hashlib.sha256(f"{prefix}:{index}".encode("utf-8")).hexdigest() for index in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100000, help="hashes added to the filter")
+    parser.add_argument("--capacity", type=int, default=200000)
+    parser.add_argument("--error-rate", type=float, default=0.001)
+    parser.add_argument("--probes", type=int, default=20000, help="hashes never added, checked after filling")
+    parser.add_argument("--set-size", type=int, default=10)
+    parser.add_argument("--redis-url")
+    args = parser.parse_args()
+
+    if args.redis_url:
+        import redis
+        redis_conn = redis.Redis.from_url(args.redis_url)
+    else:
+        import fakeredis
+        redis_conn = fakeredis.FakeRedis()
+
+    hash_filter = HashFilter(redis_conn, args.capacity, args.error_rate)
+    try:
+        started = time.perf_counter()
+        items = synthetic_hashes(args.items, "stored")
+        for start in range(0, len(items), 5000):
+            hash_filter.add(items[start:start + 5000])
+        fill_seconds = time.perf_counter() - started
+        redis_conn.set(hash_filter.ready_key, int(time.time()))
+
+        probes = synthetic_hashes(args.probes, "new")
+        false_positives, timings = 0, []
+        for start in range(0, len(probes), args.set_size):
+            started = time.perf_counter()
+            false_positives += len(hash_filter.possible(probes[start:start + args.set_size]))
+            timings.append(time.perf_counter() - started)
+        # Every stored hash has to come back as possible
+        missed = sum(
+            args.set_size - len(hash_filter.possible(items[start:start + args.set_size]))
+            for start in range(0, min(len(items), args.probes), args.set_size)
+        )
+
+        print(json.dumps({
+            "items": args.items,
+            "capacity": args.capacity,
+            "bits": hash_filter.bits,
+            "bytes": redis_conn.strlen(hash_filter.key),
+            "hashes_per_item": hash_filter.hashes,
+            "configured_false_positive_rate": args.error_rate,
+            "measured_false_positive_rate": round(false_positives / len(probes), 6),
+            "expected_false_positive_rate": round(hash_filter.stats()["expected_false_positive_rate"], 6),
+            "false_negatives": missed,
+            "fill_s": round(fill_seconds, 2),
+            "lookup_ms_per_set": {
+                "p50": round(statistics.median(timings) * 1000, 3),
+                "max": round(max(timings) * 1000, 3),
+            },
+        }, indent=2))
+    finally:
+        redis_conn.delete(hash_filter.key, hash_filter.ready_key)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Microbenchmark for the MinHash signature engines.
+
+Signs synthetic questions shaped like the sample mcq_set in 1731318394.json with
+the legacy md5 engine and the NumPy engine (per question and batched).
+
+    python benchmarks/bench_minhash.py --questions 2000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from tfidf_minhash import MinHash, NumpyMinHash, get_shingles  # noqa: E402
+
+SAMPLE_FILE = os.path.join(os.path.dirname(__file__), "..", "1731318394.json")
+
+
+def synthetic_questions(count: int, seed: int = 7) -> list:
+    with open(SAMPLE_FILE) as f:
+        sample = json.load(f)
+    words = sorted({
+        word
+        for question in sample["mcq_set"]["questions"]
+        for text in [question["question"], *question["choices"]]
+        for word in text.split()
+    })
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(8, 20))) + "?" for _ in range(count)]
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=2000)
+    parser.add_argument("--permutations", type=int, default=100)
+    args = parser.parse_args()
+
+    documents = [get_shingles(text) for text in synthetic_questions(args.questions)]
+    legacy = MinHash(num_permutations=args.permutations)
+    vectorized = NumpyMinHash(num_permutations=args.permutations)
+
+    _, legacy_time = timed(lambda: [legacy.get_signature(d) for d in documents])
+    _, single_time = timed(lambda: [vectorized.get_signature(d) for d in documents])
+    _, batch_time = timed(lambda: vectorized.get_signatures(documents))
+
+    results = {
+        "questions": args.questions,
+        "permutations": args.permutations,
+        "md5_per_question_us": legacy_time / args.questions * 1e6,
+        "numpy_per_question_us": single_time / args.questions * 1e6,
+        "numpy_batch_per_question_us": batch_time / args.questions * 1e6,
+        "speedup_single": legacy_time / single_time,
+        "speedup_batch": legacy_time / batch_time,
+        "md5_signature_bytes": sum(v.bit_length() // 8 + 1 for v in legacy.get_signature(documents[0])),
+        "numpy_signature_bytes": vectorized.get_signature(documents[0]).nbytes,
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
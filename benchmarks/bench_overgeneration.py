@@ -0,0 +1,105 @@
+"""
+Attempts per job and tokens per accepted question, with and without
+over-generation (overgeneration.py), against the OpenAI stub.
+
+Each variant runs in its own interpreter on mongomock and fakeredis, with a
+technology name of its own so the stub only repeats questions that variant
+has seen. Jobs run through AsyncWorker in waves of --concurrency, so the
+duplicate rates recorded by early jobs shape the later ones, as they would in
+production. Start the stub with a duplicate rate first:
+
+    python benchmarks/openai_stub.py --port 8100 --latency 0.5 --duplicate-rate 0.2
+    python benchmarks/bench_overgeneration.py --jobs 40 --questions 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from bench_common import use_in_memory_stores
+
+
+def run_variant(args) -> dict:
+    db, redis_conn = use_in_memory_stores()
+
+    import metrics
+    import scheduler
+    import worker
+    from async_worker import AsyncWorker
+
+    technology = f"Bench{uuid.uuid4().hex[:6]}"
+    db["ai_assistants"].insert_one({"technology": technology, "assistant_id": "asst_stub", "backend": "completions"})
+    worker.assistant_registry.invalidate()
+    worker.warm_up()
+
+    async def wave(count: int):
+        for _ in range(count):
+            request = worker.GenerateQuestionRequestModel(
+                technology_name=technology, concepts=["state", "hooks", "props"], difficulty_level="easy",
+                number_of_questions=args.questions, company_Id="bench", strict_question=False,
+            )
+            scheduler.submit(redis_conn, "interactive", worker.process_question_generation_task,
+                             (request, str(uuid.uuid4()), []), "bench", request.number_of_questions)
+        await AsyncWorker(["interactive"], redis_conn, args.concurrency).run(burst=True)
+
+    async def waves():
+        # One event loop for all of them; the OpenAI client's connections belong to it
+        for start in range(0, args.jobs, args.concurrency):
+            await wave(min(args.concurrency, args.jobs - start))
+
+    asyncio.run(waves())
+
+    worker.usage_recorder.flush()
+    metrics.push(redis_conn)
+    totals = {key.decode("utf-8"): float(value) for key, value in redis_conn.hgetall(metrics.METRICS_KEY).items()}
+    events = list(db["question_gen_usage"].find({}, {"_id": 0}))
+    tokens = sum(event["total_tokens"] for event in events)
+    stored = totals.get("qgen_questions_stored_total", 0)
+    surplus = totals.get("qgen_surplus_questions_total", 0)
+    return {
+        "jobs": len(events),
+        "succeeded": sum(1 for event in events if event["status"] == "success"),
+        "attempts_mean": round(sum(event["attempts"] for event in events) / len(events), 3),
+        "single_attempt_share": round(sum(1 for event in events if event["attempts"] == 1) / len(events), 3),
+        "tokens_per_accepted_question": round(tokens / (stored - surplus), 1) if stored > surplus else None,
+        "questions_generated": int(totals.get("qgen_questions_generated_total", 0)),
+        "surplus_left_in_bank": int(surplus),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8100/v1")
+    parser.add_argument("--jobs", type=int, default=40)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--variant", choices=["off", "on"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        print(json.dumps(run_variant(args)))
+        return
+
+    report = {}
+    for variant in ("off", "on"):
+        env = dict(os.environ, OPENAI_BASE_URL=args.base_url, OVERGENERATION="1" if variant == "on" else "0",
+                   ADMISSION_CONTROL="0")
+        env.setdefault("OPENAI_API_KEY", "stub")
+        completed = subprocess.run(
+            [sys.executable, __file__, "--variant", variant, "--jobs", str(args.jobs),
+             "--questions", str(args.questions), "--concurrency", str(args.concurrency)],
+            env=env, capture_output=True, text=True,
+        )
+        if completed.returncode:
+            raise RuntimeError(f"variant {variant} failed:\n{completed.stderr[-4000:]}")
+        report[variant] = json.loads(completed.stdout.strip().splitlines()[-1])
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Queue-wait simulation of the scheduler lanes against the old single FIFO queue.
+
+A discrete-event run on a virtual clock, so it takes seconds however long
+the simulated period is. --workers job slots serve:
+
+- one company dropping a burst of --burst 10-question (bulk) jobs at t=0,
+- a few other companies sending bulk jobs now and then,
+- interactive 3-question jobs from many companies at --interactive-rate/s,
+- pool refills trickling in.
+
+Each job holds a slot for --base-seconds plus --per-question seconds per
+question. "fifo" runs jobs in arrival order, as the single default queue
+did; "lanes" pushes and pops through scheduler.py (on fakeredis), with its
+priority lanes and per-company fair queueing, and keeps --reserve of the
+slots for interactive jobs as async_worker.py does. Reports queue wait
+p50/p99/max per job class.
+
+    python benchmarks/bench_scheduler.py
+    python benchmarks/bench_scheduler.py --workers 40 --burst 200 --duration 600
+"""
+import argparse
+import heapq
+import json
+import os
+import random
+import sys
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from bench_common import percentile
+
+
+def build_jobs(args) -> list:
+    rng = random.Random(args.seed)
+    jobs = [{"at": 0.0, "company": "burst", "questions": 10, "lane": "bulk", "kind": "bulk_burst"}
+            for _ in range(args.burst)]
+    for kind, lane, questions, rate, companies in (
+        ("interactive", "interactive", 3, args.interactive_rate, 50),
+        ("bulk_other", "bulk", 10, args.bulk_rate, 5),
+        ("refill", "refill", 10, args.refill_rate, 1),
+    ):
+        t = rng.expovariate(rate)
+        while t < args.duration:
+            company = "replenisher" if kind == "refill" else f"{kind}-{rng.randrange(companies)}"
+            jobs.append({"at": t, "company": company, "questions": questions, "lane": lane, "kind": kind})
+            t += rng.expovariate(rate)
+    jobs.sort(key=lambda job: job["at"])
+    for index, job in enumerate(jobs):
+        job["id"] = f"job-{index}"
+    return jobs
+
+
+class FifoQueue:
+    def __init__(self):
+        self.items = deque()
+
+    def push(self, job):
+        self.items.append(job)
+
+    def pop(self, background: bool):
+        return self.items.popleft() if self.items else None
+
+
+class LaneQueue:
+    def __init__(self, jobs_by_id: dict):
+        import fakeredis
+
+        self.redis_conn = fakeredis.FakeRedis()
+        self.jobs_by_id = jobs_by_id
+
+    def push(self, job):
+        import scheduler
+
+        scheduler.push(self.redis_conn, job["lane"], job["id"], job["company"], job["questions"])
+
+    def pop(self, background: bool):
+        import scheduler
+
+        lanes = scheduler.LANES if background else ("interactive",)
+        if not any(scheduler.depth(self.redis_conn, lane) for lane in lanes):
+            return None
+        _, member = scheduler.pop(self.redis_conn, lanes, timeout=1)
+        return self.jobs_by_id[member]
+
+
+def simulate(jobs: list, queue, args, reserved: int = 0) -> dict:
+    running = []  # (finish time, bulk or refill job)
+    waits = {}
+    index, now = 0, 0.0
+    while True:
+        while index < len(jobs) and jobs[index]["at"] <= now:
+            queue.push(jobs[index])
+            index += 1
+        while len(running) < args.workers:
+            background = sum(job_background for _, job_background in running) < args.workers - reserved
+            job = queue.pop(background)
+            if job is None:
+                break
+            waits.setdefault(job["kind"], []).append(now - job["at"])
+            service = args.base_seconds + args.per_question * job["questions"]
+            heapq.heappush(running, (now + service, job["lane"] != "interactive"))
+        upcoming = [running[0][0]] if running else []
+        if index < len(jobs):
+            upcoming.append(jobs[index]["at"])
+        if not upcoming:
+            break
+        now = min(upcoming)
+        while running and running[0][0] <= now:
+            heapq.heappop(running)
+    return {
+        kind: {"jobs": len(values), "p50_s": percentile(values, 50), "p99_s": percentile(values, 99),
+               "max_s": round(max(values), 2)}
+        for kind, values in sorted(waits.items())
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=20)
+    parser.add_argument("--burst", type=int, default=100, help="bulk jobs one company submits at t=0")
+    parser.add_argument("--duration", type=float, default=300, help="seconds of arrivals")
+    parser.add_argument("--interactive-rate", type=float, default=1.0, help="interactive jobs per second")
+    parser.add_argument("--bulk-rate", type=float, default=0.1, help="bulk jobs per second from other companies")
+    parser.add_argument("--refill-rate", type=float, default=0.2, help="refill jobs per second")
+    parser.add_argument("--base-seconds", type=float, default=4.0)
+    parser.add_argument("--per-question", type=float, default=1.0)
+    parser.add_argument("--reserve", type=float, default=0.25, help="share of slots kept for interactive jobs")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    jobs = build_jobs(args)
+    report = {
+        "jobs": len(jobs),
+        "fifo": simulate(jobs, FifoQueue(), args),
+        "lanes": simulate(jobs, LaneQueue({job["id"]: job for job in jobs}), args, int(args.workers * args.reserve)),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Job latency by question count, with and without concept sharding (SHARD_SIZE
+in worker.py), against the OpenAI stub.
+
+Each variant runs in its own interpreter on mongomock and fakeredis; "single"
+sets SHARD_SIZE high enough that every job is one generation, as before.
+Jobs run one at a time, so the latency is the job's own and not queueing.
+The stub should charge per question asked for, as output tokens do:
+
+    python benchmarks/openai_stub.py --port 8100 --latency 1 --per-question 0.3 --duplicate-rate 0.1
+    python benchmarks/bench_sharding.py --counts 10,20,30,40,50 --jobs 3
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from bench_common import percentile, use_in_memory_stores
+
+
+def run_variant(args) -> dict:
+    db, _ = use_in_memory_stores()
+
+    import worker
+
+    technology = f"Bench{uuid.uuid4().hex[:6]}"
+    db["ai_assistants"].insert_one({"technology": technology, "assistant_id": "asst_stub", "backend": "completions"})
+    worker.assistant_registry.invalidate()
+    worker.warm_up()
+    concepts = ["state", "hooks", "props", "context", "effects", "routing"]
+
+    async def jobs():
+        # One event loop for all of them; the OpenAI client's connections belong to it
+        report = {}
+        for count in args.counts:
+            latencies, delivered = [], []
+            for _ in range(args.jobs):
+                request = worker.GenerateQuestionRequestModel(
+                    technology_name=technology, concepts=concepts, difficulty_level="easy",
+                    number_of_questions=count, company_Id="bench", strict_question=False,
+                )
+                started = time.perf_counter()
+                result = await worker.process_question_generation_task(request, str(uuid.uuid4()), [])
+                latencies.append(time.perf_counter() - started)
+                delivered.append(result["total_questions"])
+            report[str(count)] = {
+                "shards": len(worker.plan_shards(request)),
+                "p50_s": percentile(latencies, 50),
+                "max_s": round(max(latencies), 2),
+                "questions_mean": round(sum(delivered) / len(delivered), 1),
+            }
+        return report
+
+    return asyncio.run(jobs())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8100/v1")
+    parser.add_argument("--counts", default="10,20,30,40,50", help="questions per job, comma separated")
+    parser.add_argument("--jobs", type=int, default=3, help="jobs per count")
+    parser.add_argument("--variant", choices=["single", "sharded"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.counts = [int(count) for count in args.counts.split(",")]
+
+    if args.variant:
+        print(json.dumps(run_variant(args)))
+        return
+
+    report = {}
+    for variant in ("single", "sharded"):
+        env = dict(os.environ, OPENAI_BASE_URL=args.base_url, ADMISSION_CONTROL="0")
+        if variant == "single":
+            env["SHARD_SIZE"] = "1000"
+        env.setdefault("OPENAI_API_KEY", "stub")
+        completed = subprocess.run(
+            [sys.executable, __file__, "--variant", variant, "--counts", ",".join(map(str, args.counts)),
+             "--jobs", str(args.jobs)],
+            env=env, capture_output=True, text=True,
+        )
+        if completed.returncode:
+            raise RuntimeError(f"variant {variant} failed:\n{completed.stderr[-4000:]}")
+        report[variant] = json.loads(completed.stdout.strip().splitlines()[-1])
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Per-job dedup cost in a fresh process versus a warm long-lived worker.
+
+Fills one (technology, difficulty) bank with synthetic questions, then
+deduplicates a series of generated sets two ways:
+
+- cold: empty TF-IDF models and no question bank, as in a freshly forked rq
+  job; candidates and signatures are read from Mongo for every set.
+- warm: a QuestionBankCache preloaded once, as async_worker.py keeps it; each
+  set only refreshes the bank with the questions created since the last one.
+
+Uses mongomock by default; pass --mongo-uri to run against a local mongod
+(a scratch database is created and dropped).
+
+    python benchmarks/bench_warm_worker.py --bank 5000 --jobs 20
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from bench_minhash import synthetic_questions  # noqa: E402
+from id_allocator import QuestionIdAllocator  # noqa: E402
+from lsh_index import LSHIndex, ensure_indexes  # noqa: E402
+from question_bank import QuestionBankCache  # noqa: E402
+from question_bank import ensure_indexes as ensure_bank_indexes  # noqa: E402
+import tfidf_minhash  # noqa: E402
+from tfidf_minhash import FindDuplicatesBatch, get_minhash  # noqa: E402
+
+METADATA = {"technology": "Benchmark", "difficulty": "easy"}
+TAGS = ["state", "hooks", "props", "effects"]
+REQUEST = SimpleNamespace(company_Id="bench", strict_question=False)
+
+
+def generated_set(texts: list, start: int) -> list:
+    return [{
+        "id": index + 1,
+        "question": f"{text} {uuid.uuid4().hex[:6]}",
+        "choices": ["a", "b", "c", "d"],
+        "correct_answer": 0,
+        "weightage": 1,
+        "tags": [TAGS[(start + index) % len(TAGS)]],
+    } for index, text in enumerate(texts)]
+
+
+def fill_bank(db, minhash, lsh, size: int):
+    allocator = QuestionIdAllocator(db, block_size=500)
+    texts = synthetic_questions(size, seed=11)
+    for start in range(0, size, 500):
+        FindDuplicatesBatch(
+            generated_set(texts[start:start + 500], start), METADATA, minhash, db, REQUEST, lsh, allocator,
+            threshold=1.01,
+        )
+    # An existing bank is older than the refresh overlap window
+    db["generated_questions"].update_many({}, {"$inc": {"created_at": -3600}})
+
+
+def run_jobs(db, minhash, lsh, jobs: int, set_size: int, warm: bool, seed: int) -> list:
+    allocator = QuestionIdAllocator(db)
+    texts = synthetic_questions(jobs * set_size, seed=seed)
+    banks = None
+    if warm:
+        banks = QuestionBankCache(db, minhash, lsh)
+        started = time.perf_counter()
+        banks.preload()
+        print(f"warm-up took {time.perf_counter() - started:.2f}s", file=sys.stderr)
+    timings = []
+    for job in range(jobs):
+        if not warm:
+            # A forked job starts with nothing in memory
+            tfidf_minhash._tfidf_models.clear()
+        questions = generated_set(texts[job * set_size:(job + 1) * set_size], job)
+        started = time.perf_counter()
+        FindDuplicatesBatch(
+            questions, METADATA, minhash, db, REQUEST, lsh, allocator,
+            bank=banks.get(METADATA) if banks is not None else None,
+        )
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def summary(timings: list) -> dict:
+    return {
+        "jobs": len(timings),
+        "mean_ms": round(statistics.mean(timings) * 1000, 1),
+        "p50_ms": round(statistics.median(timings) * 1000, 1),
+        "max_ms": round(max(timings) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bank", type=int, default=5000, help="questions already in the bank")
+    parser.add_argument("--jobs", type=int, default=20)
+    parser.add_argument("--set-size", type=int, default=10)
+    parser.add_argument("--mongo-uri")
+    args = parser.parse_args()
+
+    if args.mongo_uri:
+        from pymongo import MongoClient
+        client = MongoClient(args.mongo_uri)
+    else:
+        import mongomock
+        client = mongomock.MongoClient()
+    database = f"bench_warm_{uuid.uuid4().hex[:8]}"
+    db = client[database]
+    try:
+        minhash = get_minhash(num_permutations=100)
+        lsh = LSHIndex(engine=minhash.name)
+        ensure_indexes(db)
+        ensure_bank_indexes(db)
+        fill_bank(db, minhash, lsh, args.bank)
+        # Silence the per-question prints of the dedup path while timing
+        stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+        try:
+            cold = run_jobs(db, minhash, lsh, args.jobs, args.set_size, warm=False, seed=21)
+            tfidf_minhash._tfidf_models.clear()
+            warm = run_jobs(db, minhash, lsh, args.jobs, args.set_size, warm=True, seed=31)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        print(json.dumps({
+            "bank": args.bank,
+            "set_size": args.set_size,
+            "cold": summary(cold),
+            "warm": summary(warm),
+        }, indent=2))
+    finally:
+        client.drop_database(database)
+
+
+if __name__ == "__main__":
+    main()
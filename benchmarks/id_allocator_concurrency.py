@@ -0,0 +1,94 @@
+"""
+Concurrency check for QuestionIdAllocator.
+
+Runs many parallel inserters, each with its own allocator (as separate workers
+would have), against a Mongo stand-in with the unique index on question.id
+and verifies no question id was handed out twice and that the index rejects a
+duplicate. Uses an in-memory mongomock database by default; pass --mongo-uri
+to run against a local mongod, where each inserter is a separate process.
+
+    python benchmarks/id_allocator_concurrency.py --inserters 16 --questions 500
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from pymongo.errors import DuplicateKeyError  # noqa: E402
+
+from id_allocator import QuestionIdAllocator, ensure_unique_question_ids  # noqa: E402
+
+
+def run_inserter(db, questions: int, block_size: int, batch: int) -> int:
+    allocator = QuestionIdAllocator(db, block_size=block_size)
+    inserted = 0
+    while inserted < questions:
+        count = min(batch, questions - inserted)
+        db["generated_questions"].insert_many([
+            {"question": {"id": question_id, "question": f"q{question_id}"}}
+            for question_id in allocator.allocate(count)
+        ])
+        inserted += count
+    return inserted
+
+
+def run_process_inserter(mongo_uri: str, database: str, questions: int, block_size: int, batch: int) -> int:
+    from pymongo import MongoClient
+    return run_inserter(MongoClient(mongo_uri)[database], questions, block_size, batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--inserters", type=int, default=16)
+    parser.add_argument("--questions", type=int, default=500, help="questions per inserter")
+    parser.add_argument("--block-size", type=int, default=50)
+    parser.add_argument("--batch", type=int, default=10, help="questions per insert_many, like one mcq_set")
+    parser.add_argument("--mongo-uri", help="local mongod to use instead of mongomock")
+    parser.add_argument("--database", default="id_allocator_check")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.mongo_uri:
+        from pymongo import MongoClient
+        db = MongoClient(args.mongo_uri)[args.database]
+        db["generated_questions"].drop()
+        db["counters"].drop()
+        ensure_unique_question_ids(db)
+        with ProcessPoolExecutor(args.inserters) as pool:
+            futures = [
+                pool.submit(run_process_inserter, args.mongo_uri, args.database, args.questions, args.block_size, args.batch)
+                for _ in range(args.inserters)
+            ]
+            total = sum(future.result() for future in futures)
+    else:
+        import mongomock
+        db = mongomock.MongoClient()[args.database]
+        ensure_unique_question_ids(db)
+        with ThreadPoolExecutor(args.inserters) as pool:
+            futures = [
+                pool.submit(run_inserter, db, args.questions, args.block_size, args.batch)
+                for _ in range(args.inserters)
+            ]
+            total = sum(future.result() for future in futures)
+    elapsed = time.perf_counter() - start
+
+    ids = [doc["question"]["id"] for doc in db["generated_questions"].find({}, {"question.id": 1})]
+    collisions = len(ids) - len(set(ids))
+    print(f"{args.inserters} inserters stored {total} questions in {elapsed:.2f}s, "
+          f"{len(set(ids))} distinct ids, {collisions} collisions")
+    if collisions or len(ids) != total:
+        raise SystemExit(1)
+    try:
+        db["generated_questions"].insert_one({"question": {"id": ids[0], "question": "duplicate"}})
+    except DuplicateKeyError:
+        print("unique index on question.id rejected a duplicate id")
+    else:
+        print("a duplicate question id was stored; the unique index is missing")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Redis bytes per job: the old two-key layout versus the job:<id> hash.
+
+Builds a /get_questions payload of N questions shaped like 1731318394.json,
+stores it both ways and reports the bytes each layout keeps per job. Against a
+real Redis (--redis-url) the numbers come from MEMORY USAGE, which includes
+key and encoding overhead; without one they are the raw key and value sizes.
+
+    python benchmarks/job_state_sizing.py --questions 10
+    python benchmarks/job_state_sizing.py --redis-url redis://:root@localhost:6379/15
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+import job_store  # noqa: E402
+
+SAMPLE_FILE = os.path.join(os.path.dirname(__file__), "..", "1731318394.json")
+
+
+def _shuffled(text: str, rng: random.Random) -> str:
+    words = text.split()
+    rng.shuffle(words)
+    return " ".join(words)
+
+
+def sample_result(count: int, seed: int = 5) -> dict:
+    with open(SAMPLE_FILE) as f:
+        sample = json.load(f)["mcq_set"]
+    rng = random.Random(seed)
+    questions = []
+    for index in range(count):
+        question = dict(sample["questions"][index % len(sample["questions"])])
+        # Reword the sample so repeated questions do not flatter the compression ratio
+        question.update(
+            id=100000 + index,
+            type="objective",
+            question=_shuffled(question["question"], rng),
+            choices=[_shuffled(choice, rng) for choice in question["choices"]],
+        )
+        questions.append(question)
+    return {
+        "status": "success",
+        "technology": sample["technology"],
+        "difficulty": sample["difficulty"],
+        "total_questions": len(questions),
+        "questions": questions,
+    }
+
+
+def raw_sizes(result: dict, job_id: str) -> dict:
+    old = len(f"{job_id}:status") + len("completed") + len(job_id) + len(json.dumps(result))
+    fields = {
+        "status": "completed", "created_at": 1731318394, "started_at": 1731318394, "finished_at": 1731318394,
+        "updated_at": 1731318394, "requested": result["total_questions"], "accepted": result["total_questions"],
+        "attempts": 1, "selected": job_store.compress([]), "result": job_store.compress(result),
+    }
+    new = len(job_store.JOB_PREFIX + job_id) + sum(
+        len(field) + len(value if isinstance(value, bytes) else str(value)) for field, value in fields.items()
+    )
+    return {"old_bytes": old, "new_bytes": new}
+
+
+def measured_sizes(redis_conn, result: dict, job_id: str) -> dict:
+    redis_conn.set(f"{job_id}:status", "completed")
+    redis_conn.set(job_id, json.dumps(result))
+    job_store.create_job(redis_conn, job_id, "queued", result["total_questions"], [])
+    job_store.set_status(redis_conn, job_id, "in-progress")
+    job_store.complete_job(redis_conn, job_id, result, attempts=1)
+    try:
+        old = redis_conn.memory_usage(f"{job_id}:status") + redis_conn.memory_usage(job_id)
+        new = redis_conn.memory_usage(job_store.JOB_PREFIX + job_id)
+        ttl = redis_conn.ttl(job_store.JOB_PREFIX + job_id)
+    finally:
+        redis_conn.delete(f"{job_id}:status", job_id, job_store.JOB_PREFIX + job_id)
+    return {"old_bytes": old, "new_bytes": new, "new_ttl_s": ttl}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, nargs="+", default=[5, 10, 50])
+    parser.add_argument("--redis-url")
+    args = parser.parse_args()
+
+    redis_conn = None
+    if args.redis_url:
+        import redis
+        redis_conn = redis.Redis.from_url(args.redis_url)
+
+    report = []
+    for count in args.questions:
+        result = sample_result(count)
+        job_id = str(uuid.uuid4())
+        sizes = measured_sizes(redis_conn, result, job_id) if redis_conn else raw_sizes(result, job_id)
+        sizes["questions"] = count
+        sizes["ratio"] = round(sizes["new_bytes"] / sizes["old_bytes"], 3)
+        report.append(sizes)
+    print(json.dumps({"source": "MEMORY USAGE" if redis_conn else "raw sizes", "jobs": report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+"""
+End-to-end load harness for the API + RQ + worker pipeline.
+
+Replays a mix of /generate_ai_question, /get_questions and /store_question
+calls at a target request rate (open loop, Poisson arrivals) against a stack
+whose worker talks to benchmarks/openai_stub.py instead of OpenAI. Every
+generate call is followed by one long-polling /get_questions per job, which
+gives the end-to-end job latency; those waits are kept out of the API
+latency figures. The get and store calls of the mix poll random jobs of the
+run and mark the questions of finished jobs as used, as clients do.
+
+For each --rps step it reports API p50/p99 per endpoint, job latency
+percentiles (overall, and per lane the request lands in going by its size),
+jobs completed versus submitted, and queue depth over time (scheduler lane
+lengths with --redis-url, otherwise jobs in flight as seen by the harness). With several steps, the saturation point is the first step whose
+completed/submitted ratio falls under --min-completion, whose API p99
+passes --slo-ms, or whose queue keeps growing.
+
+The schedule comes from --seed, so runs are repeatable; --save-trace writes
+it as JSONL and --trace replays a saved one.
+
+Everything runs on one box, with docker-compose:
+
+    docker compose -f docker-compose.yml -f docker-compose.loadtest.yml up -d --build
+    python benchmarks/load_harness.py --api-key $API_KEY --mongo-uri mongodb://localhost:27017 \\
+        --redis-url redis://:root@localhost:6379/0 --rps 1 2 4 8 16 --step-duration 60
+
+or with local processes (stub, uvicorn main:app and async_worker.py started
+with OPENAI_BASE_URL=http://localhost:8100/v1).
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+
+from bench_common import percentile
+
+DEFAULT_CONCEPTS = {
+    "React": ["state", "hooks", "props", "effects", "context"],
+    "Golang": ["goroutines", "channels", "interfaces", "slices", "maps"],
+    "Python": ["generators", "decorators", "asyncio", "dataclasses", "typing"],
+}
+DIFFICULTIES = ["easy", "medium", "hard"]
+QUESTION_COUNTS = [3, 5, 5, 10, 10]
+STRICT_SHARE = 0.1
+LONG_POLL_WAIT = 30
+
+
+def build_schedule(args) -> list:
+    """Calls of every step as {"step", "rps", "t", "call", "body"}; t is seconds into the step."""
+    rng = random.Random(args.seed)
+    mix = {"generate": args.mix[0], "get": args.mix[1], "store": args.mix[2]}
+    technologies = args.technologies or list(DEFAULT_CONCEPTS)
+    events = []
+    for step, rps in enumerate(args.rps):
+        t = rng.expovariate(rps)
+        while t < args.step_duration:
+            call = rng.choices(list(mix), weights=list(mix.values()))[0]
+            event = {"step": step, "rps": rps, "t": round(t, 4), "call": call}
+            if call == "generate":
+                technology = rng.choice(technologies)
+                concepts = DEFAULT_CONCEPTS.get(technology, ["general"])
+                event["body"] = {
+                    "technology_name": technology,
+                    "concepts": rng.sample(concepts, rng.randint(1, min(3, len(concepts)))),
+                    "difficulty_level": rng.choice(DIFFICULTIES),
+                    "number_of_questions": rng.choice(QUESTION_COUNTS),
+                    "company_Id": f"load-{rng.randrange(args.companies)}",
+                    "strict_question": rng.random() < STRICT_SHARE,
+                }
+            events.append(event)
+            t += rng.expovariate(rps)
+    return events
+
+
+def load_trace(path: str) -> list:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def seed_assistants(mongo_uri: str, redis_url: str, technologies: list, backend: str):
+    """Make sure every technology of the run has an assistant; the stub accepts any assistant id."""
+    from pymongo import MongoClient
+
+    db = MongoClient(mongo_uri)["hyreV3"]
+    for technology in technologies:
+        db["ai_assistants"].update_one(
+            {"technology": technology},
+            {"$setOnInsert": {"technology": technology, "assistant_id": f"asst_load_{technology.lower()}",
+                              "backend": backend}},
+            upsert=True,
+        )
+    if redis_url:
+        import redis
+        # assistant_registry.INVALIDATION_CHANNEL
+        redis.Redis.from_url(redis_url).publish("ai_assistants:invalidate", "reload")
+
+
+class Harness:
+    def __init__(self, client: httpx.AsyncClient, redis_url: str = None):
+        self.client = client
+        self.redis = None
+        if redis_url:
+            import redis.asyncio
+            self.redis = redis.asyncio.Redis.from_url(redis_url)
+        self.started = None
+        self.api = defaultdict(list)     # (step, call) -> latencies in ms
+        self.errors = defaultdict(int)   # (step, call) -> failed calls
+        self.jobs = {}                   # job_id -> {"step", "submitted", "finished", "status"}
+        self.finished_jobs = []          # (job_id, company, question ids) of completed jobs
+        self.depth = []                  # (seconds, queued, in flight)
+        self.trackers = set()
+
+    def now(self) -> float:
+        return time.perf_counter() - self.started
+
+    async def _call(self, step: int, call: str, path: str, body: dict):
+        started = time.perf_counter()
+        try:
+            response = await self.client.post(path, json=body)
+        except httpx.HTTPError:
+            self.errors[(step, call)] += 1
+            return None
+        self.api[(step, call)].append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 500:
+            self.errors[(step, call)] += 1
+        return response
+
+    async def generate(self, step: int, body: dict):
+        submitted = self.now()
+        response = await self._call(step, "generate", "/generate_ai_question", body)
+        if response is None or response.status_code != 200:
+            return
+        payload = response.json()
+        job = self.jobs[payload["job_id"]] = {
+            "step": step, "submitted": submitted, "finished": None, "status": None,
+            "questions": body["number_of_questions"],
+        }
+        if payload.get("status") == "success":
+            # Served from the pool without a job
+            job.update(finished=self.now(), status="pool")
+            self._finished(payload["job_id"], body["company_Id"], payload["data"])
+            return
+        task = asyncio.create_task(self.track(payload["job_id"], body["company_Id"]))
+        self.trackers.add(task)
+        task.add_done_callback(self.trackers.discard)
+
+    async def track(self, job_id: str, company: str):
+        job = self.jobs[job_id]
+        while True:
+            try:
+                response = await self.client.post(
+                    "/get_questions", json={"job_Id": job_id, "wait": LONG_POLL_WAIT}, timeout=LONG_POLL_WAIT + 30
+                )
+                payload = response.json()
+            except (httpx.HTTPError, ValueError):
+                await asyncio.sleep(1)
+                continue
+            if payload.get("status") in ("completed", "failed"):
+                job.update(finished=self.now(), status=payload["status"])
+                if payload["status"] == "completed":
+                    self._finished(job_id, company, payload["data"])
+                return
+
+    def _finished(self, job_id: str, company: str, data: dict):
+        ids = [question["id"] for question in data.get("questions", []) if "id" in question]
+        if ids:
+            self.finished_jobs.append((job_id, company, ids))
+
+    async def get(self, step: int, rng: random.Random):
+        if not self.jobs:
+            return
+        job_id = rng.choice(list(self.jobs))
+        await self._call(step, "get", "/get_questions", {"job_Id": job_id})
+
+    async def store(self, step: int, rng: random.Random):
+        if not self.finished_jobs:
+            return
+        _, company, ids = rng.choice(self.finished_jobs)
+        await self._call(step, "store", "/store_question", {"questions": ids, "company_Id": company})
+
+    def in_flight(self) -> int:
+        return sum(1 for job in self.jobs.values() if job["finished"] is None)
+
+    async def sample_depth(self, lanes: list):
+        while True:
+            queued = None
+            if self.redis is not None:
+                try:
+                    pipe = self.redis.pipeline(transaction=False)
+                    for lane in lanes:
+                        pipe.zcard(f"sched:{lane}")
+                    queued = sum(await pipe.execute())
+                except Exception:
+                    queued = None
+            self.depth.append((round(self.now(), 1), queued, self.in_flight()))
+            await asyncio.sleep(1)
+
+    async def run(self, schedule: list, step_duration: float, drain: float, lanes: list, seed: int):
+        rng = random.Random(seed + 1)
+        self.started = time.perf_counter()
+        sampler = asyncio.create_task(self.sample_depth(lanes))
+        pending = set()
+        for event in schedule:
+            due = event["step"] * step_duration + event["t"]
+            delay = due - self.now()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if event["call"] == "generate":
+                task = asyncio.create_task(self.generate(event["step"], event["body"]))
+            elif event["call"] == "get":
+                task = asyncio.create_task(self.get(event["step"], rng))
+            else:
+                task = asyncio.create_task(self.store(event["step"], rng))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        steps = max((event["step"] for event in schedule), default=-1) + 1
+        remaining = steps * step_duration - self.now()
+        if remaining > 0:
+            await asyncio.sleep(remaining)
+        if pending:
+            await asyncio.wait(pending, timeout=drain)
+        deadline = self.now() + drain
+        while self.trackers and self.now() < deadline:
+            await asyncio.sleep(0.5)
+        for task in list(self.trackers):
+            task.cancel()
+        sampler.cancel()
+
+
+def step_report(harness: Harness, step: int, rps: float, step_duration: float, args) -> dict:
+    begin, end = step * step_duration, (step + 1) * step_duration
+    jobs = [job for job in harness.jobs.values() if job["step"] == step]
+    finished = [job for job in jobs if job["finished"] is not None]
+    latencies = [job["finished"] - job["submitted"] for job in finished if job["status"] in ("completed", "pool")]
+    lane_latencies = {"interactive": [], "bulk": []}
+    for job in finished:
+        if job["status"] == "completed":
+            lane = "bulk" if job.get("questions", 0) >= args.bulk_min_questions else "interactive"
+            lane_latencies[lane].append(job["finished"] - job["submitted"])
+    completed_in_step = sum(
+        1 for job in harness.jobs.values() if job["finished"] is not None and begin <= job["finished"] < end
+    )
+    depth = [(at, queued, in_flight) for at, queued, in_flight in harness.depth if begin <= at < end]
+    depth_values = [queued if queued is not None else in_flight for _, queued, in_flight in depth]
+    calls = sum(len(harness.api[(step, call)]) for call in ("generate", "get", "store"))
+    api = {}
+    for call in ("generate", "get", "store"):
+        values = harness.api[(step, call)]
+        api[call] = {
+            "requests": len(values),
+            "errors": harness.errors[(step, call)],
+            "p50_ms": percentile(values, 50),
+            "p99_ms": percentile(values, 99),
+        }
+    report = {
+        "step": step,
+        "offered_rps": rps,
+        "achieved_rps": round(calls / step_duration, 2),
+        "api": api,
+        "jobs": {
+            "submitted": len(jobs),
+            "from_pool": sum(1 for job in jobs if job["status"] == "pool"),
+            "completed": sum(1 for job in jobs if job["status"] == "completed"),
+            "failed": sum(1 for job in jobs if job["status"] == "failed"),
+            "unfinished": len(jobs) - len(finished),
+            "completed_per_s": round(completed_in_step / step_duration, 2),
+            "latency_s": {
+                "p50": percentile(latencies, 50),
+                "p90": percentile(latencies, 90),
+                "p99": percentile(latencies, 99),
+                "mean": round(statistics.mean(latencies), 2) if latencies else None,
+            },
+            "latency_by_lane_s": {
+                lane: {"jobs": len(values), "p50": percentile(values, 50), "p99": percentile(values, 99)}
+                for lane, values in lane_latencies.items()
+            },
+        },
+        "queue_depth": {
+            "source": "lanes" if any(queued is not None for _, queued, _ in depth) else "in_flight",
+            "start": depth_values[0] if depth_values else None,
+            "end": depth_values[-1] if depth_values else None,
+            "max": max(depth_values) if depth_values else None,
+        },
+    }
+    submitted_in_step = len(jobs)
+    ratio = completed_in_step / submitted_in_step if submitted_in_step else 1.0
+    worst_p99 = max((values["p99_ms"] or 0) for values in api.values())
+    growing = bool(depth_values) and depth_values[-1] > max(5, 2 * depth_values[0])
+    report["saturated"] = ratio < args.min_completion or worst_p99 > args.slo_ms or growing
+    report["completion_ratio"] = round(ratio, 3)
+    return report
+
+
+async def main(args):
+    schedule = load_trace(args.trace) if args.trace else build_schedule(args)
+    if args.save_trace:
+        with open(args.save_trace, "w") as f:
+            for event in schedule:
+                f.write(json.dumps(event) + "\n")
+    steps = {}
+    for event in schedule:
+        steps.setdefault(event["step"], event["rps"])
+    if args.mongo_uri:
+        technologies = sorted({event["body"]["technology_name"] for event in schedule if event["call"] == "generate"})
+        seed_assistants(args.mongo_uri, args.redis_url, technologies, args.backend)
+
+    headers = {"Authorization": f"Bearer {args.api_key}"}
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    async with httpx.AsyncClient(base_url=args.url, headers=headers, timeout=60, limits=limits) as client:
+        harness = Harness(client, args.redis_url)
+        print(f"replaying {len(schedule)} calls over {len(steps)} step(s)", file=sys.stderr)
+        await harness.run(schedule, args.step_duration, args.drain, args.lanes, args.seed)
+
+    reports = [step_report(harness, step, rps, args.step_duration, args) for step, rps in sorted(steps.items())]
+    saturation = next((report["offered_rps"] for report in reports if report["saturated"]), None)
+    print(json.dumps({
+        "url": args.url,
+        "step_duration_s": args.step_duration,
+        "mix": {"generate": args.mix[0], "get": args.mix[1], "store": args.mix[2]},
+        "saturation_rps": saturation,
+        "steps": reports,
+        "queue_depth_timeline": harness.depth if args.timeline else None,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--api-key", required=True)
+    parser.add_argument("--rps", type=float, nargs="+", default=[1, 2, 4, 8], help="request rate of each step")
+    parser.add_argument("--step-duration", type=float, default=60, help="seconds per step")
+    parser.add_argument("--mix", type=float, nargs=3, default=[0.2, 0.7, 0.1], metavar=("GENERATE", "GET", "STORE"),
+                        help="weights of the three calls")
+    parser.add_argument("--technologies", nargs="+", help=f"default: {', '.join(DEFAULT_CONCEPTS)}")
+    parser.add_argument("--companies", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--trace", help="replay this JSONL schedule instead of generating one")
+    parser.add_argument("--save-trace", help="write the schedule to this JSONL file")
+    parser.add_argument("--drain", type=float, default=60, help="seconds to wait for jobs after the last step")
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--lanes", nargs="+", default=["interactive", "bulk", "refill"])
+    parser.add_argument("--redis-url", help="sample scheduler lane lengths from this Redis")
+    parser.add_argument("--bulk-min-questions", type=int, default=8,
+                        help="the API's BULK_MIN_QUESTIONS, to split job latency by lane")
+    parser.add_argument("--mongo-uri", help="create an assistant for each technology of the run first")
+    parser.add_argument("--backend", default="completions", help="backend of the assistants created by --mongo-uri")
+    parser.add_argument("--slo-ms", type=float, default=1000, help="API p99 above which a step counts as saturated")
+    parser.add_argument("--min-completion", type=float, default=0.8,
+                        help="completed/submitted jobs ratio under which a step counts as saturated")
+    parser.add_argument("--timeline", action="store_true", help="include the per-second queue depth samples")
+    asyncio.run(main(parser.parse_args()))
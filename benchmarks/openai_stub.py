@@ -0,0 +1,236 @@
+"""
+Local stand-in for the OpenAI endpoints used by the worker.
+
+Serves chat completions with a forced `format_mcqs` tool call, and the
+Assistants thread/message/run/submit_tool_outputs cycle, answering with
+synthetic questions shaped like 1731318394.json after a configurable latency.
+Point the worker at it with OPENAI_BASE_URL=http://localhost:8100/v1.
+
+--duplicate-rate makes that fraction of returned questions repeat one it
+returned earlier for the same technology and difficulty, so the dedup path
+and the retry loop get exercised. --failure-rate fails that fraction of
+generations: chat completions answer 500 (which the client retries) and
+Assistants runs end "failed". --per-question adds that many seconds per
+question asked for, as output tokens do to a real generation.
+
+    python benchmarks/openai_stub.py --port 8100 --latency 2.0
+    python benchmarks/openai_stub.py --latency 3 --jitter 1 --duplicate-rate 0.2 --failure-rate 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import time
+import uuid
+from collections import defaultdict, deque
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+SAMPLE_FILE = os.path.join(os.path.dirname(__file__), "..", "1731318394.json")
+
+config = {"latency": 2.0, "jitter": 0.0, "per_question": 0.0, "duplicate_rate": 0.0, "failure_rate": 0.0}
+threads = {}
+runs = {}
+# (technology, difficulty) -> questions returned recently, for --duplicate-rate
+returned = defaultdict(lambda: deque(maxlen=500))
+
+app = FastAPI()
+
+
+def _vocabulary() -> list:
+    with open(SAMPLE_FILE) as f:
+        sample = json.load(f)
+    return sorted({
+        word.strip("?,.").lower()
+        for question in sample["mcq_set"]["questions"]
+        for text in [question["question"], *question["choices"]]
+        for word in text.split()
+    })
+
+
+VOCABULARY = _vocabulary()
+
+
+def _latency(prompt: str = "") -> float:
+    latency = config["latency"] + random.uniform(-config["jitter"], config["jitter"])
+    if config["per_question"]:
+        latency += config["per_question"] * _parse_prompt(prompt)["count"]
+    return max(0.0, latency)
+
+
+def _parse_prompt(prompt: str) -> dict:
+    count = re.search(r"(?:Generate|need)\s+(\d+)", prompt)
+    difficulty = re.search(r"\d+\s+(?:new\s+)?(\w+)\s+multiple-choice", prompt)
+    technology = re.search(r"(?:on the|about)\s+(.+?)\s+Technology", prompt)
+    concepts = re.search(r"concepts:\s*([^.\n]+)", prompt)
+    return {
+        "count": int(count.group(1)) if count else 5,
+        "difficulty": difficulty.group(1) if difficulty else "easy",
+        "technology": technology.group(1) if technology else "Unknown",
+        "concepts": [c.strip() for c in concepts.group(1).split(",")] if concepts else ["general"],
+    }
+
+
+def make_question(concepts: list, index: int) -> dict:
+    words = random.sample(VOCABULARY, min(len(VOCABULARY), random.randint(8, 14)))
+    return {
+        "id": index,
+        "question": "Which " + " ".join(words) + f" {uuid.uuid4().hex[:6]}?",
+        "choices": [" ".join(random.sample(VOCABULARY, 3)) for _ in range(4)],
+        "correct_answer": random.randint(0, 3),
+        "weightage": 1,
+        "tags": [random.choice(concepts)],
+    }
+
+
+def make_mcq_set(prompt: str) -> dict:
+    parsed = _parse_prompt(prompt)
+    history = returned[(parsed["technology"], parsed["difficulty"])]
+    questions = []
+    for i in range(parsed["count"]):
+        if history and random.random() < config["duplicate_rate"]:
+            question = dict(random.choice(history), id=i + 1)
+        else:
+            question = make_question(parsed["concepts"], i + 1)
+            history.append(question)
+        questions.append(question)
+    return {"mcq_set": {
+        "technology": parsed["technology"],
+        "concepts": parsed["concepts"],
+        "difficulty": parsed["difficulty"],
+        "total_questions": parsed["count"],
+        "questions": questions,
+    }}
+
+
+def _fails() -> bool:
+    return random.random() < config["failure_rate"]
+
+
+def _usage(prompt: str, arguments: str) -> dict:
+    prompt_tokens, completion_tokens = len(prompt) // 4, len(arguments) // 4
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    prompt = next(m["content"] for m in reversed(body["messages"]) if m["role"] == "user")
+    await asyncio.sleep(_latency(prompt))
+    if _fails():
+        return JSONResponse(status_code=500, content={"error": {
+            "message": "The server had an error while processing your request.", "type": "server_error",
+        }})
+    arguments = json.dumps(make_mcq_set(prompt))
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "finish_reason": "tool_calls",
+            "message": {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{
+                    "id": f"call_{uuid.uuid4().hex[:12]}",
+                    "type": "function",
+                    "function": {"name": "format_mcqs", "arguments": arguments},
+                }],
+            },
+        }],
+        "usage": _usage(prompt, arguments),
+    }
+
+
+@app.post("/v1/threads")
+async def create_thread():
+    thread_id = f"thread_{uuid.uuid4().hex}"
+    threads[thread_id] = []
+    return {"id": thread_id, "object": "thread", "created_at": int(time.time()), "metadata": {}}
+
+
+@app.post("/v1/threads/{thread_id}/messages")
+async def create_message(thread_id: str, request: Request):
+    body = await request.json()
+    threads.setdefault(thread_id, []).append(body["content"])
+    return {"id": f"msg_{uuid.uuid4().hex}", "object": "thread.message", "thread_id": thread_id,
+            "role": "user", "content": [], "created_at": int(time.time())}
+
+
+def _run_object(run: dict) -> dict:
+    obj = {"id": run["id"], "object": "thread.run", "thread_id": run["thread_id"],
+           "assistant_id": run["assistant_id"], "status": run["status"], "created_at": int(run["created"]),
+           "required_action": None, "usage": None}
+    if run["status"] == "requires_action":
+        obj["required_action"] = {"type": "submit_tool_outputs", "submit_tool_outputs": {"tool_calls": [{
+            "id": run["tool_call_id"], "type": "function",
+            "function": {"name": "format_mcqs", "arguments": run["arguments"]},
+        }]}}
+    if run["status"] == "completed":
+        obj["usage"] = run["usage"]
+    if run["status"] == "failed":
+        obj["last_error"] = {"code": "server_error", "message": "Sorry, something went wrong."}
+    return obj
+
+
+@app.post("/v1/threads/{thread_id}/runs")
+async def create_run(thread_id: str, request: Request):
+    body = await request.json()
+    run_id = f"run_{uuid.uuid4().hex}"
+    prompt = threads.get(thread_id, [""])[-1]
+    runs[run_id] = {"id": run_id, "thread_id": thread_id, "assistant_id": body.get("assistant_id"),
+                    "status": "queued", "created": time.time(), "ready_at": time.time() + _latency(prompt),
+                    "prompt": prompt}
+    return _run_object(runs[run_id])
+
+
+@app.get("/v1/threads/{thread_id}/runs/{run_id}")
+async def retrieve_run(thread_id: str, run_id: str):
+    run = runs[run_id]
+    if run["status"] in ("queued", "in_progress"):
+        if time.time() >= run["ready_at"] and _fails():
+            run["status"] = "failed"
+        elif time.time() >= run["ready_at"]:
+            run["arguments"] = json.dumps(make_mcq_set(run["prompt"]))
+            run["tool_call_id"] = f"call_{uuid.uuid4().hex[:12]}"
+            run["status"] = "requires_action"
+        else:
+            run["status"] = "in_progress"
+    return _run_object(run)
+
+
+@app.post("/v1/threads/{thread_id}/runs/{run_id}/submit_tool_outputs")
+async def submit_tool_outputs(thread_id: str, run_id: str):
+    run = runs[run_id]
+    run["status"] = "completed"
+    run["usage"] = _usage(run["prompt"], run["arguments"])
+    return _run_object(run)
+
+
+@app.delete("/v1/threads/{thread_id}")
+async def delete_thread(thread_id: str):
+    threads.pop(thread_id, None)
+    return {"id": thread_id, "object": "thread.deleted", "deleted": True}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=2.0, help="seconds until a generation is ready")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds added to the latency")
+    parser.add_argument("--per-question", type=float, default=0.0, help="seconds added per question asked for")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0, help="fraction of questions repeating earlier ones")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of generations that fail")
+    args = parser.parse_args()
+    config.update(latency=args.latency, jitter=args.jitter, per_question=args.per_question,
+                  duplicate_rate=args.duplicate_rate, failure_rate=args.failure_rate)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")